@@ -1,50 +1,47 @@
 import os
 import re
-from flask import Flask, render_template, request, flash, redirect, url_for
+import logging
+from flask import Flask, Response, jsonify, render_template, request, flash, redirect, url_for
 from dotenv import load_dotenv
-from functools import lru_cache
-from hashlib import md5
 
 # Import blueprints
-from blueprints import facebook_bp, twitter_bp, instagram_bp, tiktok_bp
-from blueprints.facebook import get_post_metrics as get_facebook_post_metrics, extract_post_id as extract_facebook_post_id
+from blueprints import facebook_bp, twitter_bp, instagram_bp, tiktok_bp, jobs_bp, history_bp
+from blueprints.facebook import get_post_metrics as get_facebook_post_metrics, extract_post_id as extract_facebook_post_id, clean_facebook_url
 from blueprints.instagram import scrape_instagram_post
 from blueprints.twitter import scrape_tweet
 from blueprints.tiktok import scrape_tiktok_post
+from services.cache import cached_scrape
+from services.history import start_scheduler as start_history_scheduler
+from services.jobs import start_workers as start_job_workers
+from services.metrics import configure_logging, render_metrics
+from services.resilience import circuit_states
+from services.scraper_workers import worker_states
 
 load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "supersecretkey")
 
-# Simple in-memory cache for scraped results (prevents re-scraping same URLs)
-_scrape_cache = {}
-
-def get_cached_scrape(url, scraper_func):
-    """Cache scraper results to avoid re-scraping the same URL."""
-    cache_key = md5(url.encode()).hexdigest()
-    if cache_key in _scrape_cache:
-        return _scrape_cache[cache_key]
-    
-    result = scraper_func(url)
-    if result and "error" not in result:
-        _scrape_cache[cache_key] = result
-        # Limit cache size to 100 entries
-        if len(_scrape_cache) > 100:
-            _scrape_cache.pop(next(iter(_scrape_cache)))
-    return result
+# Scrape results are cached on disk and shared by every worker (see services/cache.py)
+def get_cached_scrape(url, scraper_func, platform):
+    """Serve scraper results from the shared on-disk cache to avoid re-scraping the same URL."""
+    return cached_scrape(url, scraper_func, platform)
 
 # Register blueprints
 app.register_blueprint(facebook_bp)
 app.register_blueprint(twitter_bp)
 app.register_blueprint(instagram_bp)
 app.register_blueprint(tiktok_bp)
+app.register_blueprint(jobs_bp)
+app.register_blueprint(history_bp)
 
+# Background runners for upload jobs (one set per worker process)
+start_job_workers()
 
-# Helper function for Facebook URL cleanup
-def clean_facebook_url(url):
-    """Remove query parameters and mobile or tracking parts of a facebook link to normalize it."""
-    return url.split('?')[0].replace('m.facebook.com', 'facebook.com')
+# Scheduled re-scrape of posts with old snapshots (HISTORY_REFRESH_INTERVAL, one worker per run)
+start_history_scheduler()
 
 
 # --- Main Routes ---
@@ -53,6 +50,25 @@ def home():
     return render_template("index.html")
 
 
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
+@app.route("/status/circuits")
+def circuits_endpoint():
+    """Circuit breaker state per platform for this worker process."""
+    return jsonify({"pid": os.getpid(), "circuits": circuit_states()})
+
+
+@app.route("/status/scrapers")
+def scrapers_endpoint():
+    """Scraper worker processes (SCRAPER_WORKERS): heartbeat, scrapes run and memory per process."""
+    return jsonify(worker_states())
+
+
 @app.route("/analyze_link", methods=["POST"])
 def analyze_link():
     link = request.form.get("link")
@@ -69,7 +85,7 @@ def analyze_link():
     if "twitter.com" in link or "x.com" in link:
         platform = "Twitter"
         try:
-            metrics = get_cached_scrape(link, scrape_tweet)
+            metrics = get_cached_scrape(link, scrape_tweet, "twitter")
         except Exception as e:
             flash("Twitter scraper not available: ensure Playwright is installed.", "error")
             return redirect(url_for("home"))
@@ -82,13 +98,13 @@ def analyze_link():
         if not post_id:
             flash("Could not extract Facebook Post ID from the link.", "error")
             return redirect(url_for("home"))
-        metrics = get_facebook_post_metrics(post_id)
+        metrics = get_cached_scrape(post_id, get_facebook_post_metrics, "facebook")
 
     # ---- INSTAGRAM ----
     elif "instagram.com" in link:
         platform = "Instagram"
         try:
-            metrics = get_cached_scrape(link, scrape_instagram_post)
+            metrics = get_cached_scrape(link, scrape_instagram_post, "instagram")
         except Exception:
             flash("Instagram scraper not available: ensure Playwright is installed.", "error")
             return redirect(url_for("home"))
@@ -97,7 +113,7 @@ def analyze_link():
     elif "tiktok.com" in link or "vm.tiktok.com" in link:
         platform = "TikTok"
         try:
-            metrics = get_cached_scrape(link, scrape_tiktok_post)
+            metrics = get_cached_scrape(link, scrape_tiktok_post, "tiktok")
         except Exception:
             flash("TikTok scraper not available: ensure Playwright is installed.", "error")
             return redirect(url_for("home"))
@@ -111,9 +127,7 @@ def analyze_link():
         flash(f"API Error: {metrics.get('error', 'Unknown error')}", "error")
         return redirect(url_for("home"))
 
-    print("Platform:", platform)
-    print("Post ID:", post_id)
-    print("Metrics:", metrics)
+    logger.info("analyzed link platform=%s post_id=%s metrics=%s", platform, post_id, metrics)
 
     return render_template("results.html",
                            link=original_link,
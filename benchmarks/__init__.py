@@ -0,0 +1,3 @@
+"""
+Benchmarks package - offline scraper benchmarks against a local fixture server
+"""
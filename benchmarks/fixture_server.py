@@ -0,0 +1,146 @@
+"""
+Fixture Server - serves recorded post pages and Graph API JSON on localhost
+so the scrapers can be benchmarked without touching the live platforms
+"""
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Path prefix -> fixture file, for the HTML pages
+PAGE_FIXTURES = {
+    "/twitter/": "twitter_tweet.html",
+    "/instagram/": "instagram_post.html",
+    "/tiktok/": "tiktok_video.html",
+}
+
+GRAPH_PREFIX = "/graph"
+
+# X's GraphQL endpoints live under the page prefix, like /i/api/graphql on x.com
+TWEET_API_PREFIX = "/twitter/i/api/graphql/"
+
+
+def _load(name):
+    with open(os.path.join(FIXTURES_DIR, name), "rb") as f:
+        return f.read()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        url = urlparse(self.path)
+        with server.lock:
+            server.requests += 1
+
+        if url.path.startswith(GRAPH_PREFIX):
+            self._graph(url)
+            return
+
+        if url.path.startswith(TWEET_API_PREFIX):
+            self._tweet_api(url)
+            return
+
+        for prefix, body in server.pages.items():
+            if url.path.startswith(prefix):
+                self._send(200, "text/html; charset=utf-8", body)
+                return
+
+        self._send(404, "text/plain", b"not found")
+
+    def do_HEAD(self):
+        self._send(200, "text/html; charset=utf-8", b"")
+
+    def _graph(self, url):
+        """Answer /graph/<post_id>, /graph/<post_id>/comments and /graph/?ids=a,b,c."""
+        post = self.server.graph_post
+        parts = [p for p in url.path[len(GRAPH_PREFIX):].split("/") if p]
+        ids = parse_qs(url.query).get("ids", [""])[0]
+
+        if ids:
+            data = {post_id: dict(post, id=post_id) for post_id in ids.split(",")}
+        elif len(parts) == 2 and parts[1] == "comments":
+            data = {"data": post["comments"]["data"]}
+        elif len(parts) == 1:
+            data = dict(post, id=parts[0])
+        else:
+            self._send(404, "application/json", b'{"error": {"message": "Unknown path"}}')
+            return
+
+        self._send(200, "application/json", json.dumps(data).encode())
+
+    def _tweet_api(self, url):
+        """Answer TweetDetail with the recorded payload for the requested focalTweetId."""
+        try:
+            tweet_id = str(int(json.loads(parse_qs(url.query)["variables"][0])["focalTweetId"]))
+        except (KeyError, ValueError, TypeError):
+            self._send(400, "application/json", b'{"errors": [{"message": "Bad variables"}]}')
+            return
+        self._send(200, "application/json", self.server.tweet_detail.replace(b"__TWEET_ID__", tweet_id.encode()))
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer:
+    """
+    Threaded localhost server for the fixtures in benchmarks/fixtures.
+    Every response is delayed by latency_ms to stand in for network time.
+    """
+
+    def __init__(self, latency_ms=50, host="127.0.0.1", port=0):
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.latency = latency_ms / 1000
+        self._server.lock = threading.Lock()
+        self._server.requests = 0
+        self._server.pages = {prefix: _load(name) for prefix, name in PAGE_FIXTURES.items()}
+        self._server.graph_post = json.loads(_load("facebook_post.json"))
+        self._server.tweet_detail = _load("twitter_tweet_detail.json")
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        return self._server.requests
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fixture-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def post_links(self, platform, count):
+        """`count` distinct links (post IDs for Facebook) that resolve to the platform's fixture."""
+        if platform == "twitter":
+            return [f"{self.base_url}/twitter/bench/status/{1000 + i}" for i in range(count)]
+        if platform == "instagram":
+            return [f"{self.base_url}/instagram/p/Bench{i}/" for i in range(count)]
+        if platform == "tiktok":
+            return [f"{self.base_url}/tiktok/@bench/video/{7000 + i}" for i in range(count)]
+        if platform == "facebook":
+            return [str(100000 + i) for i in range(count)]
+        raise ValueError(f"Unknown platform: {platform}")
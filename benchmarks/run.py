@@ -0,0 +1,352 @@
+"""
+Benchmark Runner - per-scrape latency, batch throughput and peak RSS for each
+scraper at several concurrency levels, served entirely from the fixture server
+
+Usage:
+    python -m benchmarks.run
+    python -m benchmarks.run --platforms instagram,tiktok --concurrency 1,4,8 --links 60
+    python -m benchmarks.run --browser            # skip the HTTP fast path
+    python -m benchmarks.run --prewarm            # launch browsers before the first scrape
+    python -m benchmarks.run --save-baseline      # record benchmarks/baseline.json
+
+Startup is measured too: the time to import app in a fresh interpreter and
+each platform's time to first scrape.
+
+Every run is saved to benchmarks/results/ and compared with
+benchmarks/baseline.json; the exit status is 1 when a scenario regressed.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+from benchmarks.fixture_server import FixtureServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+PLATFORMS = ["twitter", "instagram", "tiktok", "facebook"]
+
+# Run in a fresh interpreter so nothing is already imported
+IMPORT_PROBE = "import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)"
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _process_tree_rss_kb(root):
+    """RSS of a process plus all its descendants (the pooled Chromium processes)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total = 0
+    stack = [root]
+    while stack:
+        pid = stack.pop()
+        total += _rss_kb(pid)
+        stack.extend(children.get(pid, []))
+    return total
+
+
+class RssSampler:
+    """Samples the RSS of this process tree in the background and keeps the peak."""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        if os.path.isdir("/proc"):
+            return _process_tree_rss_kb(os.getpid())
+        import resource
+        # ru_maxrss is KB on Linux and bytes on macOS, and only covers this process
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_kb = max(self.peak_kb, self._sample())
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.peak_kb = max(self.peak_kb, self._sample())
+        return self.peak_kb
+
+
+def _configure_environment(server, args):
+    """Point the app at the fixture server; must run before the app modules are imported."""
+    os.environ.update({
+        "FACEBOOK_GRAPH_URL": f"{server.base_url}/graph",
+        "ENABLE_SCRAPE_CACHE": "false",
+        "HTTP_FAST_PATH": "false" if args.browser else "true",
+        "BROWSER_POOL_SIZE": str(args.pool_size),
+        "APP_DATA_DIR": tempfile.mkdtemp(prefix="scraper-bench-"),
+        # The fixture server needs no protecting; a rate limit would cap the measured throughput
+        **{f"{platform.upper()}_RATE_LIMIT": "0" for platform in ("twitter", "instagram", "tiktok", "facebook")},
+    })
+
+
+def measure_import_time():
+    """Seconds a fresh worker spends importing app (blueprints, services and their dependencies)."""
+    repo_root = os.path.dirname(BENCH_DIR)
+    out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=repo_root,
+                         capture_output=True, text=True, timeout=120)
+    if out.returncode != 0:
+        return None
+    return round(float(out.stdout.strip().splitlines()[-1]), 3)
+
+
+def _scrapers():
+    from blueprints.facebook import get_post_metrics
+    from blueprints.instagram import scrape_instagram_post
+    from blueprints.tiktok import scrape_tiktok_post
+    from blueprints.twitter import scrape_tweet
+
+    return {
+        "twitter": scrape_tweet,
+        "instagram": scrape_instagram_post,
+        "tiktok": scrape_tiktok_post,
+        "facebook": get_post_metrics,
+    }
+
+
+def _failed(result):
+    return not result or "error" in result
+
+
+def run_scenario(platform, scrape_func, links, concurrency):
+    """Scrape `links` through the batch engine and measure latency, throughput and RSS."""
+    from services.batch import iter_batch
+
+    latencies = []
+    sources = {}
+
+    def timed_scrape(link):
+        started = time.perf_counter()
+        result = scrape_func(link)
+        latencies.append(time.perf_counter() - started)
+        return result
+
+    sampler = RssSampler().start()
+    started = time.perf_counter()
+    results = list(iter_batch(links, timed_scrape, platform, concurrency=concurrency, use_cache=False))
+    wall = time.perf_counter() - started
+    peak_kb = sampler.stop()
+
+    errors = [result for result in results if _failed(result)]
+    for result in results:
+        if not _failed(result):
+            source = result.get("source", "api")
+            sources[source] = sources.get(source, 0) + 1
+
+    latencies_ms = sorted(latency * 1000 for latency in latencies) or [0.0]
+    return {
+        "platform": platform,
+        "concurrency": concurrency,
+        "links": len(links),
+        "ok": len(results) - len(errors),
+        "errors": len(errors),
+        "error_sample": str((errors[0] or {}).get("error", "no result"))[:200] if errors else None,
+        "sources": sources,
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(links) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(statistics.median(latencies_ms), 1),
+            "p95": round(latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.95))], 1),
+            "max": round(latencies_ms[-1], 1),
+        },
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance, startup=None):
+    """Regression messages for scenarios (and startup) that are slower or heavier than the baseline."""
+    previous = {(r["platform"], r["concurrency"]): r for r in baseline.get("results", [])}
+    regressions = []
+
+    base_import = (baseline.get("startup") or {}).get("import_s")
+    if startup and startup["import_s"] and base_import and startup["import_s"] > base_import * (1 + tolerance):
+        regressions.append(f"startup: import {startup['import_s']}s (baseline {base_import}s)")
+    for result in results:
+        base = previous.get((result["platform"], result["concurrency"]))
+        if not base:
+            continue
+
+        label = f"{result['platform']} x{result['concurrency']}"
+        if result["errors"] > base["errors"]:
+            regressions.append(f"{label}: {result['errors']} errors (baseline {base['errors']})")
+            continue
+        if base["throughput_per_s"] and result["throughput_per_s"] < base["throughput_per_s"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {result['throughput_per_s']}/s "
+                               f"(baseline {base['throughput_per_s']}/s)")
+        if base["latency_ms"]["p95"] and result["latency_ms"]["p95"] > base["latency_ms"]["p95"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {result['latency_ms']['p95']}ms "
+                               f"(baseline {base['latency_ms']['p95']}ms)")
+        if base["peak_rss_mb"] and result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{label}: peak RSS {result['peak_rss_mb']}MB "
+                               f"(baseline {base['peak_rss_mb']}MB)")
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _print_table(results):
+    header = f"{'platform':<10} {'conc':>4} {'ok':>5} {'err':>4} {'wall s':>8} {'links/s':>8} " \
+             f"{'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8}  sources"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['platform']:<10} {r['concurrency']:>4} {r['ok']:>5} {r['errors']:>4} {r['wall_s']:>8} "
+              f"{r['throughput_per_s']:>8} {r['latency_ms']['p50']:>8} {r['latency_ms']['p95']:>8} "
+              f"{r['peak_rss_mb']:>8}  {r['sources']}")
+        if r["error_sample"]:
+            print(f"{'':<16}first error: {r['error_sample'].splitlines()[0]}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline scraper benchmarks against local fixtures.")
+    parser.add_argument("--platforms", default=",".join(PLATFORMS),
+                        help="comma separated platforms (default: all)")
+    parser.add_argument("--concurrency", default="1,2,4,8",
+                        help="comma separated concurrency levels (default: 1,2,4,8)")
+    parser.add_argument("--links", type=int, default=40, help="distinct links per scenario (default: 40)")
+    parser.add_argument("--latency-ms", type=int, default=50,
+                        help="simulated network latency per fixture response (default: 50)")
+    parser.add_argument("--pool-size", type=int, default=int(os.getenv("BROWSER_POOL_SIZE", "2")),
+                        help="pooled browsers (default: BROWSER_POOL_SIZE or 2)")
+    parser.add_argument("--browser", action="store_true", help="disable the HTTP fast path")
+    parser.add_argument("--prewarm", action="store_true",
+                        help="pre-launch the pooled browsers before the first scrape, as gunicorn's post_fork does")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown vs the baseline before flagging (default: 0.2)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Failed scrapes are summarised in the table; keep per-scrape warnings out of it
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "ERROR").upper())
+    platforms = [p.strip() for p in args.platforms.split(",") if p.strip()]
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    server = FixtureServer(latency_ms=args.latency_ms).start()
+    _configure_environment(server, args)
+    import_s = measure_import_time()
+
+    booted = time.perf_counter()
+    scrapers = _scrapers()
+    if args.prewarm:
+        from services.browser_pool import get_browser_pool
+        get_browser_pool().prewarm()
+
+    results = []
+    first_scrape = {}
+    try:
+        for i, platform in enumerate(platforms):
+            # The first scrape pays for browser launch; keep it out of the scenarios.
+            # The first platform's is timed from boot, as that is what the first user
+            # of a fresh worker waits; the others from just before their own scrape
+            started = booted if i == 0 else time.perf_counter()
+            scrapers[platform](server.post_links(platform, 1)[0])
+            first_scrape[platform] = round(time.perf_counter() - started, 3)
+
+            for concurrency in levels:
+                links = server.post_links(platform, args.links)
+                result = run_scenario(platform, scrapers[platform], links, concurrency)
+                results.append(result)
+    finally:
+        server.stop()
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "config": {
+            "links": args.links,
+            "latency_ms": args.latency_ms,
+            "pool_size": args.pool_size,
+            "http_fast_path": not args.browser,
+            "prewarm": args.prewarm,
+        },
+        "startup": {"import_s": import_s, "first_scrape_s": first_scrape},
+        "results": results,
+    }
+
+    print(f"import app: {import_s}s  first scrape: {first_scrape}\n")
+    _print_table(results)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(RESULTS_DIR, f"{stamp}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {path}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline yet; run with --save-baseline to record one.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != report["config"]:
+        print("Baseline was recorded with different settings; comparison may be misleading.")
+
+    regressions = compare(results, baseline, args.tolerance, report["startup"])
+    if regressions:
+        print("\nRegressions against baseline:")
+        for message in regressions:
+            print(f"  - {message}")
+        return 1
+
+    print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,5 +5,7 @@ from .facebook import facebook_bp
 from .twitter import twitter_bp
 from .instagram import instagram_bp
 from .tiktok import tiktok_bp
+from .jobs import jobs_bp
+from .history import history_bp
 
-__all__ = ['facebook_bp', 'twitter_bp', 'instagram_bp', 'tiktok_bp']
+__all__ = ['facebook_bp', 'twitter_bp', 'instagram_bp', 'tiktok_bp', 'jobs_bp', 'history_bp']
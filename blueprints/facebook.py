@@ -3,10 +3,18 @@ Facebook Blueprint - handles Facebook post analysis routes
 """
 import os
 import re
-import pandas as pd
 import requests
-from flask import Blueprint, render_template, request
+from requests.adapters import HTTPAdapter
+from flask import Blueprint, redirect, render_template, request, url_for
 from dotenv import load_dotenv
+from services import cache, history
+from services.batch import iter_batch
+from services.canonical import canonicalize
+from services.ingest import UploadError, read_upload
+from services.jobs import register_handler, submit_job
+from services.metrics import instrumented, record_result, timed
+from services.resilience import RetryableError, guarded
+from services.streaming import stream_batch
 
 load_dotenv()
 
@@ -16,53 +24,107 @@ facebook_bp = Blueprint('facebook', __name__, url_prefix='/facebook')
 # Facebook Access Token
 ACCESS_TOKEN = os.getenv("FACEBOOK_ACCESS_TOKEN")
 
+# Graph API base URL (override to point at a local stub server)
+GRAPH_API_URL = os.getenv("FACEBOOK_GRAPH_URL", "https://graph.facebook.com/v18.0").rstrip('/')
+
+# The Graph API accepts at most 50 IDs per multi-ID lookup
+GRAPH_BATCH_SIZE = 50
+
+# Graph API error codes for app, user and page level rate limiting
+GRAPH_THROTTLE_CODES = {4, 17, 32, 613}
+
+# Graph API error codes that can come from one bad ID in a multi-ID lookup
+# (nonexistent or unsupported object); any other error applies to every ID
+GRAPH_ID_ERROR_CODES = {100, 803}
+
+# Keep-alive session shared by every Graph API call in this process
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+
+# Post ID patterns, tried in order
+POST_ID_PATTERNS = [
+    re.compile(r'facebook\.com/[\w.]+/posts/(\d+)'),
+    re.compile(r'facebook\.com/[\w.]+/photos/[^/]+/(\d+)'),
+    re.compile(r'facebook\.com/permalink\.php\?story_fbid=(\d+)'),
+    re.compile(r'facebook\.com/photo\.php\?fbid=(\d+)'),
+    re.compile(r'/posts/(\d+)'),
+    re.compile(r'/videos/(\d+)')
+]
+
+
+def clean_facebook_url(url):
+    """Remove query parameters and mobile or tracking parts of a facebook link to normalize it."""
+    return url.split('?')[0].replace('m.facebook.com', 'facebook.com')
+
+
 def extract_post_id(url):
     """Extract Facebook post ID from the URL."""
-    patterns = [
-        r'facebook\.com/[\w.]+/posts/(\d+)',
-        r'facebook\.com/[\w.]+/photos/[^/]+/(\d+)',
-        r'facebook\.com/permalink\.php\?story_fbid=(\d+)',
-        r'facebook\.com/photo\.php\?fbid=(\d+)',
-        r'/posts/(\d+)',
-        r'/videos/(\d+)'
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, url)
+    for pattern in POST_ID_PATTERNS:
+        match = pattern.search(url)
         if match:
             return match.group(1)
     return None
 
 
+def _graph_error_code(res):
+    try:
+        return res.json().get("error", {}).get("code")
+    except Exception:
+        return None
+
+
+def _graph_get(url, params, timeout, stage):
+    """
+    GET from the Graph API behind the facebook rate limiter, retries and
+    circuit breaker. Throttling and server errors raise RetryableError (and
+    are retried); any other response is returned for the caller to check.
+    """
+    def call():
+        with timed("facebook", stage):
+            # The token goes in a header so it never shows up in a URL, and so in no error message
+            res = session.get(url, params=params, timeout=timeout,
+                              headers={"Authorization": f"Bearer {ACCESS_TOKEN}"})
+        if (res.status_code == 429 or res.status_code >= 500
+                or (res.status_code != 200 and _graph_error_code(res) in GRAPH_THROTTLE_CODES)):
+            raise RetryableError(f"Graph API {res.status_code}: {res.text[:200]}")
+        return res
+
+    return guarded("facebook", call)
+
+
+def _parse_metrics(data, post_id):
+    """Turn a Graph API post object into the metrics dict used by the templates."""
+    reactions = data.get("reactions", {}).get("summary", {}).get("total_count", 0)
+    comments = data.get("comments", {}).get("summary", {}).get("total_count", 0)
+    shares = data.get("shares", {}).get("count", 0)
+
+    return {
+        "reactions": reactions,
+        "comments": comments,
+        "shares": shares,
+        "post_id": post_id
+    }
+
+
+@instrumented("facebook")
 def get_post_metrics(post_id):
     """
     Fetch Facebook post metrics using Graph API.
     Requires a Page Access Token with appropriate permissions.
     """
-    url = f"https://graph.facebook.com/v18.0/{post_id}"
+    url = f"{GRAPH_API_URL}/{post_id}"
     params = {
-        "fields": "reactions.summary(true),comments.summary(true),shares,message,created_time",
-        "access_token": ACCESS_TOKEN
+        "fields": "reactions.summary(true),comments.summary(true),shares,message,created_time"
     }
 
     try:
-        res = requests.get(url, params=params)
+        res = _graph_get(url, params, 15, "graph_api")
         
         if res.status_code != 200:
             return {"error": res.text}
 
-        data = res.json()
-        
-        reactions = data.get("reactions", {}).get("summary", {}).get("total_count", 0)
-        comments = data.get("comments", {}).get("summary", {}).get("total_count", 0)
-        shares = data.get("shares", {}).get("count", 0)
-        
-        return {
-            "reactions": reactions,
-            "comments": comments,
-            "shares": shares,
-            "post_id": post_id
-        }
+        return _parse_metrics(res.json(), post_id)
     
     except Exception as e:
         return {"error": str(e)}
@@ -70,15 +132,14 @@ def get_post_metrics(post_id):
 
 def get_post_comments(post_id, limit=10):
     """Fetch comments from a Facebook post."""
-    url = f"https://graph.facebook.com/v18.0/{post_id}/comments"
+    url = f"{GRAPH_API_URL}/{post_id}/comments"
     params = {
         "fields": "message,from",
-        "limit": limit,
-        "access_token": ACCESS_TOKEN
+        "limit": limit
     }
 
     try:
-        res = requests.get(url, params=params)
+        res = _graph_get(url, params, 15, "graph_api_comments")
         
         if res.status_code != 200:
             return []
@@ -92,6 +153,129 @@ def get_post_comments(post_id, limit=10):
         return []
 
 
+def _parse_post_with_comments(data, post_id):
+    metrics = _parse_metrics(data, post_id)
+    comments_data = data.get("comments", {}).get("data", [])
+    metrics["comment_list"] = [c.get("message", "") for c in comments_data]
+    return metrics
+
+
+def _fetch_posts_chunk(post_ids, comment_limit=10):
+    """Fetch metrics and comments for up to GRAPH_BATCH_SIZE posts in one round trip."""
+    params = {
+        "ids": ",".join(post_ids),
+        "fields": f"reactions.summary(true),comments.limit({comment_limit}).summary(true){{message,from}},shares,message,created_time"
+    }
+
+    try:
+        res = _graph_get(f"{GRAPH_API_URL}/", params, 30, "graph_api_batch")
+    except Exception as e:
+        return {post_id: {"error": str(e)} for post_id in post_ids}
+
+    if res.status_code == 200:
+        data = res.json()
+        return {
+            post_id: _parse_post_with_comments(data[post_id], post_id) if post_id in data
+            else {"error": "Post not returned by Graph API"}
+            for post_id in post_ids
+        }
+
+    if len(post_ids) == 1 or _graph_error_code(res) not in GRAPH_ID_ERROR_CODES:
+        # An expired token or missing permission would fail every single-post retry the same way
+        return {post_id: {"error": res.text} for post_id in post_ids}
+
+    # One bad ID fails the whole multi-ID lookup, so retry the posts one by one
+    results = {}
+    for post_id in post_ids:
+        results.update(_fetch_posts_chunk([post_id], comment_limit))
+    return results
+
+
+def _post_cache_key(post_id):
+    return f"facebook:post:{post_id}"
+
+
+def get_posts_with_comments(post_ids, comment_limit=10, use_cache=True, deadline=None):
+    """
+    Fetch metrics and comments for many posts using multi-ID Graph API lookups.
+    Fresh cached posts are not refetched unless use_cache is False.
+    Yields (post_id, {"reactions", "comments", "shares", "post_id", "comment_list"}
+    or {"error": str}) for each distinct post: cached posts first, then each
+    lookup's posts as soon as it completes, in the order of post_ids.
+    Raises DeadlineExceeded (see services.batch) once deadline passes.
+    """
+    missing = []
+    for post_id in dict.fromkeys(post_ids):
+        if not use_cache:
+            missing.append(post_id)
+            continue
+        # Stale entries are refetched here, since a batched lookup is cheap
+        value, state = cache.lookup(_post_cache_key(post_id), "facebook")
+        if state == "fresh":
+            yield post_id, value
+        else:
+            missing.append(post_id)
+
+    chunks = [missing[i:i + GRAPH_BATCH_SIZE] for i in range(0, len(missing), GRAPH_BATCH_SIZE)]
+    # Chunks are stored as they arrive, so the ones done before a deadline are kept
+    # Each chunk's key is its ID list, so iter_batch doesn't treat the chunks as links
+    for chunk_results in iter_batch(chunks, lambda chunk: _fetch_posts_chunk(chunk, comment_limit), "facebook",
+                                    use_cache=False, post_keys=[",".join(chunk) for chunk in chunks],
+                                    deadline=deadline):
+        for post_id, metrics in chunk_results.items():
+            record_result("facebook", metrics)
+            history.record_snapshot("facebook", post_id, metrics)
+            if "error" not in metrics:
+                cache.store(_post_cache_key(post_id), "facebook", metrics)
+        yield from chunk_results.items()
+
+
+def iter_results(rows, deadline=None):
+    """
+    Fetch uploaded rows and yield the rows for facebook/results.html in upload
+    order, each as soon as the lookup holding its post completes.
+    """
+    # Mobile, query-string and duplicate links collapse onto the same post ID
+    post_ids = [row.get("post_key") or canonicalize(row["link"], "facebook")[1] for row in rows]
+
+    fetched = get_posts_with_comments([post_id for post_id in post_ids if post_id], deadline=deadline)
+    posts = {}
+
+    for row, post_id in zip(rows, post_ids):
+        # Lookups are chunked in upload order, so this only waits for the row's own chunk
+        while post_id and post_id not in posts:
+            try:
+                key, metrics = next(fetched)
+            except StopIteration:
+                break
+            posts[key] = metrics
+        metrics = posts.get(post_id) if post_id else None
+
+        if not metrics or "error" in metrics:
+            yield {
+                "name": row["name"],
+                "link": row["link"],
+                "reactions": "N/A",
+                "comments": "N/A",
+                "shares": "N/A",
+                "comment_list": []
+            }
+            continue
+
+        yield {
+            "name": row["name"],
+            "link": row["link"],
+            "reactions": metrics.get("reactions", 0),
+            "comments": metrics.get("comments", 0),
+            "shares": metrics.get("shares", 0),
+            "comment_list": metrics.get("comment_list", [])
+        }
+
+
+# Background jobs and streamed uploads both run through iter_results
+register_handler("facebook", iter_results)
+
+
 @facebook_bp.route("/")
 def home():
     return render_template("facebook/upload.html")
@@ -100,77 +284,18 @@ def home():
 @facebook_bp.route("/upload", methods=["POST"])
 def upload_file():
     try:
-        if "file" not in request.files:
-            return render_template("facebook/error.html", 
-                                 error="No file uploaded",
-                                 message="Please select a file to upload.")
+        try:
+            rows = read_upload(request.files.get("file"), POST_ID_PATTERNS)
+        except UploadError as e:
+            return render_template("facebook/error.html", error=e.error, message=e.message)
 
-        file = request.files["file"]
-        
-        if file.filename == '':
-            return render_template("facebook/error.html",
-                                 error="No file selected",
-                                 message="Please select a valid file.")
-
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(file)
-        elif file.filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file)
-        else:
-            return render_template("facebook/error.html",
-                                 error="Invalid file format",
-                                 message="Please upload a CSV or Excel file.")
+        # Streaming mode renders each row as soon as it is ready instead of queueing a job;
+        # it stops at BATCH_DEADLINE_SECONDS with a link to resume the remaining rows
+        if request.form.get("mode") == "stream":
+            return stream_batch("facebook", rows)
 
-        df.columns = df.columns.str.strip().str.upper()
-        
-        if "LINK" not in df.columns or "NAME" not in df.columns:
-            return render_template("facebook/error.html",
-                                 error="Missing required columns",
-                                 message="Your file must contain columns named 'NAME' and 'LINK'.")
-
-        results = []
-
-        for index, row in df.iterrows():
-            name = row["NAME"]
-            link = row["LINK"]
-
-            post_id = extract_post_id(str(link))
-            if not post_id:
-                results.append({
-                    "name": name,
-                    "link": link,
-                    "reactions": "N/A",
-                    "comments": "N/A",
-                    "shares": "N/A",
-                    "comment_list": []
-                })
-                continue
-
-            metrics = get_post_metrics(post_id)
-            
-            if "error" in metrics:
-                results.append({
-                    "name": name,
-                    "link": link,
-                    "reactions": "N/A",
-                    "comments": "N/A",
-                    "shares": "N/A",
-                    "comment_list": []
-                })
-                continue
-
-            comment_list = get_post_comments(post_id)
-
-            results.append({
-                "name": name,
-                "link": link,
-                "reactions": metrics.get("reactions", 0),
-                "comments": metrics.get("comments", 0),
-                "shares": metrics.get("shares", 0),
-                "comment_list": comment_list
-            })
-
-        return render_template("facebook/results.html", results=results)
+        job_id = submit_job("facebook", rows)
+        return redirect(url_for("jobs.job_page", job_id=job_id))
     
     except Exception as e:
         return render_template("facebook/error.html",
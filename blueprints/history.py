@@ -0,0 +1,53 @@
+"""
+History Blueprint - engagement deltas and growth curves from the local snapshot store
+"""
+from flask import Blueprint, jsonify, request
+from services.canonical import canonicalize
+from services.export import METRIC_COLUMNS
+from services.history import platform_growth, post_history
+
+# Create Blueprint
+history_bp = Blueprint('history', __name__, url_prefix='/history')
+
+# Posts listed per platform at most
+MAX_POSTS = 1000
+
+
+def _float_arg(name):
+    value = request.args.get(name)
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+@history_bp.route("/post")
+def post_by_link():
+    """History of the post behind ?link=..., whatever form the link takes."""
+    platform, post_key = canonicalize(request.args.get("link", ""))
+    if not post_key:
+        return jsonify({"error": "Unsupported or unrecognised post link"}), 400
+    return post(platform, post_key)
+
+
+@history_bp.route("/<platform>/<post_key>")
+def post(platform, post_key):
+    """Snapshots, deltas and growth of one post; ?since=<unix time> trims the series."""
+    if platform not in METRIC_COLUMNS:
+        return jsonify({"error": f"Unknown platform: {platform}"}), 404
+
+    found = post_history(platform, post_key, since=_float_arg("since"))
+    if found is None:
+        return jsonify({"error": "No snapshots for this post"}), 404
+    return jsonify(found)
+
+
+@history_bp.route("/<platform>")
+def platform_posts(platform):
+    """Most recently snapshotted posts with their growth over ?days= (default 7)."""
+    if platform not in METRIC_COLUMNS:
+        return jsonify({"error": f"Unknown platform: {platform}"}), 404
+
+    days = _float_arg("days") or 7
+    limit = min(int(_float_arg("limit") or 100), MAX_POSTS)
+    return jsonify(platform_growth(platform, days=days, limit=limit))
@@ -4,9 +4,19 @@ Instagram Blueprint - handles Instagram post analysis routes
 import os
 import re
 import json
-import pandas as pd
-from flask import Blueprint, render_template, request
+from flask import Blueprint, redirect, render_template, request, url_for
 from dotenv import load_dotenv
+from services.async_browser_pool import ASYNC_MODE, get_async_browser_pool
+from services.batch import iter_batch
+from services.browser_pool import get_browser_pool
+from services.dom import read_page, read_page_async
+from services.http_fetch import HTTP_FAST_PATH, fetch_html, parse_page_metadata
+from services.ingest import UploadError, read_upload
+from services.jobs import register_handler, submit_job
+from services.metrics import instrumented, timed
+from services.resilience import guarded
+from services.scraper_workers import offloaded
+from services.streaming import stream_batch
 
 load_dotenv()
 
@@ -16,149 +26,240 @@ instagram_bp = Blueprint('instagram', __name__, url_prefix='/instagram')
 ACCESS_TOKEN = os.getenv("INSTAGRAM_ACCESS_TOKEN")
 
 
+# Post shortcode patterns, tried in order
+POST_ID_PATTERNS = [
+    re.compile(r'instagram\.com/p/([^/]+)'),
+    re.compile(r'instagram\.com/reel/([^/]+)'),
+    re.compile(r'instagram\.com/reels/([^/]+)'),
+    re.compile(r'instagram\.com/tv/([^/]+)'),
+    re.compile(r'instagram\.com/(?:[^/]+)/([^/]+)')
+]
+
+
+# Any of these means the post has rendered enough to read
+POST_READY_SELECTORS = ["article", 'script[type="application/ld+json"]', 'meta[property="og:description"]']
+
+# Comments read from the page
+COMMENT_LIMIT = 10
+
+POST_EXTRACT_JS = """
+let comments = texts('div.C4VMK > span', arg);
+if (!comments.length) comments = texts('article li', arg);
+const ld = first(['script[type="application/ld+json"]']);
+const article = first(['article']);
+return {
+    ld_json: ld ? ld.textContent : null,
+    og_description: attr('meta[property="og:description"]', 'content'),
+    article_text: article ? article.textContent : null,
+    comments: comments,
+};
+"""
+
+
 def extract_post_id(url):
     """Extract Instagram post ID or shortcode from ANY Instagram URL format."""
     url = url.strip()
     url = url.split('?')[0].rstrip('/')
 
-    patterns = [
-        r'instagram\.com/p/([^/]+)',
-        r'instagram\.com/reel/([^/]+)',
-        r'instagram\.com/reels/([^/]+)',
-        r'instagram\.com/tv/([^/]+)',
-        r'instagram\.com/(?:[^/]+)/([^/]+)'
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, url)
+    for pattern in POST_ID_PATTERNS:
+        match = pattern.search(url)
         if match:
             return match.group(1)
 
     return None
 
 
-def scrape_instagram_post(url):
+def _metrics_from_metadata(ld_obj, og_text):
     """
-    Scrape likes/comments from a PUBLIC IG post using Playwright.
-    Returns: {"likes": int, "comments": int, "comment_list": [...], "media_type": str}
+    Likes, comments and media type from a post's ld+json object and
+    og:description text. Counts that can't be found come back as None.
     """
+    likes = None
+    comments_count = None
+    media_type = "N/A"
+
+    # Pull metrics from application/ld+json
+    try:
+        if ld_obj:
+            inter = ld_obj.get("interactionStatistic")
+
+            if isinstance(inter, dict):
+                likes = int(inter.get("userInteractionCount", 0))
+
+            elif isinstance(inter, list):
+                for item in inter:
+                    name = item.get("interactionType", {}).get("name", "").lower()
+                    if "like" in name:
+                        likes = int(item.get("userInteractionCount", 0))
+                    if "comment" in name:
+                        comments_count = int(item.get("userInteractionCount", 0))
+
+            media_type = ld_obj.get("uploadDate", "N/A")
+
+    except Exception:
+        pass
+
+    # Try og:description for likes/comments
     try:
-        from playwright.sync_api import sync_playwright
+        if og_text:
+            m = re.search(r"([\d,\.]+)\s+likes", og_text, re.I)
+            if m:
+                likes = int(m.group(1).replace(',', ''))
+            m2 = re.search(r"([\d,\.]+)\s+comments", og_text, re.I)
+            if m2:
+                comments_count = int(m2.group(1).replace(',', ''))
     except Exception:
-        return {"error": "Playwright missing. Run: pip install playwright && playwright install chromium"}
+        pass
+
+    return likes, comments_count, media_type
 
+
+def _parse_instagram_html(html):
+    """
+    Likes/comments from the server-rendered HTML of a post, or None when the
+    page doesn't carry the counts and the browser is needed.
+    """
+    metadata = parse_page_metadata(html)
+    ld_obj = metadata["ld_json"][0] if metadata["ld_json"] else None
+    likes, comments_count, media_type = _metrics_from_metadata(ld_obj, metadata["meta"].get("og:description"))
+    if likes is None or comments_count is None:
+        return None
+
+    return {
+        "likes": likes,
+        "comments": comments_count,
+        "comment_list": [],
+        "media_type": media_type,
+        "source": "http"
+    }
+
+
+def _scrape_instagram_http(url):
+    """
+    Fast path: read likes/comments from the server-rendered HTML without a browser.
+    Returns None when the page doesn't carry the counts, so the caller falls back to Playwright.
+    """
+    with timed("instagram", "http_fetch"):
+        html = fetch_html(url)
+    return _parse_instagram_html(html) if html else None
+
+
+def _parse_instagram_page(found):
+    """Likes/comments from the POST_EXTRACT_JS result of a rendered post."""
+    ld_obj = None
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(
-                headless=True, 
-                args=["--no-sandbox", "--disable-blink-features=AutomationControlled"]
-            )
-            context = browser.new_context(
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-            )
-            page = context.new_page()
-            
-            # Use domcontentloaded instead of networkidle for much faster loading
-            page.goto(url, wait_until="domcontentloaded", timeout=15000)
+        if found.get("ld_json"):
+            ld_obj = json.loads(found["ld_json"])
+    except Exception:
+        pass
 
+    likes, comments_count, media_type = _metrics_from_metadata(ld_obj, found.get("og_description"))
+    likes = likes or 0
+    comments_count = comments_count or 0
+
+    # Fallback: scrape page text
+    if likes == 0:
+        m = re.search(r"([\d,\.]+)\s+likes", found.get("article_text") or "", re.I)
+        if m:
             try:
-                page.wait_for_selector("article", timeout=5000, state='attached')
-            except Exception:
+                likes = int(m.group(1).replace(',', ''))
+            except ValueError:
                 pass
 
-            likes = 0
-            comments_count = 0
-            media_type = "N/A"
-            comment_list = []
+    comment_list = found.get("comments") or []
+    comments_count = comments_count or len(comment_list)
 
-            # Pull metrics from application/ld+json
-            try:
-                ld_json = page.query_selector('script[type="application/ld+json"]')
-                if ld_json:
-                    obj = json.loads(ld_json.inner_text())
-                    inter = obj.get("interactionStatistic")
+    return {
+        "likes": int(likes or 0),
+        "comments": int(comments_count or 0),
+        "comment_list": comment_list[:20],
+        "media_type": media_type,
+        "source": "browser"
+    }
 
-                    if isinstance(inter, dict):
-                        likes = int(inter.get("userInteractionCount", 0))
 
-                    elif isinstance(inter, list):
-                        for item in inter:
-                            name = item.get("interactionType", {}).get("name", "").lower()
-                            if "like" in name:
-                                likes = int(item.get("userInteractionCount", 0))
-                            if "comment" in name:
-                                comments_count = int(item.get("userInteractionCount", 0))
+def _scrape_instagram_page(context, url):
+    """Read likes/comments from an IG post opened in a pooled browser context."""
+    # One round trip for metadata, page text and comments
+    found = read_page(context, url, "instagram", POST_READY_SELECTORS, POST_EXTRACT_JS, COMMENT_LIMIT)
+    return _parse_instagram_page(found)
 
-                    media_type = obj.get("uploadDate", "N/A")
 
-            except Exception:
-                pass
+async def _scrape_instagram_async(url):
+    """_scrape_instagram on the async browser pool (SERVING_MODE=async)."""
+    pool = get_async_browser_pool()
+    if HTTP_FAST_PATH:
+        with timed("instagram", "http_fetch"):
+            html = await pool.fetch_html(url)
+        metrics = _parse_instagram_html(html) if html else None
+        if metrics:
+            return metrics
 
-            # Try og:description for likes/comments
-            try:
-                og = page.query_selector('meta[property="og:description"]')
-                if og:
-                    text = og.get_attribute("content") or ""
-                    m = re.search(r"([\d,\.]+)\s+likes", text, re.I)
-                    if m:
-                        likes = int(m.group(1).replace(',', ''))
-                    m2 = re.search(r"([\d,\.]+)\s+comments", text, re.I)
-                    if m2:
-                        comments_count = int(m2.group(1).replace(',', ''))
-            except Exception:
-                pass
+    async with pool.context("instagram") as context:
+        found = await read_page_async(context, url, "instagram", POST_READY_SELECTORS, POST_EXTRACT_JS, COMMENT_LIMIT)
+    return _parse_instagram_page(found)
 
-            # Fallback: scrape page text
-            if likes == 0:
-                try:
-                    page_text = page.text_content("article") or ""
-                    m = re.search(r"([\d,\.]+)\s+likes", page_text, re.I)
-                    if m:
-                        likes = int(m.group(1).replace(',', ''))
-                except Exception:
-                    pass
-
-            # Grab comments (limit to save time)
-            try:
-                nodes = page.query_selector_all('div.C4VMK > span')
-                for node in nodes[:10]:  # Limit to first 10
-                    try:
-                        txt = node.inner_text(timeout=2000).strip()
-                        if txt:
-                            comment_list.append(txt)
-                    except:
-                        continue
-                
-                if not comment_list:
-                    li_nodes = page.query_selector_all('article li')
-                    for l in li_nodes[:10]:  # Limit to first 10
-                        try:
-                            txt = l.inner_text(timeout=2000).strip()
-                            if txt:
-                                comment_list.append(txt)
-                        except:
-                            continue
-                
-                comments_count = comments_count or len(comment_list)
-            except Exception:
-                pass
 
-            try:
-                context.close()
-                browser.close()
-            except Exception:
-                pass
+@offloaded("instagram")
+def _scrape_instagram(url):
+    if ASYNC_MODE:
+        return get_async_browser_pool().run(_scrape_instagram_async(url))
+    if HTTP_FAST_PATH:
+        metrics = _scrape_instagram_http(url)
+        if metrics:
+            return metrics
+    return get_browser_pool().run(lambda context: _scrape_instagram_page(context, url), platform="instagram")
 
-            return {
-                "likes": int(likes or 0),
-                "comments": int(comments_count or 0),
-                "comment_list": comment_list[:20],
-                "media_type": media_type
-            }
+
+@instrumented("instagram")
+def scrape_instagram_post(url):
+    """
+    Scrape likes/comments from a PUBLIC IG post.
+    Tries a plain HTTP fetch first and only uses the shared browser pool when
+    the counts are missing from the server-rendered HTML. Both go through
+    the platform's rate limiter, retries and circuit breaker.
+    Returns: {"likes": int, "comments": int, "comment_list": [...], "media_type": str, "source": "http"|"browser"}
+    """
+    try:
+        return guarded("instagram", _scrape_instagram, url)
     except Exception as e:
         return {"error": str(e)}
 
 
+def iter_results(rows, deadline=None):
+    """Scrape uploaded rows and yield the rows for instagram/results.html in upload order."""
+    links = [row["link"] for row in rows]
+    # post_key is extracted at upload time; rows queued before that fall back to the regex
+    post_keys = [row.get("post_key") or extract_post_id(str(row["link"])) for row in rows]
+
+    # Rows without a shortcode are skipped by the batch and reported as N/A
+    to_scrape = [link if post_key else None for link, post_key in zip(links, post_keys)]
+    scraped = iter_batch(to_scrape, scrape_instagram_post, "instagram", post_keys=post_keys, deadline=deadline)
+
+    for row, metrics in zip(rows, scraped):
+        if not metrics or "error" in metrics:
+            yield {
+                "name": row["name"],
+                "link": row["link"],
+                "likes": "N/A",
+                "comments": "N/A",
+                "comment_list": []
+            }
+            continue
+
+        yield {
+            "name": row["name"],
+            "link": row["link"],
+            "likes": metrics.get("likes", 0),
+            "comments": metrics.get("comments", 0),
+            "comment_list": metrics.get("comment_list", [])
+        }
+
+
+# Background jobs and streamed uploads both run through iter_results
+register_handler("instagram", iter_results)
+
+
 @instagram_bp.route("/")
 def home():
     return render_template("instagram/upload.html")
@@ -167,72 +268,18 @@ def home():
 @instagram_bp.route("/upload", methods=["POST"])
 def upload_file():
     try:
-        if "file" not in request.files:
-            return render_template("instagram/error.html",
-                                   error="No file uploaded",
-                                   message="Please upload a CSV or Excel file.")
-
-        file = request.files["file"]
-
-        if file.filename == '':
-            return render_template("instagram/error.html",
-                                   error="No file selected",
-                                   message="Please select a valid file.")
-
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(file)
-        elif file.filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file)
-        else:
-            return render_template("instagram/error.html",
-                                   error="Invalid file format",
-                                   message="Please upload a CSV or Excel file.")
-
-        df.columns = df.columns.str.strip().str.upper()
-
-        if "LINK" not in df.columns or "NAME" not in df.columns:
-            return render_template("instagram/error.html",
-                                   error="Missing required columns",
-                                   message="Your file must contain columns named 'NAME' and 'LINK'.")
-
-        results = []
-
-        for index, row in df.iterrows():
-            name = row["NAME"]
-            link = row["LINK"]
-
-            shortcode = extract_post_id(str(link))
-            if not shortcode:
-                results.append({
-                    "name": name,
-                    "link": link,
-                    "likes": "N/A",
-                    "comments": "N/A",
-                    "comment_list": []
-                })
-                continue
-
-            metrics = scrape_instagram_post(link)
-
-            if not metrics or "error" in metrics:
-                results.append({
-                    "name": name,
-                    "link": link,
-                    "likes": "N/A",
-                    "comments": "N/A",
-                    "comment_list": []
-                })
-                continue
-
-            results.append({
-                "name": name,
-                "link": link,
-                "likes": metrics.get("likes", 0),
-                "comments": metrics.get("comments", 0),
-                "comment_list": metrics.get("comment_list", [])
-            })
-
-        return render_template("instagram/results.html", results=results)
+        try:
+            rows = read_upload(request.files.get("file"), POST_ID_PATTERNS)
+        except UploadError as e:
+            return render_template("instagram/error.html", error=e.error, message=e.message)
+
+        # Streaming mode renders each row as soon as it is ready instead of queueing a job;
+        # it stops at BATCH_DEADLINE_SECONDS with a link to resume the remaining rows
+        if request.form.get("mode") == "stream":
+            return stream_batch("instagram", rows)
+
+        job_id = submit_job("instagram", rows)
+        return redirect(url_for("jobs.job_page", job_id=job_id))
 
     except Exception as e:
         return render_template("instagram/error.html",
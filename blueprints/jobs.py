@@ -0,0 +1,138 @@
+"""
+Jobs Blueprint - progress and results pages for background upload jobs
+"""
+from flask import Blueprint, Response, abort, jsonify, redirect, render_template, request, url_for
+from services.analytics import ANALYTICS_TOP_N, cross_platform_summary, job_frame, job_summary, name_aggregates
+from services.export import EXPORT_FORMATS, ExportError, iter_export
+from services.jobs import get_job, iter_job_results
+from services.results import RESULTS_PAGE_SIZE, ResultsQueryError, results_page
+from services.streaming import resume_batch
+
+# Create Blueprint
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+
+@jobs_bp.route("/<job_id>")
+def job_page(job_id):
+    job = get_job(job_id)
+    if job is None:
+        abort(404)
+
+    platform = job["platform"]
+
+    if job["status"] == "done":
+        # Only the first page is rendered; the page fetches the others from job_results()
+        page = results_page(job)
+        return render_template(f"{platform}/results.html", results=page.pop("rows"), results_page=page,
+                               page_rows=RESULTS_PAGE_SIZE, job_id=job["id"])
+
+    if job["status"] == "failed":
+        return render_template(f"{platform}/error.html",
+                               error="Processing Error",
+                               message=f"An error occurred while processing your file: {job['error']}")
+
+    return render_template("jobs/progress.html", job=job)
+
+
+@jobs_bp.route("/<job_id>/status")
+def job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@jobs_bp.route("/<job_id>/results")
+def job_results(job_id):
+    """
+    One page of a job's result rows as JSON, with totals over the matching rows.
+    Query: page, per_page, sort (name, link or a metric), order (asc|desc),
+    q (name/link substring), status (ok|error). Works while a job is still running.
+    """
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    try:
+        page = results_page(
+            job,
+            page=request.args.get("page", 1, type=int),
+            per_page=request.args.get("per_page", RESULTS_PAGE_SIZE, type=int),
+            sort=request.args.get("sort") or None,
+            order=request.args.get("order", "asc").lower(),
+            q=request.args.get("q", "").strip() or None,
+            status=request.args.get("status") or None,
+        )
+    except ResultsQueryError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(page)
+
+
+@jobs_bp.route("/<job_id>/analytics")
+def job_analytics(job_id):
+    """Totals, engagement and top-N names and posts of a job's rows (top: query parameter)."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_summary(job, top=max(0, request.args.get("top", ANALYTICS_TOP_N, type=int))))
+
+
+@jobs_bp.route("/<job_id>/analytics.csv")
+def job_analytics_csv(job_id):
+    """Download the per-name aggregates of a job's rows, highest engagement first."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    response = Response(name_aggregates(job_frame(job)).to_csv(index=False), mimetype="text/csv")
+    response.headers["Content-Disposition"] = f'attachment; filename="{job["platform"]}-{job_id}-by-name.csv"'
+    return response
+
+
+@jobs_bp.route("/analytics")
+def cross_platform_analytics():
+    """Engagement per name across several jobs, e.g. one upload per platform: ?ids=<job_id>,<job_id>."""
+    ids = [job_id.strip() for job_id in request.args.get("ids", "").split(",") if job_id.strip()]
+    if not ids:
+        return jsonify({"error": "Pass one or more job IDs as ?ids=<id>,<id>"}), 400
+
+    jobs = [get_job(job_id) for job_id in ids]
+    missing = [job_id for job_id, job in zip(ids, jobs) if job is None]
+    if missing:
+        return jsonify({"error": f"Jobs not found: {', '.join(missing)}"}), 404
+    return jsonify(cross_platform_summary(jobs, top=max(0, request.args.get("top", ANALYTICS_TOP_N, type=int))))
+
+
+@jobs_bp.route("/<job_id>/resume")
+def job_resume(job_id):
+    """Continue a streamed upload that ran out of time or lost its worker; finished rows are not redone."""
+    response = resume_batch(job_id)
+    if response is None:
+        if get_job(job_id) is None:
+            abort(404)
+        return redirect(url_for("jobs.job_page", job_id=job_id))
+    return response
+
+
+@jobs_bp.route("/<job_id>/export.<fmt>")
+def job_export(job_id, fmt):
+    """Download a finished job's results as csv, ndjson, xlsx or parquet."""
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] != "done":
+        return jsonify({"error": f"Job is {job['status']}, results are not ready"}), 409
+
+    # Spreadsheets get a second sheet with the per-name aggregates
+    by_name = name_aggregates(job_frame(job)) if fmt == "xlsx" else None
+    try:
+        chunks = iter_export(fmt, job["platform"], iter_job_results(job_id), by_name=by_name)
+    except ExportError as e:
+        return jsonify({"error": str(e)}), 501
+
+    response = Response(chunks, mimetype=EXPORT_FORMATS[fmt])
+    response.headers["Content-Disposition"] = f'attachment; filename="{job["platform"]}-{job_id}.{fmt}"'
+    return response
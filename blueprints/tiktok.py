@@ -2,86 +2,181 @@
 TikTok Blueprint - handles TikTok video analysis routes
 """
 import re
-import pandas as pd
-from flask import Blueprint, render_template, request
+from flask import Blueprint, redirect, render_template, request, url_for
+from services.async_browser_pool import ASYNC_MODE, get_async_browser_pool
+from services.batch import iter_batch
+from services.browser_pool import get_browser_pool
+from services.dom import read_page, read_page_async
+from services.http_fetch import HTTP_FAST_PATH, fetch_html, parse_page_metadata
+from services.ingest import UploadError, read_upload
+from services.jobs import register_handler, submit_job
+from services.metrics import instrumented, timed
+from services.resilience import guarded
+from services.scraper_workers import offloaded
+from services.streaming import stream_batch
 
 # Create Blueprint
 tiktok_bp = Blueprint('tiktok', __name__, url_prefix='/tiktok')
 
 
+VIDEO_ID_PATTERN = re.compile(r'tiktok\.com/.*?/(?:video|photo)/(\d+)')
+
+# Any of these means the video page has rendered enough to read
+VIDEO_READY_SELECTORS = ["main", 'meta[property="og:description"]']
+
+# Comments read from the page
+COMMENT_LIMIT = 10
+
+VIDEO_EXTRACT_JS = """
+return {
+    og_description: attr('meta[property="og:description"]', 'content'),
+    comments: texts('div.comment-item > p', arg),
+};
+"""
+
+
+def extract_video_id(url):
+    """Extract the numeric video (or photo post) ID from a full TikTok URL."""
+    match = VIDEO_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+
+def _likes_from_og(ogc):
+    """Likes (or views) from og:description text, or None if it has no count."""
+    try:
+        m = re.search(r"([\d,\.]+)\s+Likes|([\d,\.]+)\s+view", ogc, re.I)
+        if m:
+            return int((m.group(1) or m.group(2)).replace(',', ''))
+    except Exception:
+        pass
+    return None
+
+
+def _parse_tiktok_html(html):
+    """
+    Likes/comments from the server-rendered og:description, or None when the
+    likes count is missing and the browser is needed.
+    """
+    ogc = parse_page_metadata(html)["meta"].get("og:description") or ''
+    likes = _likes_from_og(ogc)
+    if likes is None:
+        return None
+
+    comments = 0
+    m = re.search(r"([\d,]+)\s+Comments", ogc, re.I)
+    if m:
+        comments = int(m.group(1).replace(',', ''))
+
+    return {
+        "likes": likes,
+        "comments": comments,
+        "comment_list": [],
+        "source": "http"
+    }
+
+
+def _scrape_tiktok_http(url):
+    """
+    Fast path: read likes/comments from the server-rendered og:description.
+    Returns None when the likes count is missing, so the caller falls back to Playwright.
+    """
+    with timed("tiktok", "http_fetch"):
+        html = fetch_html(url)
+    return _parse_tiktok_html(html) if html else None
+
+
+def _parse_tiktok_page(found):
+    """Likes/comments from the VIDEO_EXTRACT_JS result of a rendered video page."""
+    likes = _likes_from_og(found.get("og_description") or '') or 0
+    comment_list = found.get("comments") or []
+
+    return {
+        "likes": int(likes or 0),
+        "comments": len(comment_list),
+        "comment_list": comment_list[:20],
+        "source": "browser"
+    }
+
+
+def _scrape_tiktok_page(context, url):
+    """Read likes/comments from a TikTok video opened in a pooled browser context."""
+    # One round trip for og:description and comments (best-effort, limited for speed)
+    found = read_page(context, url, "tiktok", VIDEO_READY_SELECTORS, VIDEO_EXTRACT_JS, COMMENT_LIMIT)
+    return _parse_tiktok_page(found)
+
+
+async def _scrape_tiktok_async(url):
+    """_scrape_tiktok on the async browser pool (SERVING_MODE=async)."""
+    pool = get_async_browser_pool()
+    if HTTP_FAST_PATH:
+        with timed("tiktok", "http_fetch"):
+            html = await pool.fetch_html(url)
+        metrics = _parse_tiktok_html(html) if html else None
+        if metrics:
+            return metrics
+
+    async with pool.context("tiktok", locale='en-US') as context:
+        found = await read_page_async(context, url, "tiktok", VIDEO_READY_SELECTORS, VIDEO_EXTRACT_JS, COMMENT_LIMIT)
+    return _parse_tiktok_page(found)
+
+
+@offloaded("tiktok")
+def _scrape_tiktok(url):
+    if ASYNC_MODE:
+        return get_async_browser_pool().run(_scrape_tiktok_async(url))
+    if HTTP_FAST_PATH:
+        metrics = _scrape_tiktok_http(url)
+        if metrics:
+            return metrics
+    return get_browser_pool().run(lambda context: _scrape_tiktok_page(context, url), platform="tiktok", locale='en-US')
+
+
+@instrumented("tiktok")
 def scrape_tiktok_post(url):
     """
-    Scrape a public TikTok video using Playwright (best effort).
-    Returns: {"likes": int, "comments": int, "comment_list": [str..]}
+    Scrape a public TikTok video (best effort).
+    Tries a plain HTTP fetch first and only uses the shared browser pool when
+    the likes count is missing from the server-rendered HTML. Both go through
+    the platform's rate limiter, retries and circuit breaker.
+    Returns: {"likes": int, "comments": int, "comment_list": [str..], "source": "http"|"browser"}
     """
     try:
-        try:
-            from playwright.sync_api import sync_playwright
-        except Exception:
-            return {"error": "Playwright not installed. Run 'pip install playwright' and 'python -m playwright install chromium'"}
-        
-        with sync_playwright() as p:
-            browser = p.chromium.launch(
-                headless=True, 
-                args=["--no-sandbox", "--disable-blink-features=AutomationControlled"]
-            )
-            context = browser.new_context(
-                locale='en-US',
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-            )
-            page = context.new_page()
-            
-            # Use domcontentloaded for faster loading
-            page.goto(url, wait_until="domcontentloaded", timeout=15000)
-            
-            try:
-                page.wait_for_selector('main', timeout=5000, state='attached')
-            except Exception:
-                pass
-            
-            likes = 0
-            comments = 0
-            comment_list = []
-            
-            try:
-                og_descr = page.query_selector('meta[property="og:description"]')
-                if og_descr:
-                    ogc = og_descr.get_attribute('content') or ''
-                    m = re.search(r"([\d,\.]+)\s+Likes|([\d,\.]+)\s+view", ogc, re.I)
-                    if m:
-                        likes = int((m.group(1) or m.group(2)).replace(',', ''))
-            except Exception:
-                pass
-            
-            # Grab comments (best-effort, limit for speed)
-            try:
-                nodes = page.query_selector_all('div.comment-item > p')
-                for node in nodes[:10]:  # Limit to first 10
-                    try:
-                        txt = node.inner_text(timeout=2000).strip()
-                        if txt:
-                            comment_list.append(txt)
-                    except:
-                        continue
-                comments = len(comment_list)
-            except Exception:
-                pass
-            
-            try:
-                context.close()
-                browser.close()
-            except Exception:
-                pass
-            
-            return {
-                "likes": int(likes or 0),
-                "comments": int(comments or 0),
-                "comment_list": comment_list[:20]
-            }
+        return guarded("tiktok", _scrape_tiktok, url)
     except Exception as e:
         return {"error": str(e)}
 
 
+def iter_results(rows, deadline=None):
+    """Scrape uploaded rows and yield the rows for tiktok/results.html in upload order."""
+    links = [row["link"] for row in rows]
+    post_keys = [row.get("post_key") for row in rows]
+
+    scraped = iter_batch(links, scrape_tiktok_post, "tiktok", post_keys=post_keys, deadline=deadline)
+
+    for row, metrics in zip(rows, scraped):
+        if not metrics or "error" in metrics:
+            yield {
+                "name": row["name"],
+                "link": row["link"],
+                "likes": "N/A",
+                "comments": "N/A",
+                "comment_list": []
+            }
+            continue
+
+        yield {
+            "name": row["name"],
+            "link": row["link"],
+            "likes": metrics.get("likes", 0),
+            "comments": metrics.get("comments", 0),
+            "comment_list": metrics.get("comment_list", [])
+        }
+
+
+# Background jobs and streamed uploads both run through iter_results
+register_handler("tiktok", iter_results)
+
+
 @tiktok_bp.route("/")
 def home():
     return render_template("tiktok/upload.html")
@@ -90,60 +185,18 @@ def home():
 @tiktok_bp.route("/upload", methods=["POST"])
 def upload_file():
     try:
-        if "file" not in request.files:
-            return render_template("tiktok/error.html",
-                                 error="No file uploaded",
-                                 message="Please select a file to upload.")
-
-        file = request.files["file"]
-
-        if file.filename == '':
-            return render_template("tiktok/error.html",
-                                 error="No file selected",
-                                 message="Please select a valid file.")
-
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(file)
-        elif file.filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file)
-        else:
-            return render_template("tiktok/error.html",
-                                 error="Invalid file format",
-                                 message="Please upload a CSV or Excel file.")
-
-        df.columns = df.columns.str.strip().str.upper()
-
-        if "LINK" not in df.columns or "NAME" not in df.columns:
-            return render_template("tiktok/error.html",
-                                 error="Missing required columns",
-                                 message="Your file must contain columns named 'NAME' and 'LINK'.")
-
-        results = []
-
-        for index, row in df.iterrows():
-            name = row["NAME"]
-            link = row["LINK"]
-
-            metrics = scrape_tiktok_post(link)
-            if not metrics or "error" in metrics:
-                results.append({
-                    "name": name,
-                    "link": link,
-                    "likes": "N/A",
-                    "comments": "N/A",
-                    "comment_list": []
-                })
-                continue
-
-            results.append({
-                "name": name,
-                "link": link,
-                "likes": metrics.get("likes", 0),
-                "comments": metrics.get("comments", 0),
-                "comment_list": metrics.get("comment_list", [])
-            })
-
-        return render_template("tiktok/results.html", results=results)
+        try:
+            rows = read_upload(request.files.get("file"), [VIDEO_ID_PATTERN])
+        except UploadError as e:
+            return render_template("tiktok/error.html", error=e.error, message=e.message)
+
+        # Streaming mode renders each row as soon as it is ready instead of queueing a job;
+        # it stops at BATCH_DEADLINE_SECONDS with a link to resume the remaining rows
+        if request.form.get("mode") == "stream":
+            return stream_batch("tiktok", rows)
+
+        job_id = submit_job("tiktok", rows)
+        return redirect(url_for("jobs.job_page", job_id=job_id))
 
     except Exception as e:
         return render_template("tiktok/error.html",
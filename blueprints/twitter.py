@@ -1,180 +1,248 @@
 """
 Twitter/X Blueprint - handles Twitter post analysis routes
 """
+import os
 import re
-import pandas as pd
-from flask import Blueprint, render_template, request
-from playwright.sync_api import sync_playwright
+from urllib.parse import unquote
+from flask import Blueprint, redirect, render_template, request, url_for
+from services.async_browser_pool import ASYNC_MODE, get_async_browser_pool
+from services.batch import iter_batch
+from services.browser_pool import get_browser_pool
+from services.capture import capture_json, capture_json_async
+from services.dom import extract, extract_async, open_page, open_page_async, read_page, read_page_async
+from services.ingest import UploadError, read_upload
+from services.jobs import register_handler, submit_job
+from services.metrics import instrumented
+from services.resilience import guarded
+from services.scraper_workers import offloaded
+from services.streaming import stream_batch
 
 # Create Blueprint
 twitter_bp = Blueprint('twitter', __name__, url_prefix='/twitter')
 
 
-def extract_tweet_id(url: str):
-    """Extract tweet ID from the post URL."""
-    match = re.search(r"status/(\d+)", url)
-    return match.group(1) if match else None
+TWEET_ID_PATTERN = re.compile(r"status/(\d+)")
 
+# Any of these means the tweet has rendered
+TWEET_READY_SELECTORS = ['article', '[data-testid="tweet"]', '[data-testid="like"]']
 
-def scrape_tweet(tweet_url):
-    """Scrape a public Twitter/X post using Playwright."""
-    with sync_playwright() as pw:
-        browser = pw.chromium.launch(
-            headless=True,
-            args=['--disable-blink-features=AutomationControlled', '--no-sandbox']
-        )
-        context = browser.new_context(
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        )
-        page = context.new_page()
-
-        try:
-            # Use domcontentloaded instead of networkidle for faster loading
-            page.goto(tweet_url, wait_until='domcontentloaded', timeout=15000)
-            
-            # Wait for main content with shorter timeout
-            page.wait_for_selector("article", timeout=8000, state='attached')
-            
-            # Extract metrics with timeout protection
-            likes = "0"
-            replies = "0"
-            retweets = "0"
-            views = "N/A"
-            
-            try:
-                likes_elem = page.locator('[data-testid="like"]').first
-                if likes_elem.count() > 0:
-                    likes = likes_elem.text_content(timeout=3000) or "0"
-            except:
-                pass
-
-            try:
-                replies_elem = page.locator('[data-testid="reply"]').first
-                if replies_elem.count() > 0:
-                    replies = replies_elem.text_content(timeout=3000) or "0"
-            except:
-                pass
+# "network" reads exact counts from the GraphQL responses the page fetches,
+# falling back to the rendered buttons; "dom" only reads the buttons
+TWITTER_EXTRACT = os.getenv("TWITTER_EXTRACT", "network").lower()
 
-            try:
-                retweets_elem = page.locator('[data-testid="retweet"]').first
-                if retweets_elem.count() > 0:
-                    retweets = retweets_elem.text_content(timeout=3000) or "0"
-            except:
-                pass
-
-            # Skip views to save time (often causes delays)
-            # try:
-            #     views_elem = page.locator("span:below(:text('Views'))").first
-            #     if views_elem.count() > 0:
-            #         views = views_elem.text_content(timeout=3000) or "N/A"
-            # except:
-            #     pass
-
-            comments = []
-            # Skip comment collection to save time, or limit heavily
-            # try:
-            #     comment_elements = page.locator('div[data-testid="tweetText"]')
-            #     count = min(comment_elements.count(), 5)  # Limit to 5 for speed
-            #     for i in range(count):
-            #         text = comment_elements.nth(i).text_content(timeout=2000)
-            #         if text:
-            #             comments.append(text)
-            # except:
-            #     pass
-
-            context.close()
-            browser.close()
-
-            return {
-                "likes": likes.strip() if likes else "0",
-                "replies": replies.strip() if replies else "0",
-                "retweets": retweets.strip() if retweets else "0",
-                "views": views,
-                "comments": comments
-            }
+# GraphQL operations carrying a tweet: TweetDetail (with replies) and, for
+# logged-out visitors, TweetResultByRestId
+TWEET_API_OPERATIONS = ("/TweetDetail", "/TweetResultByRestId")
 
-        except Exception as e:
-            try:
-                context.close()
-                browser.close()
-            except:
-                pass
-            return {"error": str(e)}
+# How long to wait for the GraphQL payload, then for the buttons if it never comes
+TWEET_CAPTURE_TIMEOUT_MS = 8000
+TWEET_FALLBACK_WAIT_MS = 3000
 
+# Reply texts kept from the payload
+COMMENT_LIMIT = 10
 
-@twitter_bp.route("/")
-def home():
-    return render_template("twitter/upload.html")
+TWEET_EXTRACT_JS = """
+return {
+    likes: firstText(['[data-testid="like"]', '[data-testid="unlike"]']),
+    replies: firstText(['[data-testid="reply"]']),
+    retweets: firstText(['[data-testid="retweet"]', '[data-testid="unretweet"]']),
+};
+"""
 
 
-@twitter_bp.route("/upload", methods=["POST"])
-def upload_file():
-    if "file" not in request.files:
-        return render_template("twitter/error.html",
-                             error="No file uploaded",
-                             message="Please select a file to upload.")
-
-    file = request.files["file"]
-    
-    if file.filename == '':
-        return render_template("twitter/error.html",
-                             error="No file selected",
-                             message="Please select a valid file.")
-
-    if not file.filename.endswith('.csv'):
-        return render_template("twitter/error.html",
-                             error="Invalid file format",
-                             message="Please upload a CSV file.")
-
-    df = pd.read_csv(file)
-
-    if "LINK" not in df.columns or "NAME" not in df.columns:
-        return render_template("twitter/error.html",
-                             error="Missing required columns",
-                             message="Your file must contain columns named 'NAME' and 'LINK'.")
-
-    results = []
-
-    for _, row in df.iterrows():
-        name = row["NAME"]
-        link = row["LINK"]
-
-        tweet_id = extract_tweet_id(str(link))
-
-        if not tweet_id:
-            results.append({
-                "name": name,
-                "link": link,
-                "likes": "N/A",
-                "replies": "N/A",
-                "retweets": "N/A",
-                "views": "N/A",
-                "comments": []
-            })
-            continue
+def extract_tweet_id(url: str):
+    """Extract tweet ID from the post URL."""
+    match = TWEET_ID_PATTERN.search(url)
+    return match.group(1) if match else None
 
-        metrics = scrape_tweet(link)
 
-        if "error" in metrics:
-            results.append({
-                "name": name,
-                "link": link,
+def _parse_tweet_page(found):
+    """Tweet metrics from the TWEET_EXTRACT_JS result (display strings such as "1.2K")."""
+    return {
+        "likes": found.get("likes") or "0",
+        "replies": found.get("replies") or "0",
+        "retweets": found.get("retweets") or "0",
+        "quotes": "N/A",
+        "views": "N/A",
+        "comments": [],
+        "source": "browser"
+    }
+
+
+def _api_matcher(tweet_id):
+    # The operation's variables (focalTweetId / tweetId) are in the query string
+    return lambda url: any(op in url for op in TWEET_API_OPERATIONS) and tweet_id in unquote(url)
+
+
+def _iter_tweets(node):
+    """Every tweet result object (one with rest_id and legacy) anywhere in a GraphQL payload."""
+    if isinstance(node, dict):
+        if "rest_id" in node and isinstance(node.get("legacy"), dict):
+            yield node
+        for value in node.values():
+            yield from _iter_tweets(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _iter_tweets(value)
+
+
+def _parse_tweet_api(payload, tweet_id):
+    """
+    Exact counts, views and reply texts for tweet_id from a TweetDetail or
+    TweetResultByRestId payload, or None if the tweet isn't in it.
+    """
+    tweet = None
+    replies = {}
+    for result in _iter_tweets(payload):
+        legacy = result["legacy"]
+        if result["rest_id"] == tweet_id and tweet is None:
+            tweet = result
+        elif legacy.get("in_reply_to_status_id_str") == tweet_id and result["rest_id"] not in replies:
+            replies[result["rest_id"]] = legacy.get("full_text", "")
+    if tweet is None:
+        return None
+
+    legacy = tweet["legacy"]
+    views = (tweet.get("views") or {}).get("count")
+    return {
+        "likes": int(legacy.get("favorite_count", 0)),
+        "replies": int(legacy.get("reply_count", 0)),
+        "retweets": int(legacy.get("retweet_count", 0)),
+        "quotes": int(legacy.get("quote_count", 0)),
+        "views": int(views) if views is not None else "N/A",
+        "comments": list(replies.values())[:COMMENT_LIMIT],
+        "source": "network"
+    }
+
+
+def _scrape_tweet_network(context, tweet_url, tweet_id):
+    """Capture the tweet's GraphQL payload; fall back to the rendered buttons on the same page."""
+    page = open_page(context)
+    try:
+        payload = capture_json(page, tweet_url, "twitter", _api_matcher(tweet_id), TWEET_CAPTURE_TIMEOUT_MS)
+        metrics = _parse_tweet_api(payload, tweet_id)
+        if metrics:
+            return metrics
+    except Exception:
+        # Navigation never committed: the reused page still shows the previous tweet
+        if tweet_id not in page.url:
+            raise
+    found = extract(page, "twitter", TWEET_READY_SELECTORS, TWEET_EXTRACT_JS,
+                    wait_timeout=TWEET_FALLBACK_WAIT_MS, wait_required=True)
+    return _parse_tweet_page(found)
+
+
+def _scrape_tweet_page(context, tweet_url):
+    """Read tweet metrics from a page opened in a pooled browser context."""
+    tweet_id = extract_tweet_id(tweet_url)
+    if TWITTER_EXTRACT == "network" and tweet_id:
+        return _scrape_tweet_network(context, tweet_url, tweet_id)
+
+    # The tweet has to render before there is anything to read
+    found = read_page(context, tweet_url, "twitter", TWEET_READY_SELECTORS, TWEET_EXTRACT_JS,
+                      wait_timeout=8000, wait_required=True)
+    return _parse_tweet_page(found)
+
+
+async def _scrape_tweet_async(tweet_url):
+    """_scrape_tweet_page on the async browser pool (SERVING_MODE=async)."""
+    tweet_id = extract_tweet_id(tweet_url)
+    async with get_async_browser_pool().context("twitter") as context:
+        if TWITTER_EXTRACT == "network" and tweet_id:
+            page = await open_page_async(context)
+            try:
+                payload = await capture_json_async(page, tweet_url, "twitter", _api_matcher(tweet_id),
+                                                   TWEET_CAPTURE_TIMEOUT_MS)
+                metrics = _parse_tweet_api(payload, tweet_id)
+                if metrics:
+                    return metrics
+            except Exception:
+                if tweet_id not in page.url:
+                    raise
+            found = await extract_async(page, "twitter", TWEET_READY_SELECTORS, TWEET_EXTRACT_JS,
+                                        wait_timeout=TWEET_FALLBACK_WAIT_MS, wait_required=True)
+        else:
+            found = await read_page_async(context, tweet_url, "twitter", TWEET_READY_SELECTORS, TWEET_EXTRACT_JS,
+                                          wait_timeout=8000, wait_required=True)
+    return _parse_tweet_page(found)
+
+
+@offloaded("twitter")
+def _scrape_tweet(tweet_url):
+    if ASYNC_MODE:
+        return get_async_browser_pool().run(_scrape_tweet_async(tweet_url))
+    return get_browser_pool().run(lambda context: _scrape_tweet_page(context, tweet_url), platform="twitter")
+
+
+@instrumented("twitter")
+def scrape_tweet(tweet_url):
+    """
+    Scrape a public Twitter/X post using the shared browser pool, behind the
+    platform's rate limiter, retries and circuit breaker.
+    In network mode (TWITTER_EXTRACT) counts are exact ints and views and
+    replies are included; the DOM fallback returns display strings.
+    Returns: {"likes", "replies", "retweets", "quotes", "views", "comments": [str..], "source": "network"|"browser"}
+    """
+    try:
+        return guarded("twitter", _scrape_tweet, tweet_url)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def iter_results(rows, deadline=None):
+    """Scrape uploaded rows and yield the rows for twitter/results.html in upload order."""
+    links = [row["link"] for row in rows]
+    # post_key is extracted at upload time; rows queued before that fall back to the regex
+    post_keys = [row.get("post_key") or extract_tweet_id(str(row["link"])) for row in rows]
+
+    # Rows without a tweet ID are skipped by the batch and reported as N/A
+    to_scrape = [link if post_key else None for link, post_key in zip(links, post_keys)]
+    scraped = iter_batch(to_scrape, scrape_tweet, "twitter", post_keys=post_keys, deadline=deadline)
+
+    for row, metrics in zip(rows, scraped):
+        if not metrics or "error" in metrics:
+            yield {
+                "name": row["name"],
+                "link": row["link"],
                 "likes": "N/A",
                 "replies": "N/A",
                 "retweets": "N/A",
                 "views": "N/A",
                 "comments": []
-            })
+            }
             continue
 
-        results.append({
-            "name": name,
-            "link": link,
+        yield {
+            "name": row["name"],
+            "link": row["link"],
             "likes": metrics.get("likes", "0"),
             "replies": metrics.get("replies", "0"),
             "retweets": metrics.get("retweets", "0"),
             "views": metrics.get("views", "N/A"),
             "comments": metrics.get("comments", [])
-            })
+        }
+
 
-    return render_template("twitter/results.html", results=results)
\ No newline at end of file
+# Background jobs and streamed uploads both run through iter_results
+register_handler("twitter", iter_results)
+
+
+@twitter_bp.route("/")
+def home():
+    return render_template("twitter/upload.html")
+
+
+@twitter_bp.route("/upload", methods=["POST"])
+def upload_file():
+    try:
+        rows = read_upload(request.files.get("file"), [TWEET_ID_PATTERN], allow_excel=False)
+    except UploadError as e:
+        return render_template("twitter/error.html", error=e.error, message=e.message)
+
+    # Streaming mode renders each row as soon as it is ready instead of queueing a job;
+    # it stops at BATCH_DEADLINE_SECONDS with a link to resume the remaining rows
+    if request.form.get("mode") == "stream":
+        return stream_batch("twitter", rows)
+
+    job_id = submit_job("twitter", rows)
+    return redirect(url_for("jobs.job_page", job_id=job_id))
\ No newline at end of file
@@ -0,0 +1,70 @@
+"""
+Gunicorn Config - worker settings for both serving modes
+
+SERVING_MODE=sync (default): one request per sync worker; scrapes run on the
+thread-per-browser pool (services/browser_pool.py).
+
+SERVING_MODE=async: threaded workers whose request threads only wait on the
+async browser pool (services/async_browser_pool.py), so one process keeps up
+to WEB_THREADS analyses in flight over BROWSER_POOL_SIZE browsers.
+
+Each worker launches its browsers in the background right after the fork
+(BROWSER_PREWARM=false to disable), so the first scrape doesn't pay for it.
+
+SCRAPER_WORKERS=auto|N: the master also starts the scraper worker supervisor
+(services/scraper_workers.py). Browsers then live only in those processes and
+web workers hand them scrapes, so nothing is prewarmed after the fork.
+"""
+import os
+import sys
+import subprocess
+
+SERVING_MODE = os.getenv("SERVING_MODE", "sync").lower()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "600"))
+
+if SERVING_MODE == "async":
+    worker_class = "gthread"
+    threads = int(os.getenv("WEB_THREADS", "32"))
+else:
+    worker_class = "sync"
+
+
+_scraper_supervisor = None
+
+
+def on_starting(server):
+    """Start the scraper worker supervisor next to the web workers when SCRAPER_WORKERS is set."""
+    global _scraper_supervisor
+    from services.scraper_workers import ENABLED
+
+    if ENABLED:
+        _scraper_supervisor = subprocess.Popen([sys.executable, "-m", "services.scraper_workers"])
+        server.log.info("Started scraper supervisor pid=%s", _scraper_supervisor.pid)
+
+
+def on_exit(server):
+    """Drain the scraper workers (in-flight scrapes finish) before the master exits."""
+    if _scraper_supervisor is not None and _scraper_supervisor.poll() is None:
+        _scraper_supervisor.terminate()
+        try:
+            _scraper_supervisor.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _scraper_supervisor.kill()
+
+
+def post_fork(server, worker):
+    """Start launching this worker's browsers while it imports the app."""
+    from services.browser_pool import BROWSER_PREWARM
+    from services.scraper_workers import ENABLED as SCRAPER_WORKERS_ENABLED
+
+    if not BROWSER_PREWARM or SCRAPER_WORKERS_ENABLED:
+        return
+    if SERVING_MODE == "async":
+        from services.async_browser_pool import get_async_browser_pool
+        get_async_browser_pool().prewarm()
+    else:
+        from services.browser_pool import get_browser_pool
+        get_browser_pool().prewarm()
@@ -0,0 +1,3 @@
+"""
+Services package - shared scraping infrastructure used by the app and blueprints
+"""
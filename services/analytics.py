@@ -0,0 +1,211 @@
+"""
+Analytics - columnar frames over a batch's result rows: counts normalized in
+one vectorized pass, then per-name aggregates, totals and top-N rankings
+
+pandas is imported on first use, like services.ingest, so it stays off the
+worker startup path.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from services.export import METRIC_COLUMNS, parse_counts
+from services.jobs import JOBS_DB, SCHEMA
+from services.results import RESULT_METRICS
+from services.storage import connect
+
+# Names and posts listed in rankings unless a caller asks for another top N
+ANALYTICS_TOP_N = int(os.getenv("ANALYTICS_TOP_N", "10"))
+
+# Summaries of finished jobs kept per worker (they never change once a job is done)
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "32"))
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def engagement_metrics(platform):
+    """Metrics summed into a row's engagement: every count on the results page but views."""
+    return [metric for metric in RESULT_METRICS.get(platform, []) if metric != "views"]
+
+
+def batch_frame(platform, results):
+    """
+    One row per result with name, link, status ("ok"/"error"), every metric as
+    Int64 counts, engagement and, where the platform reports views,
+    engagement_rate (engagement / views).
+    """
+    import pandas as pd
+
+    columns = ["name", "link"] + RESULT_METRICS.get(platform, [])
+    return _normalized(platform, pd.DataFrame.from_records(list(results), columns=columns))
+
+
+def _normalized(platform, raw):
+    import pandas as pd
+
+    metrics = RESULT_METRICS.get(platform, [])
+    frame = pd.DataFrame({"name": raw["name"].fillna(""), "link": raw["link"].fillna("")})
+    frame["platform"] = platform
+    frame.attrs["platform"] = platform
+
+    # Same rule as the export's status column: an unreadable metric (views aside) marks the row failed
+    failed = pd.Series(False, index=raw.index)
+    for metric in METRIC_COLUMNS.get(platform, []):
+        if metric != "views":
+            failed |= raw[metric].astype(object).eq("N/A")
+    frame["status"] = failed.map({True: "error", False: "ok"})
+
+    for metric in metrics:
+        frame[metric] = parse_counts(raw[metric]).set_axis(raw.index)
+
+    # Failed rows count as unknown rather than as a partial sum
+    engaged = engagement_metrics(platform)
+    frame["engagement"] = frame[engaged].sum(axis=1, min_count=1).astype("Int64").mask(failed)
+    if "views" in metrics:
+        views = frame["views"].where(frame["views"] > 0)
+        frame["engagement_rate"] = (frame["engagement"] / views).astype("Float64")
+    return frame
+
+
+def job_frame(job):
+    """batch_frame for a stored job, read column-wise from SQLite without decoding each row in Python."""
+    import pandas as pd
+
+    platform = job["platform"]
+    columns = ["name", "link"] + RESULT_METRICS.get(platform, [])
+    raw = pd.read_sql_query(
+        "SELECT " + ", ".join(f"json_extract(result, '$.{column}') AS {column}" for column in columns)
+        + " FROM job_rows WHERE job_id = ? ORDER BY idx",
+        connect(JOBS_DB, SCHEMA),
+        params=(job["id"],)
+    )
+    return _normalized(platform, raw)
+
+
+def _value(value):
+    # JSON-ready scalars: Int64/Float64 missing values become None
+    import pandas as pd
+
+    if value is None or value is pd.NA or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, float):
+        return round(value, 4)
+    return int(value) if not isinstance(value, str) else value
+
+
+def _metrics(frame):
+    return RESULT_METRICS.get(frame.attrs.get("platform"), [])
+
+
+def name_aggregates(frame):
+    """
+    Per-NAME aggregates, highest engagement first: posts, failed posts, the
+    sum of every metric, total and average engagement (and engagement rate
+    where views are known).
+    """
+    metrics = _metrics(frame)
+    grouped = frame.assign(failed=frame["status"].eq("error")).groupby("name", sort=False)
+
+    aggregates = grouped[metrics + ["engagement"]].sum(min_count=1)
+    aggregates.insert(0, "posts", grouped.size())
+    aggregates.insert(1, "failed", grouped["failed"].sum())
+    aggregates["avg_engagement"] = (aggregates["engagement"] / (aggregates["posts"] - aggregates["failed"])
+                                    .where(lambda ok: ok > 0)).round(2)
+    if "views" in metrics:
+        aggregates["engagement_rate"] = (aggregates["engagement"] / aggregates["views"].where(lambda v: v > 0)).round(4)
+
+    return (aggregates.sort_values(["engagement", "posts"], ascending=False, na_position="last")
+            .reset_index())
+
+
+def _records(frame):
+    return [{column: _value(value) for column, value in row.items()} for row in frame.to_dict("records")]
+
+
+def summarize(frame, top=ANALYTICS_TOP_N):
+    """
+    Totals, engagement and top-N rankings of one batch frame:
+    {"rows", "ok", "errors", "totals": {metric: n}, "engagement", "engagement_rate",
+     "top_names": [...], "top_posts": [...], "names": n}.
+    """
+    metrics = _metrics(frame)
+    errors = int(frame["status"].eq("error").sum())
+    engagement = _value(frame["engagement"].sum(min_count=1))
+    views = _value(frame["views"].sum(min_count=1)) if "views" in frame else None
+    by_name = name_aggregates(frame)
+    top_posts = frame.sort_values("engagement", ascending=False, na_position="last").head(top)
+
+    return {
+        "rows": len(frame),
+        "ok": len(frame) - errors,
+        "errors": errors,
+        "totals": {metric: _value(frame[metric].sum(min_count=1)) or 0 for metric in metrics},
+        "engagement": engagement or 0,
+        "engagement_rate": round(engagement / views, 4) if engagement and views else None,
+        "names": len(by_name),
+        "top_names": _records(by_name.head(top)),
+        "top_posts": _records(top_posts[["name", "link", "engagement"] + metrics]),
+    }
+
+
+def job_summary(job, top=ANALYTICS_TOP_N):
+    """summarize() for a stored job; finished jobs are cached per worker."""
+    if job["status"] != "done":
+        return {"job_id": job["id"], "platform": job["platform"], **summarize(job_frame(job), top)}
+
+    key = (job["id"], top)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    summary = {"job_id": job["id"], "platform": job["platform"], **summarize(job_frame(job), top)}
+    with _cache_lock:
+        _cache[key] = summary
+        while len(_cache) > ANALYTICS_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return summary
+
+
+def cross_platform_summary(jobs, top=ANALYTICS_TOP_N):
+    """
+    Combine batches from several platforms by NAME: totals and engagement per
+    platform, and the names with the most engagement across all of them.
+    """
+    import pandas as pd
+
+    frames = [job_frame(job) for job in jobs]
+    combined = pd.concat([frame[["name", "platform", "status", "engagement"]] for frame in frames],
+                         ignore_index=True) if frames else pd.DataFrame(columns=["name", "platform", "status", "engagement"])
+
+    per_platform = {}
+    for job, frame in zip(jobs, frames):
+        summary = summarize(frame, top=0)
+        current = per_platform.setdefault(job["platform"], {"rows": 0, "errors": 0, "engagement": 0, "totals": {}})
+        current["rows"] += summary["rows"]
+        current["errors"] += summary["errors"]
+        current["engagement"] += summary["engagement"]
+        for metric, value in summary["totals"].items():
+            current["totals"][metric] = current["totals"].get(metric, 0) + value
+
+    ranking = (combined.pivot_table(index="name", columns="platform", values="engagement",
+                                    aggfunc="sum", fill_value=0)
+               if len(combined) else pd.DataFrame())
+    names = []
+    if len(ranking):
+        ranking = ranking.astype("int64")
+        ranking["total"] = ranking.sum(axis=1)
+        posts = combined.groupby("name").size()
+        ranking = ranking.sort_values("total", ascending=False).head(top)
+        names = [{"name": name, "posts": int(posts[name]), "engagement": int(row["total"]),
+                  "by_platform": {platform: int(value) for platform, value in row.drop("total").items()}}
+                 for name, row in ranking.iterrows()]
+
+    return {
+        "jobs": [job["id"] for job in jobs],
+        "rows": len(combined),
+        "engagement": sum(current["engagement"] for current in per_platform.values()),
+        "platforms": per_platform,
+        "top_names": names,
+    }
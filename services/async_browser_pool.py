@@ -0,0 +1,373 @@
+"""
+Async Browser Pool - one asyncio event loop per worker process driving
+Playwright's async API, so dozens of scrapes share a few browsers
+"""
+import os
+import time
+import atexit
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+
+from services import metrics, page_profile
+from services.browser_pool import (BROWSER_ARGS, BROWSER_CONTEXT_IDLE_SECONDS, BROWSER_CONTEXT_MAX_PAGES,
+                                   BROWSER_MAX_RSS_MB, BROWSER_POOL_SIZE, BROWSER_RSS_CHECK_SECONDS,
+                                   DEFAULT_USER_AGENT, PLAYWRIGHT_MISSING, Lease, context_key, context_scope,
+                                   current_scope, processes_rss_mb)
+from services.http_fetch import HTTP_TIMEOUT
+from services.resilience import RetryableError
+
+# SERVING_MODE=async runs request threads against this pool instead of the
+# thread-per-browser pool (see gunicorn.conf.py)
+SERVING_MODE = os.getenv("SERVING_MODE", "sync").lower()
+ASYNC_MODE = SERVING_MODE == "async"
+
+# Pages open at once across every browser of the pool
+ASYNC_MAX_PAGES = max(1, int(os.getenv("ASYNC_MAX_PAGES", "24")))
+
+logger = logging.getLogger(__name__)
+
+HTTP_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+
+async def _browser_rss_mb(browser):
+    # browser_pool.browser_rss_mb for playwright.async_api browsers
+    try:
+        session = await browser.new_browser_cdp_session()
+        try:
+            info = await session.send("SystemInfo.getProcessInfo")
+        finally:
+            await session.detach()
+    except Exception:
+        return None
+    return processes_rss_mb(process["id"] for process in info.get("processInfo", []))
+
+
+class AsyncBrowserPool:
+    """
+    Runs an event loop on a background thread and multiplexes up to
+    ASYNC_MAX_PAGES concurrent browser contexts over BROWSER_POOL_SIZE
+    Chromium instances. Request threads hand it coroutines with run().
+
+    A released context is kept for the next scrape of the same batch (see
+    browser_pool.run_in_scope) with the same platform and options, up to BROWSER_CONTEXT_MAX_PAGES scrapes. A browser whose
+    memory passes BROWSER_MAX_RSS_MB stops getting scrapes and closes once
+    the ones it is running have finished.
+
+    It also owns a Playwright APIRequestContext, an async keep-alive HTTP
+    client for the fast path that needs no browser.
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE, max_pages=ASYNC_MAX_PAGES):
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self.launches = 0
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the event loop thread (again after a fork, since threads don't survive it)."""
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="async-browser-pool", daemon=True)
+            self._thread.start()
+            asyncio.run_coroutine_threadsafe(self._setup(), self._loop).result()
+
+    async def _setup(self):
+        # Created on the loop they are used from
+        self._playwright = None
+        self._manager = None
+        self._http = None
+        self._browsers = [None] * self.size
+        self._next = 0
+        self._pages = asyncio.Semaphore(self.max_pages)
+        self._start_lock = asyncio.Lock()
+        self._launch_locks = [asyncio.Lock() for _ in range(self.size)]
+        # Released contexts waiting for reuse, most recently released last
+        self._idle = []
+        # Open contexts per browser, and browsers retired for memory until their last one closes
+        self._open = {}
+        self._retired = set()
+        self._checked_at = [0.0] * self.size
+        self._closing = set()
+
+    def prewarm(self):
+        """Launch every browser in the background instead of on the first scrapes."""
+        self.start()
+        asyncio.run_coroutine_threadsafe(self._prewarm(), self._loop)
+
+    async def _prewarm(self):
+        for _ in range(self.size):
+            try:
+                await self._browser("prewarm")
+            except Exception:
+                # Reported by the first scrape, which retries the launch
+                return
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the pool's event loop and wait for its result."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self._scoped(current_scope(), coro), self._loop).result(timeout=timeout)
+
+    @staticmethod
+    async def _scoped(scope, coro):
+        # The loop's task doesn't inherit the calling thread's context, so carry the batch
+        # scope over; the task has a context of its own, so setting it here leaks nowhere
+        context_scope.set(scope)
+        return await coro
+
+    def shutdown(self):
+        """Close every browser owned by this process and stop the loop."""
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None:
+                return
+            try:
+                asyncio.run_coroutine_threadsafe(self._close(), self._loop).result(timeout=10)
+            except Exception:
+                pass
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    async def _close(self):
+        for browser in self._browsers + list(self._retired):
+            if browser is not None:
+                try:
+                    await browser.close()
+                    metrics.pool_browsers.dec()
+                except Exception:
+                    pass
+        if self._http is not None:
+            await self._http.dispose()
+        if self._manager is not None:
+            await self._manager.__aexit__(None, None, None)
+
+    async def _started(self):
+        """The async Playwright driver, started on first use."""
+        if self._playwright is None:
+            async with self._start_lock:
+                if self._playwright is None:
+                    try:
+                        from playwright.async_api import async_playwright
+                    except ImportError:
+                        raise RuntimeError(PLAYWRIGHT_MISSING)
+                    self._manager = async_playwright()
+                    self._playwright = await self._manager.start()
+        return self._playwright
+
+    async def _browser(self, platform):
+        """Next browser round-robin, (re)launched if it crashed or was never started."""
+        slot = self._next % self.size
+        self._next += 1
+        async with self._launch_locks[slot]:
+            browser = self._browsers[slot]
+            if browser is None or not browser.is_connected():
+                playwright = await self._started()
+                self.launches += 1
+                metrics.browser_launches.inc()
+                with metrics.timed(platform, "browser_launch"):
+                    self._browsers[slot] = await playwright.chromium.launch(headless=True, args=BROWSER_ARGS)
+                if browser is None:
+                    metrics.pool_browsers.inc()
+            return slot, self._browsers[slot]
+
+    async def _new_context(self, platform, options):
+        """(slot, browser, context) of a new context on the next browser."""
+        slot, browser = await self._browser(platform)
+        try:
+            with metrics.timed(platform, "new_context"):
+                return slot, browser, await browser.new_context(**options)
+        except Exception:
+            # Browser died between the connection check and new_context; relaunch once
+            self._browsers[slot] = None
+            metrics.pool_browsers.dec()
+            slot, browser = await self._browser(platform)
+            with metrics.timed(platform, "new_context"):
+                return slot, browser, await browser.new_context(**options)
+
+    def _reusable(self, key):
+        """Take the most recently released context opened with the same options on a current browser."""
+        for i in range(len(self._idle) - 1, -1, -1):
+            lease = self._idle[i]
+            if lease.key != key:
+                continue
+            del self._idle[i]
+            if lease.browser is self._browsers[lease.slot] and lease.browser.is_connected():
+                return lease
+            # Its browser crashed; the context went with it
+            metrics.browser_recycles.labels("context", "crash").inc()
+        return None
+
+    async def _recycle(self, lease, reason=None):
+        if reason:
+            metrics.browser_recycles.labels("context", reason).inc()
+        try:
+            await lease.context.close()
+        except Exception:
+            pass
+
+    def _expire(self, lease, idle_since):
+        # Scheduled when a context is released; closes it if nothing reused it since
+        if lease.idle_since == idle_since and lease in self._idle:
+            self._idle.remove(lease)
+            task = asyncio.ensure_future(self._recycle(lease, "idle"))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    async def _release(self, lease, failed):
+        """Keep a context for the next scrape or close it, then check its browser's memory."""
+        browser = lease.browser
+        self._open[browser] -= 1
+        if failed:
+            # It may be left mid-navigation
+            await self._recycle(lease, "error")
+        elif lease.key[0] is None:
+            # A scrape outside any batch keeps nothing for the next one
+            await self._recycle(lease)
+        elif lease.pages >= BROWSER_CONTEXT_MAX_PAGES:
+            await self._recycle(lease, "pages")
+        elif browser is not self._browsers[lease.slot] or not browser.is_connected():
+            await self._recycle(lease, "memory" if browser in self._retired else "crash")
+        else:
+            lease.idle_since = time.monotonic()
+            self._idle.append(lease)
+            self._loop.call_later(BROWSER_CONTEXT_IDLE_SECONDS, self._expire, lease, lease.idle_since)
+
+        if browser in self._retired or browser is not self._browsers[lease.slot]:
+            if not self._open[browser]:
+                await self._close_browser(browser)
+        elif (BROWSER_MAX_RSS_MB > 0
+              and time.monotonic() - self._checked_at[lease.slot] >= BROWSER_RSS_CHECK_SECONDS):
+            self._checked_at[lease.slot] = time.monotonic()
+            rss = await _browser_rss_mb(browser)
+            if rss is not None and rss > BROWSER_MAX_RSS_MB:
+                await self._retire(lease.slot, browser, rss)
+
+    async def _retire(self, slot, browser, rss_mb):
+        """
+        Take a browser whose processes use more than BROWSER_MAX_RSS_MB out of
+        rotation. New scrapes launch its replacement; it closes after the last
+        scrape still running on it.
+        """
+        async with self._launch_locks[slot]:
+            if self._browsers[slot] is not browser:
+                return
+            self._browsers[slot] = None
+        logger.info("browser restart reason=memory rss_mb=%d limit_mb=%d", rss_mb, BROWSER_MAX_RSS_MB)
+        metrics.browser_recycles.labels("browser", "memory").inc()
+        self._retired.add(browser)
+        for lease in [lease for lease in self._idle if lease.browser is browser]:
+            self._idle.remove(lease)
+            await self._recycle(lease, "memory")
+        if not self._open.get(browser):
+            await self._close_browser(browser)
+
+    async def _close_browser(self, browser):
+        self._open.pop(browser, None)
+        if browser not in self._retired:
+            # Crashed and already replaced (and uncounted) by _browser/_new_context
+            return
+        self._retired.discard(browser)
+        try:
+            await browser.close()
+        except Exception:
+            pass
+        metrics.pool_browsers.dec()
+
+    @asynccontextmanager
+    async def context(self, platform=None, **context_options):
+        """
+        A browser context with the platform's page profile applied: one kept
+        from an earlier scrape with the same options, or a new one. Waits while
+        ASYNC_MAX_PAGES scrapes are already running.
+        """
+        profile = page_profile.get_profile(platform) if platform else None
+        options = {"user_agent": DEFAULT_USER_AGENT}
+        if profile:
+            options.update(page_profile.context_options(profile))
+        options.update(context_options)
+        platform = platform or "unknown"
+
+        queued_at = time.perf_counter()
+        metrics.pool_queued.inc()
+        try:
+            await self._pages.acquire()
+        finally:
+            metrics.pool_queued.dec()
+        metrics.stage_seconds.labels(platform, "queue_wait").observe(time.perf_counter() - queued_at)
+
+        key = context_key(platform, options, current_scope())
+        lease = None
+        failed = False
+        metrics.pool_busy.inc()
+        try:
+            lease = self._reusable(key)
+            if lease is None:
+                slot, browser, context = await self._new_context(platform, options)
+                lease = Lease(key, context, browser=browser, slot=slot)
+            self._open[lease.browser] = self._open.get(lease.browser, 0) + 1
+            if lease.pages == 0 and profile:
+                lease.stats = await page_profile.apply_profile_async(lease.context, profile)
+            elif lease.stats is not None:
+                lease.stats.restart()
+            lease.pages += 1
+            yield lease.context
+            if lease.stats is not None:
+                lease.stats.finish()
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            metrics.pool_busy.dec()
+            self._pages.release()
+            if lease is not None:
+                await self._release(lease, failed)
+
+    async def fetch_html(self, url):
+        """
+        Async counterpart of services.http_fetch.fetch_html: the page's HTML,
+        or None on any error or non-HTML response. Raises RetryableError on HTTP 429.
+        """
+        try:
+            if self._http is None:
+                playwright = await self._started()
+                async with self._start_lock:
+                    if self._http is None:
+                        self._http = await playwright.request.new_context(
+                            user_agent=DEFAULT_USER_AGENT, extra_http_headers=HTTP_HEADERS
+                        )
+            res = await self._http.get(url, timeout=HTTP_TIMEOUT * 1000)
+        except Exception:
+            return None
+
+        if res.status == 429:
+            raise RetryableError(f"HTTP 429 Too Many Requests: {url}")
+        if res.status != 200 or "html" not in res.headers.get("content-type", "html"):
+            return None
+        try:
+            return await res.text()
+        except Exception:
+            return None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_async_browser_pool():
+    """Return the async browser pool for this worker process, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = AsyncBrowserPool()
+            atexit.register(_pool.shutdown)
+    return _pool
@@ -0,0 +1,132 @@
+"""
+Batch Scraper - bounded-concurrency scraping for spreadsheet uploads
+"""
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from services.async_browser_pool import ASYNC_MAX_PAGES, ASYNC_MODE
+from services.browser_pool import BROWSER_POOL_SIZE, run_in_scope
+from services.cache import cached_scrape
+from services.canonical import canonical_key, needs_resolution
+
+# Platforms not listed here default to one scrape per pooled browser, or to
+# ASYNC_MAX_PAGES when the async pool multiplexes pages over the browsers
+DEFAULT_CONCURRENCY = {
+    "facebook": 5,
+}
+
+
+class DeadlineExceeded(Exception):
+    """A batch ran out of its time budget before every link was scraped."""
+
+
+def get_concurrency(platform):
+    """Max scrapes in flight for a platform, e.g. TWITTER_BATCH_CONCURRENCY=4."""
+    default = DEFAULT_CONCURRENCY.get(platform, ASYNC_MAX_PAGES if ASYNC_MODE else BROWSER_POOL_SIZE)
+    return max(1, int(os.getenv(f"{platform.upper()}_BATCH_CONCURRENCY", default)))
+
+
+def _safe_scrape(scrape_func, link, platform, use_cache):
+    if link is None:
+        return None
+    try:
+        if use_cache:
+            return cached_scrape(link, scrape_func, platform)
+        return scrape_func(link)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _dedup_key(link, post_key, platform):
+    if link is None:
+        return None
+    if post_key:
+        return f"{platform}:{post_key}"
+    return canonical_key(link, platform)
+
+
+def _wait(future, deadline):
+    if deadline is None:
+        return future.result()
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        raise DeadlineExceeded("Batch time budget exhausted")
+
+
+def iter_batch(links, scrape_func, platform, concurrency=None, use_cache=True, post_keys=None, deadline=None):
+    """
+    Scrape links with at most `concurrency` scrapes in flight and yield
+    each result in the same order as links.
+    Links pointing at the same post (see services/canonical.py) are scraped
+    once and the result is fanned out to every matching row. post_keys, when
+    given, are post IDs already extracted at upload time (see
+    services/ingest.py); links without one are canonicalized here, short
+    links that need a redirect lookup in the background.
+    None entries are not scraped and yield None. Results go through the
+    shared scrape cache unless use_cache is False.
+    deadline (a time.monotonic() value) bounds the wait for each key and result:
+    past it DeadlineExceeded is raised and scrapes not yet started are
+    dropped; running ones finish in the background and land in the cache.
+    """
+    links = list(links)
+    post_keys = post_keys if post_keys is not None else [None] * len(links)
+
+    # Keys needing a redirect lookup (short TikTok links) are resolved on their
+    # own threads, so rows ahead of them start scraping right away
+    keys = [None] * len(links)
+    resolving = {}
+    for i, (link, post_key) in enumerate(zip(links, post_keys)):
+        if link is not None and not post_key and needs_resolution(link, platform):
+            resolving[i] = link
+        else:
+            keys[i] = _dedup_key(link, post_key, platform)
+
+    pending = len({key for key in keys if key is not None}) + len(resolving)
+    if not pending:
+        yield from (None for _ in links)
+        return
+
+    workers = min(concurrency or get_concurrency(platform), pending)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{platform}-batch")
+    resolver = (ThreadPoolExecutor(max_workers=min(workers, len(resolving)), thread_name_prefix=f"{platform}-resolve")
+                if resolving else None)
+    futures = {}
+    lock = threading.Lock()
+    # Browser contexts are reused between this batch's rows only
+    scope = uuid.uuid4().hex
+
+    def start(key, link):
+        # The first row with a key scrapes it; later rows share its future
+        with lock:
+            if key not in futures:
+                futures[key] = executor.submit(run_in_scope, scope, _safe_scrape, scrape_func, link, platform, use_cache)
+            return futures[key]
+
+    def start_resolved(future, link):
+        try:
+            start(future.result(), link)
+        except Exception:
+            # Cancelled, or the batch is already shut down; the row's own wait reports it
+            pass
+
+    try:
+        for key, link in zip(keys, links):
+            if key is not None:
+                start(key, link)
+        for i, link in resolving.items():
+            resolving[i] = resolver.submit(_dedup_key, link, None, platform)
+            resolving[i].add_done_callback(lambda future, link=link: start_resolved(future, link))
+
+        for i, (key, link) in enumerate(zip(keys, links)):
+            if i in resolving:
+                key = _wait(resolving[i], deadline)
+            yield _wait(start(key, link), deadline) if key is not None else None
+    finally:
+        # Doesn't block: after a deadline or an abandoned stream, queued scrapes are dropped
+        executor.shutdown(wait=False, cancel_futures=True)
+        if resolver is not None:
+            resolver.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,344 @@
+"""
+Browser Pool - process-wide Playwright Chromium pool shared by all scrapers
+"""
+import os
+import atexit
+import queue
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import Future
+
+from services import metrics, page_profile
+
+logger = logging.getLogger(__name__)
+
+# Number of Chromium instances kept alive per worker process
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+
+BROWSER_ARGS = ["--no-sandbox", "--disable-blink-features=AutomationControlled"]
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+# Launch every pooled browser as soon as a worker starts (see gunicorn.conf.py post_fork)
+BROWSER_PREWARM = os.getenv("BROWSER_PREWARM", "true").lower() in ("1", "true", "yes")
+
+# Scrapes served by one browser context (and the page in it) before the context
+# is closed and replaced; 1 gives every scrape a fresh context
+BROWSER_CONTEXT_MAX_PAGES = max(1, int(os.getenv("BROWSER_CONTEXT_MAX_PAGES", "50")))
+
+# Seconds a kept context may sit unused before it is closed
+BROWSER_CONTEXT_IDLE_SECONDS = float(os.getenv("BROWSER_CONTEXT_IDLE_SECONDS", "30"))
+
+# Resident memory (MB) of one browser's processes, renderers included, above
+# which it is restarted between scrapes (0 disables the check)
+BROWSER_MAX_RSS_MB = float(os.getenv("BROWSER_MAX_RSS_MB", "500"))
+
+# Minimum seconds between two memory checks of the same browser
+BROWSER_RSS_CHECK_SECONDS = 5
+
+PLAYWRIGHT_MISSING = "Playwright missing. Run: pip install playwright && playwright install chromium"
+
+
+# Scrapes only share a browser context (cookies, storage, cache) within one
+# scope, e.g. one batch; outside any scope each scrape gets a fresh context
+context_scope = contextvars.ContextVar("browser_context_scope", default=None)
+
+
+def current_scope():
+    return context_scope.get()
+
+
+def run_in_scope(scope, fn, *args, **kwargs):
+    """Call fn with scrapes it starts on this thread reusing contexts only within `scope`."""
+    token = context_scope.set(scope)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        context_scope.reset(token)
+
+
+def context_key(platform, options, scope=None):
+    """Scrapes can share a kept context only if it was opened in the same scope for the same platform and options."""
+    return scope, platform, repr(sorted(options.items()))
+
+
+def processes_rss_mb(pids):
+    """Summed resident memory of pids in MB, from /proc; None where /proc can't be read."""
+    total_kb = 0
+    try:
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            total_kb += int(line.split()[1])
+                            break
+            except FileNotFoundError:
+                continue
+    except (OSError, ValueError):
+        return None
+    return total_kb / 1024
+
+
+def browser_rss_mb(browser):
+    """Resident memory of a Chromium browser's processes (browser, GPU, renderers) in MB, or None if unknown."""
+    try:
+        session = browser.new_browser_cdp_session()
+        try:
+            info = session.send("SystemInfo.getProcessInfo")
+        finally:
+            session.detach()
+    except Exception:
+        return None
+    return processes_rss_mb(process["id"] for process in info.get("processInfo", []))
+
+
+class Lease:
+    """A browser context kept open between scrapes, with its profile stats and use count."""
+
+    def __init__(self, key, context, stats=None, browser=None, slot=None):
+        self.key = key
+        self.context = context
+        self.stats = stats
+        self.browser = browser
+        self.slot = slot
+        self.pages = 0
+        self.idle_since = None
+
+
+class BrowserPool:
+    """
+    Keeps a fixed number of Chromium browsers alive for the lifetime of the
+    worker process. Consecutive scrapes of one batch (see run_in_scope) with
+    the same platform and options reuse one browser context and its page, up
+    to BROWSER_CONTEXT_MAX_PAGES;
+    a browser whose memory passes BROWSER_MAX_RSS_MB is restarted. Both
+    happen between scrapes, so neither interrupts one.
+
+    Playwright's sync API is bound to the thread that started it, so each
+    browser lives on its own thread and scrape jobs reach it through a queue.
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE):
+        self.size = max(1, size)
+        self.launches = 0
+        self._tasks = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._pid = None
+        self._prewarm = False
+
+    def start(self):
+        """Start the browser threads (again after a fork, since threads don't survive it)."""
+        with self._lock:
+            if self._pid == os.getpid() and self._threads:
+                return
+            self._pid = os.getpid()
+            self._tasks = queue.Queue()
+            self._threads = []
+            for i in range(self.size):
+                thread = threading.Thread(target=self._worker, name=f"browser-pool-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def prewarm(self):
+        """
+        Start the browser threads and have each launch its browser right away
+        instead of on its first scrape. Returns without waiting for the launches.
+        """
+        self._prewarm = True
+        self.start()
+
+    def submit(self, fn, platform=None, **context_options):
+        """
+        Queue fn(context) to run on a pooled browser.
+        When a platform is given, its page profile (resource blocking,
+        JavaScript on/off) is applied to the context.
+        Returns a Future resolving to fn's return value.
+        """
+        self.start()
+        profile = page_profile.get_profile(platform) if platform else None
+        options = {"user_agent": DEFAULT_USER_AGENT}
+        if profile:
+            options.update(page_profile.context_options(profile))
+        options.update(context_options)
+        future = Future()
+        metrics.pool_queued.inc()
+        self._tasks.put((fn, options, profile, platform or "unknown", current_scope(), time.perf_counter(), future))
+        return future
+
+    def run(self, fn, timeout=None, platform=None, **context_options):
+        """Run fn(context) on a pooled browser and wait for the result."""
+        return self.submit(fn, platform, **context_options).result(timeout=timeout)
+
+    def shutdown(self):
+        """Close every browser owned by this process."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            for _ in self._threads:
+                self._tasks.put(None)
+            for thread in self._threads:
+                thread.join(timeout=10)
+            self._threads = []
+
+    def _launch(self, playwright, browser, platform):
+        """Launch a browser, replacing `browser` (None on the thread's first launch)."""
+        self.launches += 1
+        metrics.browser_launches.inc()
+        with metrics.timed(platform, "browser_launch"):
+            launched = playwright.chromium.launch(headless=True, args=BROWSER_ARGS)
+        if browser is None:
+            metrics.pool_browsers.inc()
+        return launched
+
+    def _new_context(self, playwright, browser, options, platform):
+        """Open a context, relaunching the browser if it crashed or was closed."""
+        if browser is None or not browser.is_connected():
+            browser = self._launch(playwright, browser, platform)
+        try:
+            with metrics.timed(platform, "new_context"):
+                return browser, browser.new_context(**options)
+        except Exception:
+            browser = self._launch(playwright, browser, platform)
+            with metrics.timed(platform, "new_context"):
+                return browser, browser.new_context(**options)
+
+    def _recycle(self, lease, reason=None):
+        """Close a kept context (counted under reason, if any); the next scrape opens a fresh one."""
+        if reason:
+            metrics.browser_recycles.labels("context", reason).inc()
+        try:
+            lease.context.close()
+        except Exception:
+            pass
+
+    def _restart(self, playwright, browser, rss_mb):
+        """Replace a browser whose processes use more than BROWSER_MAX_RSS_MB."""
+        logger.info("browser restart reason=memory rss_mb=%d limit_mb=%d", rss_mb, BROWSER_MAX_RSS_MB)
+        metrics.browser_recycles.labels("browser", "memory").inc()
+        try:
+            browser.close()
+        except Exception:
+            pass
+        try:
+            return self._launch(playwright, browser, "recycle")
+        except Exception:
+            # The next scrape sees the closed browser and retries the launch
+            return browser
+
+    def _worker(self):
+        tasks = self._tasks
+        playwright = None
+        startup_error = None
+        try:
+            from playwright.sync_api import sync_playwright
+            manager = sync_playwright()
+            playwright = manager.start()
+        except ImportError:
+            startup_error = RuntimeError(PLAYWRIGHT_MISSING)
+        except Exception as e:
+            startup_error = e
+
+        browser = None
+        if self._prewarm and startup_error is None:
+            try:
+                browser = self._launch(playwright, None, "prewarm")
+            except Exception:
+                # Reported by the first scrape, which retries the launch
+                pass
+
+        lease = None
+        checked_at = time.monotonic()
+        while True:
+            try:
+                task = tasks.get(timeout=BROWSER_CONTEXT_IDLE_SECONDS if lease is not None else None)
+            except queue.Empty:
+                # Give the kept page's memory back while there is nothing to reuse it for
+                self._recycle(lease, "idle")
+                lease = None
+                continue
+            if task is None:
+                break
+
+            fn, options, profile, platform, scope, queued_at, future = task
+            metrics.pool_queued.dec()
+            metrics.stage_seconds.labels(platform, "queue_wait").observe(time.perf_counter() - queued_at)
+            if not future.set_running_or_notify_cancel():
+                continue
+            if startup_error is not None:
+                future.set_exception(startup_error)
+                continue
+
+            key = context_key(platform, options, scope)
+            failed = False
+            metrics.pool_busy.inc()
+            try:
+                if lease is not None and not browser.is_connected():
+                    self._recycle(lease, "crash")
+                    lease = None
+                elif lease is not None and lease.key != key:
+                    # Another batch's scrape never sees this one's cookies or storage
+                    self._recycle(lease, "scope" if lease.key[0] != scope else "options")
+                    lease = None
+                if lease is None:
+                    browser, context = self._new_context(playwright, browser, options, platform)
+                    lease = Lease(key, context)
+                    if profile:
+                        lease.stats = page_profile.apply_profile(context, profile)
+                elif lease.stats is not None:
+                    lease.stats.restart()
+                lease.pages += 1
+                result = fn(lease.context)
+                if lease.stats is not None:
+                    lease.stats.finish()
+                future.set_result(result)
+            except Exception as e:
+                failed = True
+                future.set_exception(e)
+            finally:
+                metrics.pool_busy.dec()
+
+            # Nothing is in flight on this browser between two tasks, so both recycles are safe here.
+            # A context that raised may be left mid-navigation and is never reused.
+            if lease is not None and scope is None:
+                # A scrape outside any batch keeps nothing for the next one
+                self._recycle(lease)
+                lease = None
+            elif lease is not None and (failed or lease.pages >= BROWSER_CONTEXT_MAX_PAGES):
+                self._recycle(lease, "error" if failed else "pages")
+                lease = None
+            if (BROWSER_MAX_RSS_MB > 0 and browser is not None
+                    and time.monotonic() - checked_at >= BROWSER_RSS_CHECK_SECONDS):
+                checked_at = time.monotonic()
+                rss = browser_rss_mb(browser) if browser.is_connected() else None
+                if rss is not None and rss > BROWSER_MAX_RSS_MB:
+                    if lease is not None:
+                        self._recycle(lease, "memory")
+                        lease = None
+                    browser = self._restart(playwright, browser, rss)
+
+        if playwright is not None:
+            try:
+                if browser is not None:
+                    browser.close()
+                    metrics.pool_browsers.dec()
+                manager.__exit__(None, None, None)
+            except Exception:
+                pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """Return the browser pool for this worker process, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.shutdown)
+    return _pool
@@ -0,0 +1,164 @@
+"""
+Scrape Cache - SQLite cache shared by every worker process, with per-platform
+TTLs, LRU eviction by size and stale-while-revalidate
+"""
+import os
+import json
+import time
+import threading
+from hashlib import md5
+from concurrent.futures import ThreadPoolExecutor
+
+from services import history, metrics, singleflight
+from services.canonical import canonical_key
+from services.storage import connect
+
+CACHE_DB = "cache.sqlite3"
+
+ENABLE_SCRAPE_CACHE = os.getenv("ENABLE_SCRAPE_CACHE", "true").lower() in ("1", "true", "yes")
+
+# Seconds a result is served as fresh, per platform (override with CACHE_TTL_<PLATFORM>)
+DEFAULT_TTLS = {
+    "twitter": 900,
+    "instagram": 1800,
+    "tiktok": 1800,
+    "facebook": 600,
+}
+
+# After the TTL, a result is still served for this long while it is re-scraped in the background
+CACHE_STALE_SECONDS = int(os.getenv("CACHE_STALE_SECONDS", "3600"))
+
+# Least recently used entries are evicted once the cache grows past this size
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    platform TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_lru ON cache (accessed_at);
+"""
+
+_refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def _db():
+    return connect(CACHE_DB, SCHEMA)
+
+
+def get_ttl(platform):
+    return int(os.getenv(f"CACHE_TTL_{platform.upper()}", DEFAULT_TTLS.get(platform, 900)))
+
+
+def url_key(platform, url):
+    """Cache key for a scraped URL, shared by every link form of the same post."""
+    return f"{platform}:{md5(canonical_key(url, platform).encode()).hexdigest()}"
+
+
+def lookup(key, platform):
+    """
+    Return (value, state) where state is "fresh" or "stale", or (None, None)
+    when the key is missing or too old to serve.
+    """
+    row = _db().execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        metrics.cache_lookups.labels(platform, "miss").inc()
+        return None, None
+
+    now = time.time()
+    age = now - row["created_at"]
+    ttl = get_ttl(platform)
+    if age > ttl + CACHE_STALE_SECONDS:
+        metrics.cache_lookups.labels(platform, "miss").inc()
+        return None, None
+
+    _db().execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+    state = "fresh" if age <= ttl else "stale"
+    metrics.cache_lookups.labels(platform, state).inc()
+    return json.loads(row["value"]), state
+
+
+def store(key, platform, value):
+    """Cache a successful result and evict LRU entries past CACHE_MAX_BYTES."""
+    payload = json.dumps(value, default=str)
+    now = time.time()
+    conn = _db()
+    conn.execute(
+        "INSERT OR REPLACE INTO cache (key, platform, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (key, platform, payload, len(payload), now, now)
+    )
+    _evict(conn)
+
+
+def _evict(conn):
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+    if total <= CACHE_MAX_BYTES:
+        return
+
+    # Drop the least recently used entries until we are 10% under the limit
+    target = total - int(CACHE_MAX_BYTES * 0.9)
+    freed = 0
+    victims = []
+    for row in conn.execute("SELECT key, size FROM cache ORDER BY accessed_at"):
+        victims.append((row["key"],))
+        freed += row["size"]
+        if freed >= target:
+            break
+    conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+
+
+def _scrape(url, scrape_func, platform):
+    # Every fresh scrape is also a snapshot in the engagement history
+    result = scrape_func(url)
+    history.record_snapshot(platform, url, result)
+    return result
+
+
+def _scrape_and_store(key, url, scrape_func, platform):
+    result = _scrape(url, scrape_func, platform)
+    if result and "error" not in result:
+        store(key, platform, result)
+    return result
+
+
+def _refresh(key, url, scrape_func, platform):
+    try:
+        singleflight.do(key, lambda: _scrape_and_store(key, url, scrape_func, platform), platform)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+
+
+def _refresh_in_background(key, url, scrape_func, platform):
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    _refresher.submit(_refresh, key, url, scrape_func, platform)
+
+
+def cached_scrape(url, scrape_func, platform):
+    """
+    Return scrape_func(url), served from the shared cache when possible.
+    Stale results are returned immediately and refreshed in the background.
+    Only successful results are cached, and every fresh scrape is recorded in
+    the engagement history. Concurrent misses for the same post,
+    in any worker, share a single scrape (see services/singleflight.py).
+    """
+    key = url_key(platform, url)
+    if not ENABLE_SCRAPE_CACHE:
+        return singleflight.do(key, lambda: _scrape(url, scrape_func, platform), platform)
+
+    value, state = lookup(key, platform)
+    if state == "stale":
+        _refresh_in_background(key, url, scrape_func, platform)
+    if value is not None:
+        return value
+
+    return singleflight.do(key, lambda: _scrape_and_store(key, url, scrape_func, platform), platform)
@@ -0,0 +1,90 @@
+"""
+Canonical Links - map any supported post URL to a (platform, post key) pair so
+the same post is scraped and cached once, whatever form the link takes
+"""
+import re
+from functools import lru_cache
+
+from services.http_fetch import session, HTTP_TIMEOUT
+
+SHORT_TIKTOK_LINK = re.compile(r'(?:vm|vt)\.tiktok\.com/(\w+)')
+
+
+def detect_platform(link):
+    """Platform name for a post link, or None if unsupported."""
+    if "twitter.com" in link or "x.com" in link:
+        return "twitter"
+    if "facebook.com" in link or "fb.watch" in link:
+        return "facebook"
+    if "instagram.com" in link:
+        return "instagram"
+    if "tiktok.com" in link:
+        return "tiktok"
+    return None
+
+
+def needs_resolution(link, platform=None):
+    """True when canonicalizing link costs a network round trip (vm./vt.tiktok.com short links)."""
+    link = str(link)
+    return (platform or detect_platform(link)) == "tiktok" and SHORT_TIKTOK_LINK.search(link) is not None
+
+
+@lru_cache(maxsize=4096)
+def _resolve_short_tiktok(link):
+    """Follow a vm./vt.tiktok.com redirect to the full video URL (None on failure)."""
+    try:
+        url = link if "://" in link else f"https://{link}"
+        res = session.head(url, allow_redirects=False, timeout=HTTP_TIMEOUT)
+        return res.headers.get("Location")
+    except Exception:
+        return None
+
+
+def _post_key(platform, link):
+    # Imported here: the blueprints import the services package themselves
+    if platform == "twitter":
+        from blueprints.twitter import extract_tweet_id
+        return extract_tweet_id(link)
+
+    if platform == "facebook":
+        from blueprints.facebook import extract_post_id, clean_facebook_url
+        if link.isdigit():
+            return link
+        return extract_post_id(link) or extract_post_id(clean_facebook_url(link))
+
+    if platform == "instagram":
+        from blueprints.instagram import extract_post_id
+        return extract_post_id(link)
+
+    if platform == "tiktok":
+        from blueprints.tiktok import extract_video_id
+        short = SHORT_TIKTOK_LINK.search(link)
+        if short:
+            resolved = _resolve_short_tiktok(link.split('?')[0])
+            return (resolved and extract_video_id(resolved)) or f"short-{short.group(1)}"
+        return extract_video_id(link)
+
+    return None
+
+
+def canonicalize(link, platform=None):
+    """
+    Map a post link to (platform, post_key).
+    post_key is None when the link doesn't contain a recognisable post.
+    """
+    link = str(link).strip()
+    platform = platform or detect_platform(link)
+    if platform is None:
+        return None, None
+    return platform, _post_key(platform, link)
+
+
+def canonical_key(link, platform=None):
+    """
+    Stable dedup/cache key for a link: "platform:post_key", falling back to
+    the trimmed raw link when no post key can be extracted.
+    """
+    platform, post_key = canonicalize(link, platform)
+    if post_key:
+        return f"{platform}:{post_key}"
+    return f"{platform or 'unknown'}:{str(link).strip()}"
@@ -0,0 +1,40 @@
+"""
+Response Capture - read a platform's own JSON API responses off Playwright's
+network events instead of waiting for the page to render them
+"""
+from services.dom import GOTO_TIMEOUT_MS
+from services.metrics import timed
+
+
+def _matcher(matches):
+    def predicate(response):
+        return response.request.resource_type in ("xhr", "fetch") and matches(response.url)
+    return predicate
+
+
+def capture_json(page, url, platform, matches, timeout):
+    """
+    Open url and return the parsed body of the first XHR/fetch response for
+    which matches(response_url) is true, as soon as it arrives; the page is
+    not waited on past navigation commit. Raises Playwright's TimeoutError
+    when no such response arrives within timeout ms.
+    """
+    # "capture" covers navigation through the payload's arrival
+    with timed(platform, "capture"):
+        with page.expect_response(_matcher(matches), timeout=timeout) as captured:
+            page.goto(url, wait_until="commit", timeout=GOTO_TIMEOUT_MS)
+        response = captured.value
+
+    with timed(platform, "extract"):
+        return response.json()
+
+
+async def capture_json_async(page, url, platform, matches, timeout):
+    """capture_json for playwright.async_api pages."""
+    with timed(platform, "capture"):
+        async with page.expect_response(_matcher(matches), timeout=timeout) as captured:
+            await page.goto(url, wait_until="commit", timeout=GOTO_TIMEOUT_MS)
+        response = await captured.value
+
+    with timed(platform, "extract"):
+        return await response.json()
@@ -0,0 +1,143 @@
+"""
+DOM Extraction - single-round-trip page reads for the Playwright scrapers,
+for both the sync and the async browser pool
+"""
+from services.metrics import timed
+
+# Navigation settings shared by every scraper
+GOTO_TIMEOUT_MS = 15000
+
+# Helpers available to every extraction script
+_JS_HELPERS = """
+const first = (selectors) => {
+    for (const selector of selectors) {
+        const node = document.querySelector(selector);
+        if (node) return node;
+    }
+    return null;
+};
+const firstText = (selectors) => {
+    const node = first(selectors);
+    return node ? node.textContent.trim() : null;
+};
+const attr = (selector, name) => {
+    const node = document.querySelector(selector);
+    return node ? node.getAttribute(name) : null;
+};
+const texts = (selector, limit) => Array.from(document.querySelectorAll(selector))
+    .slice(0, limit)
+    .map((node) => (node.innerText || node.textContent || "").trim())
+    .filter(Boolean);
+"""
+
+
+def open_page(context):
+    """
+    The page a pooled context kept from its previous scrape, or a new one.
+    Navigating it again skips a renderer startup per scrape.
+    """
+    pages = context.pages
+    return pages[0] if pages else context.new_page()
+
+
+def _blank(page):
+    try:
+        page.goto("about:blank")
+    except Exception:
+        pass
+
+
+async def _blank_async(page):
+    try:
+        await page.goto("about:blank")
+    except Exception:
+        pass
+
+
+def wait_for_any(page, selectors, timeout):
+    """
+    Wait until any one of `selectors` is attached. This is a single wait, so a
+    missing candidate doesn't cost its own timeout before the next is tried.
+    """
+    page.wait_for_selector(", ".join(selectors), state="attached", timeout=timeout)
+
+
+def evaluate(page, body, arg=None):
+    """
+    Run one extraction script in the page and return its result.
+    `body` is the inside of a function taking `arg`; it can use the helpers
+    first(selectors), firstText(selectors), attr(selector, name) and
+    texts(selector, limit).
+    """
+    return page.evaluate(_script(body), arg)
+
+
+def _script(body):
+    return f"(arg) => {{{_JS_HELPERS}\n{body}\n}}"
+
+
+def extract(page, platform, ready_selectors, extract_js, arg=None, wait_timeout=5000, wait_required=False):
+    """
+    Wait for any ready selector on an open page and return the result of
+    extract_js (see evaluate). A missed wait only raises when wait_required.
+    """
+    try:
+        with timed(platform, "wait_selector"):
+            wait_for_any(page, ready_selectors, wait_timeout)
+    except Exception:
+        if wait_required:
+            raise
+
+    with timed(platform, "extract"):
+        return evaluate(page, extract_js, arg)
+
+
+def read_page(context, url, platform, ready_selectors, extract_js, arg=None,
+              wait_timeout=5000, wait_required=False):
+    """Open url in context and extract from it (see extract)."""
+    page = open_page(context)
+
+    # domcontentloaded instead of networkidle: the metrics are in the initial DOM
+    try:
+        with timed(platform, "goto"):
+            page.goto(url, wait_until="domcontentloaded", timeout=GOTO_TIMEOUT_MS)
+    except Exception:
+        # Never leave a reused page showing the previous post after a failed navigation
+        _blank(page)
+        raise
+
+    return extract(page, platform, ready_selectors, extract_js, arg, wait_timeout, wait_required)
+
+
+async def open_page_async(context):
+    """open_page for playwright.async_api contexts."""
+    pages = context.pages
+    return pages[0] if pages else await context.new_page()
+
+
+async def extract_async(page, platform, ready_selectors, extract_js, arg=None, wait_timeout=5000, wait_required=False):
+    """extract for playwright.async_api pages."""
+    try:
+        with timed(platform, "wait_selector"):
+            await page.wait_for_selector(", ".join(ready_selectors), state="attached", timeout=wait_timeout)
+    except Exception:
+        if wait_required:
+            raise
+
+    with timed(platform, "extract"):
+        return await page.evaluate(_script(extract_js), arg)
+
+
+async def read_page_async(context, url, platform, ready_selectors, extract_js, arg=None,
+                          wait_timeout=5000, wait_required=False):
+    """read_page for playwright.async_api contexts."""
+    page = await open_page_async(context)
+
+    try:
+        with timed(platform, "goto"):
+            await page.goto(url, wait_until="domcontentloaded", timeout=GOTO_TIMEOUT_MS)
+    except Exception:
+        await _blank_async(page)
+        raise
+
+    return await extract_async(page, platform, ready_selectors, extract_js, arg, wait_timeout, wait_required)
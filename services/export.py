@@ -0,0 +1,235 @@
+"""
+Export - streams finished batch results as CSV, NDJSON, XLSX or Parquet with
+normalized numeric columns for downstream tools
+"""
+import os
+import csv
+import io
+import json
+import re
+import tempfile
+
+# Metric columns per platform, in the order they appear on the results pages
+METRIC_COLUMNS = {
+    "twitter": ["likes", "retweets", "replies", "views"],
+    "instagram": ["likes", "comments"],
+    "tiktok": ["likes", "comments"],
+    "facebook": ["reactions", "comments", "shares"],
+}
+
+# Result keys holding sampled comment text
+COMMENT_LIST_KEYS = ("comment_list", "comments")
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Rows per Parquet row group; bounds memory while the file is written
+EXPORT_ROW_GROUP = int(os.getenv("EXPORT_ROW_GROUP", "10000"))
+
+# Bytes read per chunk when streaming a finished XLSX/Parquet file
+_FILE_CHUNK = 64 * 1024
+
+PYARROW_MISSING = "Parquet export needs pyarrow. Run: pip install pyarrow"
+
+_COUNT = re.compile(r'([\d.,]+)\s*([KMB])?', re.I)
+_MULTIPLIERS = {"K": 1_000, "M": 1_000_000, "B": 1_000_000_000}
+
+
+class ExportError(Exception):
+    """An export format that can't be produced in this environment."""
+
+
+def parse_count(value):
+    """
+    Normalize a scraped metric to an int: 1234, "1,234", "1.2K" and "3M" all
+    parse; "N/A", blanks and anything else unreadable become None.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+
+    match = _COUNT.search(str(value))
+    if not match:
+        return None
+    number = match.group(1).replace(',', '')
+    try:
+        count = float(number)
+    except ValueError:
+        return None
+    return int(round(count * _MULTIPLIERS.get((match.group(2) or '').upper(), 1)))
+
+
+def parse_counts(values):
+    """
+    Vectorized parse_count over a column of scraped metrics: a nullable Int64
+    Series in which "N/A", blanks and anything else unreadable are <NA>.
+    """
+    import pandas as pd
+
+    # Scraped counts repeat a lot ("N/A", "1.2K"), so only distinct values are parsed
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    uniques = pd.Series(uniques, dtype=object)
+    counts = pd.to_numeric(uniques, errors="coerce").astype("float64")
+
+    # Display strings ("1.2K", "1,234 likes") need the regex
+    text = uniques[counts.isna()].astype(str)
+    if len(text):
+        parts = text.str.extract(_COUNT.pattern, flags=re.I)
+        number = pd.to_numeric(parts[0].str.replace(",", "", regex=False), errors="coerce")
+        counts[text.index] = number * parts[1].str.upper().map(_MULTIPLIERS).fillna(1)
+
+    parsed = pd.array(counts.round(), dtype="Int64")
+    return pd.Series(parsed.take(codes, allow_fill=True), dtype="Int64")
+
+
+def export_columns(platform):
+    """Column names of an export: raw metrics, then their *_count versions."""
+    metrics = METRIC_COLUMNS.get(platform, [])
+    return (["name", "link", "status"] + metrics
+            + [f"{metric}_count" for metric in metrics] + ["comment_list"])
+
+
+def _comment_list(row, metrics):
+    for key in COMMENT_LIST_KEYS:
+        # Twitter's "comments" is the comment text list; elsewhere it's a count
+        if key in metrics:
+            continue
+        value = row.get(key)
+        if isinstance(value, list):
+            return [str(comment) for comment in value]
+    return []
+
+
+def export_records(platform, results):
+    """Yield one flat dict per result row, in the columns of export_columns()."""
+    metrics = METRIC_COLUMNS.get(platform, [])
+    for row in results:
+        record = {
+            "name": row.get("name"),
+            "link": row.get("link"),
+            "status": "error" if any(row.get(m) == "N/A" for m in metrics if m != "views") else "ok",
+        }
+        for metric in metrics:
+            value = row.get(metric)
+            record[metric] = None if value is None else str(value)
+        for metric in metrics:
+            record[f"{metric}_count"] = parse_count(row.get(metric))
+        record["comment_list"] = _comment_list(row, metrics)
+        yield record
+
+
+def _flat(record):
+    # Tabular formats get the comment samples as one newline-separated cell
+    return {**record, "comment_list": "\n".join(record["comment_list"])}
+
+
+def iter_csv(platform, results):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=export_columns(platform))
+    writer.writeheader()
+    for record in export_records(platform, results):
+        writer.writerow(_flat(record))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(platform, results):
+    for record in export_records(platform, results):
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def _iter_file(file):
+    try:
+        file.seek(0)
+        while True:
+            chunk = file.read(_FILE_CHUNK)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file.close()
+
+
+def iter_xlsx(platform, results, by_name=None):
+    """
+    Write through openpyxl's write-only mode into a temp file, then stream it.
+    `by_name` (a services.analytics.name_aggregates frame) adds a "by name" sheet.
+    """
+    from openpyxl import Workbook
+
+    columns = export_columns(platform)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(platform or "results")
+    sheet.append(columns)
+    for record in export_records(platform, results):
+        flat = _flat(record)
+        sheet.append([flat[column] for column in columns])
+
+    if by_name is not None:
+        summary = workbook.create_sheet("by name")
+        summary.append(list(by_name.columns))
+        for row in by_name.astype(object).where(by_name.notna(), None).itertuples(index=False):
+            summary.append(list(row))
+
+    file = tempfile.TemporaryFile()
+    workbook.save(file)
+    return _iter_file(file)
+
+
+def iter_parquet(platform, results):
+    """Write Parquet in EXPORT_ROW_GROUP-sized row groups into a temp file, then stream it."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError(PYARROW_MISSING)
+
+    metrics = METRIC_COLUMNS.get(platform, [])
+    schema = pa.schema(
+        [("name", pa.string()), ("link", pa.string()), ("status", pa.string())]
+        + [(metric, pa.string()) for metric in metrics]
+        + [(f"{metric}_count", pa.int64()) for metric in metrics]
+        + [("comment_list", pa.list_(pa.string()))]
+    )
+
+    file = tempfile.TemporaryFile()
+    writer = pq.ParquetWriter(file, schema)
+    try:
+        group = []
+        for record in export_records(platform, results):
+            group.append(record)
+            if len(group) >= EXPORT_ROW_GROUP:
+                writer.write_table(pa.Table.from_pylist(group, schema=schema))
+                group = []
+        if group:
+            writer.write_table(pa.Table.from_pylist(group, schema=schema))
+    finally:
+        writer.close()
+    return _iter_file(file)
+
+
+_WRITERS = {
+    "csv": iter_csv,
+    "ndjson": iter_ndjson,
+    "xlsx": iter_xlsx,
+    "parquet": iter_parquet,
+}
+
+
+def iter_export(fmt, platform, results, by_name=None):
+    """
+    Return an iterator of str/bytes chunks for results in the given format.
+    CSV and NDJSON are produced row by row; XLSX and Parquet are spooled to a
+    temp file on disk first. Raises ExportError if the format's library is missing.
+    `by_name` aggregates are only written by formats with room for a second table (XLSX).
+    """
+    if fmt == "xlsx":
+        return iter_xlsx(platform, results, by_name=by_name)
+    return _WRITERS[fmt](platform, results)
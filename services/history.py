@@ -0,0 +1,321 @@
+"""
+Engagement History - SQLite time series of metric snapshots per canonical
+post, incremental refresh of stale posts and offline growth queries
+
+Usage (e.g. from cron, as an alternative to HISTORY_REFRESH_INTERVAL):
+    python -m services.history --max-age 86400 --platforms instagram,tiktok
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+
+from services.canonical import canonicalize
+from services.export import METRIC_COLUMNS, parse_count
+from services.storage import connect
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DB = "history.sqlite3"
+
+ENABLE_HISTORY = os.getenv("HISTORY", "true").lower() in ("1", "true", "yes")
+
+# Posts whose latest snapshot is older than this many seconds are re-scraped by a refresh
+HISTORY_MAX_AGE = float(os.getenv("HISTORY_MAX_AGE", str(24 * 3600)))
+
+# Seconds between scheduled refreshes (0 disables the in-process scheduler)
+HISTORY_REFRESH_INTERVAL = float(os.getenv("HISTORY_REFRESH_INTERVAL", "0"))
+
+# Posts re-scraped per platform by one refresh, oldest snapshot first
+HISTORY_REFRESH_LIMIT = int(os.getenv("HISTORY_REFRESH_LIMIT", "500"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    platform TEXT NOT NULL,
+    post_key TEXT NOT NULL,
+    link TEXT NOT NULL,
+    first_seen_at REAL NOT NULL,
+    last_snapshot_at REAL NOT NULL,
+    PRIMARY KEY (platform, post_key)
+);
+CREATE INDEX IF NOT EXISTS posts_refresh ON posts (platform, last_snapshot_at);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    platform TEXT NOT NULL,
+    post_key TEXT NOT NULL,
+    taken_at REAL NOT NULL,
+    metrics TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_post ON snapshots (platform, post_key, taken_at);
+CREATE TABLE IF NOT EXISTS schedule (
+    name TEXT PRIMARY KEY,
+    next_run_at REAL NOT NULL
+);
+"""
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _db():
+    return connect(HISTORY_DB, SCHEMA)
+
+
+def snapshot_metrics(platform, result):
+    """The platform's metric columns from a scrape result, as ints (None when unreadable)."""
+    return {metric: parse_count(result.get(metric)) for metric in METRIC_COLUMNS.get(platform, [])}
+
+
+def record_snapshot(platform, link, result):
+    """
+    Store a successful scrape result as a snapshot of its canonical post.
+    Failed results and links without a post key are ignored; storage errors
+    are logged, never raised into the scrape.
+    """
+    if not ENABLE_HISTORY or not result or "error" in result:
+        return
+    try:
+        post_key = canonicalize(link, platform)[1]
+        if not post_key:
+            return
+        now = time.time()
+        conn = _db()
+        conn.execute(
+            "INSERT INTO snapshots (platform, post_key, taken_at, metrics) VALUES (?, ?, ?, ?)",
+            (platform, post_key, now, json.dumps(snapshot_metrics(platform, result)))
+        )
+        conn.execute(
+            "INSERT INTO posts (platform, post_key, link, first_seen_at, last_snapshot_at) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (platform, post_key) DO UPDATE SET link = excluded.link,"
+            " last_snapshot_at = excluded.last_snapshot_at",
+            (platform, post_key, str(link).strip(), now, now)
+        )
+    except Exception as e:
+        logger.warning("history snapshot failed platform=%s error=%r", platform, str(e))
+
+
+def stale_posts(platform, max_age=None, limit=HISTORY_REFRESH_LIMIT):
+    """[(post_key, link), ...] of a platform's posts last snapshotted more than max_age seconds ago."""
+    cutoff = time.time() - (HISTORY_MAX_AGE if max_age is None else max_age)
+    rows = _db().execute(
+        "SELECT post_key, link FROM posts WHERE platform = ? AND last_snapshot_at < ?"
+        " ORDER BY last_snapshot_at LIMIT ?",
+        (platform, cutoff, limit)
+    ).fetchall()
+    return [(row["post_key"], row["link"]) for row in rows]
+
+
+def _scrapers():
+    # Imported here: the blueprints import this module (through the cache) themselves
+    from blueprints.instagram import scrape_instagram_post
+    from blueprints.tiktok import scrape_tiktok_post
+    from blueprints.twitter import scrape_tweet
+
+    return {
+        "twitter": scrape_tweet,
+        "instagram": scrape_instagram_post,
+        "tiktok": scrape_tiktok_post,
+    }
+
+
+def refresh_stale(max_age=None, platforms=None, limit=HISTORY_REFRESH_LIMIT):
+    """
+    Re-scrape only the posts whose latest snapshot is older than max_age
+    (HISTORY_MAX_AGE by default), bypassing the scrape cache.
+    Returns {platform: {"stale": n, "refreshed": n}}.
+    """
+    from services.batch import iter_batch
+    from blueprints.facebook import get_posts_with_comments
+
+    scrapers = _scrapers()
+    summary = {}
+    for platform in platforms or list(METRIC_COLUMNS):
+        stale = stale_posts(platform, max_age, limit)
+        refreshed = 0
+        if stale and platform == "facebook":
+            # Snapshots are recorded by get_posts_with_comments itself
+            results = dict(get_posts_with_comments([post_key for post_key, _ in stale], use_cache=False))
+            refreshed = sum(1 for result in results.values() if "error" not in result)
+        elif stale:
+            links = [link for _, link in stale]
+            for link, result in zip(links, iter_batch(links, scrapers[platform], platform, use_cache=False)):
+                if result and "error" not in result:
+                    record_snapshot(platform, link, result)
+                    refreshed += 1
+        summary[platform] = {"stale": len(stale), "refreshed": refreshed}
+        if stale:
+            logger.info("history refresh platform=%s stale=%d refreshed=%d", platform, len(stale), refreshed)
+    return summary
+
+
+def _claim_scheduled_run(interval):
+    """True for exactly one worker per interval: the first to see the run as due."""
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT next_run_at FROM schedule WHERE name = 'refresh'").fetchone()
+        due = row is None or row["next_run_at"] <= now
+        if due:
+            conn.execute("INSERT OR REPLACE INTO schedule (name, next_run_at) VALUES ('refresh', ?)",
+                         (now + interval,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return due
+
+
+def _scheduler_loop(interval):
+    while True:
+        try:
+            if _claim_scheduled_run(interval):
+                refresh_stale()
+        except Exception as e:
+            logger.warning("history refresh failed error=%r", str(e))
+        time.sleep(min(interval, 60))
+
+
+def start_scheduler():
+    """Start this process's refresh scheduler when HISTORY_REFRESH_INTERVAL is set (fork-safe)."""
+    global _scheduler
+    if not ENABLE_HISTORY or HISTORY_REFRESH_INTERVAL <= 0:
+        return
+    with _scheduler_lock:
+        if _scheduler is not None and _scheduler[0] == os.getpid():
+            return
+        thread = threading.Thread(target=_scheduler_loop, args=(HISTORY_REFRESH_INTERVAL,),
+                                  name="history-refresh", daemon=True)
+        thread.start()
+        _scheduler = (os.getpid(), thread)
+
+
+def _growth(snapshots, metrics):
+    """First/last value, change, percent change and change per day for each metric."""
+    growth = {}
+    for metric in metrics:
+        points = [(s["taken_at"], s["metrics"].get(metric)) for s in snapshots
+                  if s["metrics"].get(metric) is not None]
+        if not points:
+            growth[metric] = None
+            continue
+        (first_at, first), (last_at, last) = points[0], points[-1]
+        days = (last_at - first_at) / 86400
+        growth[metric] = {
+            "first": first,
+            "last": last,
+            "change": last - first,
+            "change_pct": round((last - first) / first * 100, 2) if first else None,
+            "per_day": round((last - first) / days, 2) if days > 0 else None,
+        }
+    return growth
+
+
+def post_history(platform, post_key, since=None):
+    """
+    Snapshots of one post (oldest first) with the change since the previous
+    snapshot, plus a growth summary and per-metric curves. None if unknown.
+    Reads only the local store.
+    """
+    conn = _db()
+    post = conn.execute("SELECT link, first_seen_at, last_snapshot_at FROM posts WHERE platform = ? AND post_key = ?",
+                        (platform, post_key)).fetchone()
+    if post is None:
+        return None
+
+    rows = conn.execute(
+        "SELECT taken_at, metrics FROM snapshots WHERE platform = ? AND post_key = ? AND taken_at >= ?"
+        " ORDER BY taken_at",
+        (platform, post_key, since or 0)
+    ).fetchall()
+
+    metrics = METRIC_COLUMNS.get(platform, [])
+    snapshots = []
+    previous = None
+    for row in rows:
+        values = json.loads(row["metrics"])
+        delta = None
+        if previous is not None:
+            delta = {metric: values[metric] - previous[metric]
+                     if values.get(metric) is not None and previous.get(metric) is not None else None
+                     for metric in metrics}
+        snapshots.append({"taken_at": row["taken_at"], "metrics": values, "delta": delta})
+        previous = values
+
+    return {
+        "platform": platform,
+        "post_key": post_key,
+        "link": post["link"],
+        "first_seen_at": post["first_seen_at"],
+        "last_snapshot_at": post["last_snapshot_at"],
+        "snapshots": snapshots,
+        "growth": _growth(snapshots, metrics),
+        "curves": {metric: [[s["taken_at"], s["metrics"].get(metric)] for s in snapshots] for metric in metrics},
+    }
+
+
+def platform_growth(platform, days=7, limit=100):
+    """
+    Latest metrics of a platform's most recently snapshotted posts and their
+    change over the last `days`: from the last snapshot at or before the
+    window start (or the first one inside it) to the latest.
+    """
+    conn = _db()
+    cutoff = time.time() - days * 86400
+    metrics = METRIC_COLUMNS.get(platform, [])
+    posts = conn.execute(
+        "SELECT post_key, link, last_snapshot_at FROM posts WHERE platform = ?"
+        " ORDER BY last_snapshot_at DESC LIMIT ?",
+        (platform, limit)
+    ).fetchall()
+
+    items = []
+    for post in posts:
+        latest = conn.execute(
+            "SELECT taken_at, metrics FROM snapshots WHERE platform = ? AND post_key = ?"
+            " ORDER BY taken_at DESC LIMIT 1",
+            (platform, post["post_key"])
+        ).fetchone()
+        start = conn.execute(
+            "SELECT taken_at, metrics FROM snapshots WHERE platform = ? AND post_key = ? AND taken_at <= ?"
+            " ORDER BY taken_at DESC LIMIT 1",
+            (platform, post["post_key"], cutoff)
+        ).fetchone() or conn.execute(
+            "SELECT taken_at, metrics FROM snapshots WHERE platform = ? AND post_key = ? AND taken_at > ?"
+            " ORDER BY taken_at LIMIT 1",
+            (platform, post["post_key"], cutoff)
+        ).fetchone()
+
+        snapshots = [{"taken_at": row["taken_at"], "metrics": json.loads(row["metrics"])}
+                     for row in (start, latest) if row is not None]
+        items.append({
+            "post_key": post["post_key"],
+            "link": post["link"],
+            "last_snapshot_at": post["last_snapshot_at"],
+            "metrics": snapshots[-1]["metrics"] if snapshots else {},
+            "growth": _growth(snapshots, metrics),
+        })
+    return {"platform": platform, "days": days, "posts": items}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-scrape posts whose latest snapshot is too old.")
+    parser.add_argument("--max-age", type=float, default=HISTORY_MAX_AGE,
+                        help="seconds since the last snapshot (default: HISTORY_MAX_AGE)")
+    parser.add_argument("--platforms", default=",".join(METRIC_COLUMNS),
+                        help="comma separated platforms (default: all)")
+    parser.add_argument("--limit", type=int, default=HISTORY_REFRESH_LIMIT, help="posts per platform")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    platforms = [p.strip() for p in args.platforms.split(",") if p.strip()]
+    summary = refresh_stale(args.max_age, platforms, args.limit)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+HTTP Fetch - pooled plain-HTTP page fetches and a fast meta/ld+json parser,
+used to skip the browser when server-rendered metadata is enough
+"""
+import os
+import json
+from html.parser import HTMLParser
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.browser_pool import DEFAULT_USER_AGENT
+from services.resilience import RetryableError
+
+# Try a plain HTTP GET before launching a browser page
+HTTP_FAST_PATH = os.getenv("HTTP_FAST_PATH", "true").lower() in ("1", "true", "yes")
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_FETCH_TIMEOUT", "8"))
+
+# Keep-alive session shared by every fast-path fetch in this process
+session = requests.Session()
+session.headers.update({
+    "User-Agent": DEFAULT_USER_AGENT,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+})
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+
+
+def fetch_html(url):
+    """
+    GET a page and return its HTML, or None on any error or non-HTML response.
+    Raises RetryableError on HTTP 429, so a throttled platform is backed off
+    instead of being retried straight away in a browser.
+    """
+    try:
+        res = session.get(url, timeout=HTTP_TIMEOUT, allow_redirects=True)
+    except Exception:
+        return None
+
+    if res.status_code == 429:
+        raise RetryableError(f"HTTP 429 Too Many Requests: {url}")
+    if res.status_code != 200 or "html" not in res.headers.get("Content-Type", "html"):
+        return None
+    return res.text
+
+
+class _MetadataParser(HTMLParser):
+    """Collects <meta> tags and application/ld+json scripts; ignores everything else."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta = {}
+        self.ld_json = []
+        self._in_ld_json = False
+        self._buffer = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            attrs = dict(attrs)
+            key = attrs.get("property") or attrs.get("name")
+            if key and "content" in attrs:
+                self.meta.setdefault(key, attrs["content"] or "")
+        elif tag == "script" and dict(attrs).get("type") == "application/ld+json":
+            self._in_ld_json = True
+            self._buffer = []
+
+    def handle_data(self, data):
+        if self._in_ld_json:
+            self._buffer.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "script" and self._in_ld_json:
+            self._in_ld_json = False
+            try:
+                self.ld_json.append(json.loads("".join(self._buffer)))
+            except ValueError:
+                pass
+
+
+def parse_page_metadata(html):
+    """
+    Pull metadata out of raw HTML.
+    Returns: {"meta": {property_or_name: content}, "ld_json": [obj, ...]}
+    """
+    parser = _MetadataParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass
+    return {"meta": parser.meta, "ld_json": parser.ld_json}
@@ -0,0 +1,146 @@
+"""
+Upload Ingestion - chunked, bounded-memory reading of NAME/LINK spreadsheets
+with vectorized post-ID extraction
+
+pandas is imported on the first upload rather than at startup, so a fresh
+worker serves its first pages without paying for it.
+"""
+import os
+
+# Rows parsed per chunk; memory stays proportional to this, not the sheet size
+UPLOAD_CHUNK_ROWS = int(os.getenv("UPLOAD_CHUNK_ROWS", "20000"))
+
+REQUIRED_COLUMNS = ("NAME", "LINK")
+
+
+class UploadError(Exception):
+    """An upload that can't be processed; carries the error page's title and message."""
+
+    def __init__(self, error, message):
+        super().__init__(message)
+        self.error = error
+        self.message = message
+
+
+def extract_post_keys(links, patterns):
+    """
+    Vectorized post-ID extraction for a Series of links.
+    Each pattern (one capture group) is tried in order, first on the link with
+    its query string and trailing slash removed, then on the raw link; each
+    pass only touches the rows still missing a key.
+    """
+    import pandas as pd
+
+    cleaned = links.str.strip().str.split('?').str[0].str.rstrip('/')
+    keys = pd.Series(None, index=links.index, dtype=object)
+
+    for source in (cleaned, links):
+        for pattern in patterns:
+            missing = keys.isna()
+            if not missing.any():
+                return keys
+            keys[missing] = source[missing].str.extract(pattern, expand=False)
+
+    return keys
+
+
+def _chunk_rows(names, links, patterns):
+    names = names.fillna("").astype(str)
+    links = links.fillna("").astype(str)
+    keys = extract_post_keys(links, patterns)
+    return [
+        {"name": name, "link": link, "post_key": key if isinstance(key, str) else None}
+        for name, link, key in zip(names.tolist(), links.tolist(), keys.tolist())
+    ]
+
+
+def _normalize(column):
+    return str(column).strip().upper()
+
+
+def _read_csv(file, patterns):
+    import pandas as pd
+
+    header = pd.read_csv(file, nrows=0, encoding="utf-8-sig")
+    found = {_normalize(c) for c in header.columns}
+    if not set(REQUIRED_COLUMNS) <= found:
+        raise UploadError("Missing required columns",
+                          "Your file must contain columns named 'NAME' and 'LINK'.")
+    file.seek(0)
+
+    rows = []
+    chunks = pd.read_csv(file, usecols=lambda c: _normalize(c) in REQUIRED_COLUMNS,
+                         dtype=str, keep_default_na=False, encoding="utf-8-sig",
+                         chunksize=UPLOAD_CHUNK_ROWS)
+    for chunk in chunks:
+        chunk.columns = [_normalize(c) for c in chunk.columns]
+        rows.extend(_chunk_rows(chunk["NAME"], chunk["LINK"], patterns))
+    return rows
+
+
+def _read_xlsx(file, patterns):
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        values = sheet.iter_rows(values_only=True)
+
+        header = [_normalize(c) for c in next(values, ())]
+        if not all(c in header for c in REQUIRED_COLUMNS):
+            raise UploadError("Missing required columns",
+                              "Your file must contain columns named 'NAME' and 'LINK'.")
+        name_col = header.index("NAME")
+        link_col = header.index("LINK")
+
+        rows = []
+        names, links = [], []
+        for values_row in values:
+            names.append(values_row[name_col] if name_col < len(values_row) else None)
+            links.append(values_row[link_col] if link_col < len(values_row) else None)
+            if len(links) >= UPLOAD_CHUNK_ROWS:
+                rows.extend(_chunk_rows(pd.Series(names, dtype=object), pd.Series(links, dtype=object), patterns))
+                names, links = [], []
+        if links:
+            rows.extend(_chunk_rows(pd.Series(names, dtype=object), pd.Series(links, dtype=object), patterns))
+        return rows
+    finally:
+        workbook.close()
+
+
+def _read_xls(file, patterns):
+    import pandas as pd
+
+    df = pd.read_excel(file, dtype=str, usecols=lambda c: _normalize(c) in REQUIRED_COLUMNS)
+    df.columns = [_normalize(c) for c in df.columns]
+    if not all(c in df.columns for c in REQUIRED_COLUMNS):
+        raise UploadError("Missing required columns",
+                          "Your file must contain columns named 'NAME' and 'LINK'.")
+    return _chunk_rows(df["NAME"], df["LINK"], patterns)
+
+
+def read_upload(file, patterns, allow_excel=True):
+    """
+    Read an uploaded CSV/Excel file into [{"name", "link", "post_key"}, ...].
+    Only the NAME and LINK columns are loaded, CSVs are read in chunks and
+    .xlsx files are streamed row by row. post_key is the first match of
+    `patterns` for the link, or None.
+    Raises UploadError for missing files, unsupported formats and missing columns.
+    """
+    if file is None:
+        raise UploadError("No file uploaded", "Please select a file to upload.")
+    if file.filename == '':
+        raise UploadError("No file selected", "Please select a valid file.")
+
+    filename = file.filename.lower()
+    stream = getattr(file, "stream", file)
+    if filename.endswith('.csv'):
+        return _read_csv(stream, patterns)
+    if allow_excel and filename.endswith('.xlsx'):
+        return _read_xlsx(stream, patterns)
+    if allow_excel and filename.endswith('.xls'):
+        return _read_xls(stream, patterns)
+
+    raise UploadError("Invalid file format",
+                      "Please upload a CSV or Excel file." if allow_excel else "Please upload a CSV file.")
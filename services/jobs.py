@@ -0,0 +1,290 @@
+"""
+Job Queue - SQLite-backed background jobs for spreadsheet uploads, with
+per-row results that double as checkpoints, so interrupted batches resume
+where they stopped and finished ones can be read a page at a time
+"""
+import os
+import json
+import time
+import uuid
+import threading
+
+from services.batch import DeadlineExceeded
+from services.storage import connect
+
+JOBS_DB = "jobs.sqlite3"
+
+# Job runner threads started in each web worker process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+
+# Seconds between queue polls when there is nothing to do
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+
+# A running job with no progress for this long is assumed orphaned (worker
+# killed or restarted) and is picked up again by another runner
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "300"))
+
+# Streamed uploads stop after this many seconds and offer a resume link; keep
+# it below gunicorn's timeout so the worker isn't killed mid-batch
+BATCH_DEADLINE_SECONDS = float(os.getenv("BATCH_DEADLINE_SECONDS", "540"))
+
+_handlers = {}
+_runners = []
+_runners_lock = threading.Lock()
+_runners_pid = None
+_wakeup = threading.Event()
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    platform TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    rows TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    updated_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_rows (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+def _db():
+    return connect(JOBS_DB, SCHEMA)
+
+
+def register_handler(platform, handler):
+    """
+    Register the function that processes a platform's uploads.
+    handler(rows, deadline) receives [{"name", "link", "post_key"}, ...] and
+    yields one result row per input row, in order. It raises
+    DeadlineExceeded once deadline (a time.monotonic() value, or None) passes.
+    """
+    _handlers[platform] = handler
+
+
+def get_handler(platform):
+    return _handlers[platform]
+
+
+def _insert_job(platform, rows, status):
+    job_id = uuid.uuid4().hex
+    _db().execute(
+        "INSERT INTO jobs (id, platform, status, total, rows, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (job_id, platform, status, len(rows), json.dumps(rows), time.time(), time.time())
+    )
+    return job_id
+
+
+def submit_job(platform, rows):
+    """Queue an upload for background processing and return its job ID."""
+    job_id = _insert_job(platform, rows, "queued")
+    start_workers()
+    _wakeup.set()
+    return job_id
+
+
+def create_stream(platform, rows):
+    """Record an upload processed in the request (streaming mode); its ID is the resume token."""
+    return _insert_job(platform, rows, "streaming")
+
+
+def _is_resumable(status, updated_at):
+    # A stream that stopped updating lost its worker
+    return status == "partial" or (
+        status == "streaming" and (updated_at or 0) < time.time() - JOB_STALE_AFTER
+    )
+
+
+def resume_stream(job_id):
+    """
+    Take over a partial (or orphaned) streamed job. Returns (platform, rows),
+    or None when the job doesn't exist or isn't resumable.
+    """
+    conn = _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT platform, status, rows, updated_at FROM jobs WHERE id = ?",
+                           (job_id,)).fetchone()
+        resumable = row is not None and _is_resumable(row["status"], row["updated_at"])
+        if resumable:
+            conn.execute("UPDATE jobs SET status = 'streaming', updated_at = ? WHERE id = ?",
+                         (time.time(), job_id))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return (row["platform"], json.loads(row["rows"])) if resumable else None
+
+
+class CheckpointedRun:
+    """
+    Iterates a job's result rows in upload order through its platform
+    handler. Rows already checkpointed by an earlier run are replayed
+    without scraping, and every new row is checkpointed as it arrives.
+
+    When the deadline passes (or a streamed response is abandoned) iteration
+    stops early and the job is left "partial", with `partial` set; a
+    complete run marks the job done. Either way the rows stay in job_rows.
+    """
+
+    def __init__(self, job_id, rows, handler, deadline=None):
+        self.job_id = job_id
+        self.rows = rows
+        self.handler = handler
+        self.deadline = deadline
+        self.total = len(rows)
+        self.done = 0
+        self.partial = False
+
+    def __iter__(self):
+        conn = _db()
+        saved = {
+            row["idx"]: json.loads(row["result"])
+            for row in conn.execute("SELECT idx, result FROM job_rows WHERE job_id = ?", (self.job_id,))
+        }
+        pending = [i for i in range(self.total) if i not in saved]
+        produced = self.handler([self.rows[i] for i in pending], self.deadline)
+        finished = False
+        try:
+            for i in range(self.total):
+                if i in saved:
+                    result = saved[i]
+                else:
+                    try:
+                        result = next(produced)
+                    except DeadlineExceeded:
+                        return
+                    conn.execute("INSERT OR REPLACE INTO job_rows (job_id, idx, result) VALUES (?, ?, ?)",
+                                 (self.job_id, i, json.dumps(result, default=str)))
+                self.done = i + 1
+                conn.execute("UPDATE jobs SET done = ?, updated_at = ? WHERE id = ?",
+                             (self.done, time.time(), self.job_id))
+                yield result
+            _finish_job(self.job_id)
+            finished = True
+        finally:
+            produced.close()
+            if not finished:
+                self.partial = True
+                conn.execute("UPDATE jobs SET status = 'partial', updated_at = ? WHERE id = ? AND status != 'failed'",
+                             (time.time(), self.job_id))
+
+
+def _finish_job(job_id):
+    now = time.time()
+    _db().execute(
+        "UPDATE jobs SET status = 'done', done = total, updated_at = ?, finished_at = ? WHERE id = ?",
+        (now, now, job_id)
+    )
+
+
+def iter_job_results(job_id):
+    """Yield a job's stored result rows in upload order, without loading them all at once."""
+    cursor = _db().execute("SELECT result FROM job_rows WHERE job_id = ? ORDER BY idx", (job_id,))
+    for row in cursor:
+        yield json.loads(row["result"])
+
+
+def get_job(job_id):
+    """
+    Return a job's status as a dict, or None if it does not exist.
+    Includes "eta_seconds" while the job is running and "resumable" for
+    streamed jobs that stopped early. Results are read with
+    iter_job_results or a page at a time through services.results.
+    """
+    row = _db().execute(
+        "SELECT id, platform, status, total, done, error, created_at, started_at, updated_at, finished_at"
+        " FROM jobs WHERE id = ?",
+        (job_id,)
+    ).fetchone()
+    if row is None:
+        return None
+
+    job = dict(row)
+    job["eta_seconds"] = None
+    job["resumable"] = _is_resumable(job["status"], job["updated_at"])
+    if job["status"] == "running" and job["started_at"] and job["done"]:
+        elapsed = time.time() - job["started_at"]
+        job["eta_seconds"] = round(elapsed / job["done"] * (job["total"] - job["done"]), 1)
+    return job
+
+
+def _claim_job():
+    """Atomically take the oldest queued (or orphaned) job for this runner."""
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT id, platform, rows FROM jobs"
+            " WHERE status = 'queued' OR (status = 'running' AND updated_at < ?)"
+            " ORDER BY created_at LIMIT 1",
+            (now - JOB_STALE_AFTER,)
+        ).fetchone()
+        if row is not None:
+            # An orphaned job resumes from its checkpoints, so its progress carries over
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, updated_at = ?,"
+                " done = (SELECT COUNT(*) FROM job_rows WHERE job_id = jobs.id) WHERE id = ?",
+                (now, now, row["id"])
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return row
+
+
+def _run_job(job_id, platform, rows):
+    conn = _db()
+    try:
+        # Background jobs have no deadline; checkpoints cover a lost worker
+        for _ in CheckpointedRun(job_id, rows, _handlers[platform]):
+            pass
+    except Exception as e:
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+            (str(e), now, now, job_id)
+        )
+
+
+def _runner_loop():
+    while True:
+        try:
+            job = _claim_job()
+        except Exception:
+            job = None
+
+        if job is None:
+            # Jobs submitted by this process wake us at once; others are seen on the next poll
+            _wakeup.wait(JOB_POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+
+        _run_job(job["id"], job["platform"], json.loads(job["rows"]))
+
+
+def start_workers():
+    """Start this process's job runner threads (once per process, fork-safe)."""
+    global _runners, _runners_pid
+    with _runners_lock:
+        if _runners_pid == os.getpid() and _runners:
+            return
+        _runners_pid = os.getpid()
+        _runners = []
+        for i in range(max(1, JOB_WORKERS)):
+            thread = threading.Thread(target=_runner_loop, name=f"job-runner-{i}", daemon=True)
+            thread.start()
+            _runners.append(thread)
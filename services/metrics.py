@@ -0,0 +1,207 @@
+"""
+Metrics - Prometheus histograms, counters and gauges for the scrape hot path,
+plus the logging setup that replaces ad-hoc prints
+"""
+import os
+import re
+import time
+import logging
+import functools
+from contextlib import contextmanager
+
+import requests
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               REGISTRY, generate_latest)
+
+logger = logging.getLogger(__name__)
+
+# Set PROMETHEUS_MULTIPROC_DIR (an empty directory, wiped on deploy) to have
+# /metrics aggregate every gunicorn worker instead of the one that answers
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Scrapes range from ~50ms cache-adjacent HTTP fetches to 15s+ page loads
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+stage_seconds = Histogram(
+    "scrape_stage_seconds",
+    "Time spent in each scrape stage",
+    ["platform", "stage"],
+    buckets=STAGE_BUCKETS,
+)
+
+scrape_results = Counter(
+    "scrape_results_total",
+    "Finished scrapes by outcome (ok or error)",
+    ["platform", "outcome"],
+)
+
+stage_errors = Counter(
+    "scrape_stage_errors_total",
+    "Scrape stages that raised, split into timeouts and other errors",
+    ["platform", "stage", "kind"],
+)
+
+cache_lookups = Counter(
+    "scrape_cache_lookups_total",
+    "Scrape cache lookups by result (fresh, stale or miss)",
+    ["platform", "result"],
+)
+
+blocked_requests = Counter(
+    "playwright_blocked_requests_total",
+    "Requests aborted by page profiles",
+    ["platform", "kind"],
+)
+
+browser_launches = Counter(
+    "browser_pool_launches_total",
+    "Chromium launches, including relaunches after crashes",
+)
+
+browser_recycles = Counter(
+    "browser_pool_recycles_total",
+    "Pooled browser contexts and browsers closed and replaced",
+    ["kind", "reason"],
+)
+
+pool_browsers = Gauge(
+    "browser_pool_browsers",
+    "Connected pooled browsers",
+    multiprocess_mode="livesum",
+)
+
+pool_busy = Gauge(
+    "browser_pool_busy",
+    "Pooled browsers currently running a scrape",
+    multiprocess_mode="livesum",
+)
+
+pool_queued = Gauge(
+    "browser_pool_queued",
+    "Scrapes waiting for a pooled browser",
+    multiprocess_mode="livesum",
+)
+
+
+singleflight_shared = Counter(
+    "singleflight_shared_total",
+    "Scrapes answered by another in-flight scrape of the same post",
+    ["platform", "scope"],
+)
+
+retries = Counter(
+    "scrape_retries_total",
+    "Scrape and Graph API calls retried after a retryable error",
+    ["platform"],
+)
+
+rate_limit_wait = Histogram(
+    "rate_limit_wait_seconds",
+    "Time calls waited for a rate-limiter token",
+    ["platform"],
+    buckets=STAGE_BUCKETS,
+)
+
+circuit_state = Gauge(
+    "circuit_state",
+    "Circuit breaker state per platform (0 closed, 1 half-open, 2 open)",
+    ["platform"],
+    multiprocess_mode="max",
+)
+
+circuit_rejections = Counter(
+    "circuit_rejections_total",
+    "Calls failed fast because the platform's circuit was open",
+    ["platform"],
+)
+
+scraper_workers = Gauge(
+    "scraper_workers",
+    "Scraper worker processes alive under the supervisor",
+    multiprocess_mode="max",
+)
+
+scraper_recycles = Counter(
+    "scraper_worker_recycles_total",
+    "Scraper worker processes replaced, by reason (memory, tasks, hung, exited)",
+    ["reason"],
+)
+
+scraper_tasks = Counter(
+    "scraper_tasks_total",
+    "Scrapes handed to scraper worker processes, by outcome",
+    ["platform", "outcome"],
+)
+
+
+def configure_logging():
+    """Send app logs to stderr as timestamped key=value lines."""
+    logging.basicConfig(
+        level=LOG_LEVEL,
+        format="ts=%(asctime)s level=%(levelname)s logger=%(name)s msg=%(message)s",
+    )
+
+
+def is_timeout(exc):
+    """True for Playwright, requests and futures timeouts."""
+    return (isinstance(exc, (TimeoutError, requests.Timeout))
+            or type(exc).__name__ == "TimeoutError")
+
+
+@contextmanager
+def timed(platform, stage):
+    """
+    Observe the block's duration in scrape_stage_seconds. Exceptions are
+    counted in scrape_stage_errors_total and re-raised.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        stage_errors.labels(platform, stage, "timeout" if is_timeout(e) else "error").inc()
+        raise
+    finally:
+        stage_seconds.labels(platform, stage).observe(time.perf_counter() - started)
+
+
+# Credentials that may appear in an error message quoting a request URL
+_SECRET_PARAMS = re.compile(r"((?:access_token|api_key|token)=)[^&\s'\"]+", re.IGNORECASE)
+
+
+def redact(text):
+    """text with credential query parameters masked, for logs."""
+    return _SECRET_PARAMS.sub(r"\1***", str(text))
+
+
+def record_result(platform, result):
+    """Count a finished scrape as ok or error and return it unchanged."""
+    outcome = "error" if not result or "error" in result else "ok"
+    scrape_results.labels(platform, outcome).inc()
+    if outcome == "error":
+        error = (result or {}).get("error")
+        logger.warning("scrape failed platform=%s error=%r", platform, redact(error) if error is not None else None)
+    return result
+
+
+def instrumented(platform):
+    """Decorator for a scrape function: times it as stage "total" and counts its outcome."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(platform, "total"):
+                result = fn(*args, **kwargs)
+            return record_result(platform, result)
+        return wrapper
+    return decorate
+
+
+def render_metrics():
+    """Return (body, content_type) for the /metrics endpoint."""
+    registry = REGISTRY
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,145 @@
+"""
+Page Profiles - request interception that keeps Playwright scrapes lightweight
+"""
+import os
+import time
+import logging
+import threading
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Resource types aborted on every scrape (comma separated, empty to disable)
+BLOCKED_RESOURCE_TYPES = [
+    t.strip() for t in os.getenv("PLAYWRIGHT_BLOCK_RESOURCES", "image,media,font").split(",") if t.strip()
+]
+
+BLOCK_ANALYTICS = os.getenv("PLAYWRIGHT_BLOCK_ANALYTICS", "true").lower() in ("1", "true", "yes")
+
+ANALYTICS_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "scorecardresearch.com",
+    "analytics.twitter.com",
+    "ads-twitter.com",
+    "analytics.tiktok.com",
+    "mon.tiktokv.com",
+    "mcs.tiktokw.us",
+)
+
+# Typical transfer size of each blocked category, used to estimate bytes saved
+ESTIMATED_BYTES = {
+    "image": 60 * 1024,
+    "media": 512 * 1024,
+    "font": 40 * 1024,
+    "analytics": 30 * 1024,
+}
+
+# JavaScript can be switched off per platform with <PLATFORM>_JAVASCRIPT=false.
+# Twitter/X renders everything client-side, so it keeps JS on by default.
+DEFAULT_JAVASCRIPT = {
+    "twitter": True,
+    "instagram": True,
+    "tiktok": True,
+}
+
+_totals_lock = threading.Lock()
+totals = {"scrapes": 0, "blocked": 0, "bytes_saved": 0, "load_ms": 0}
+
+
+def get_profile(platform):
+    """Interception settings for a platform's scrapes."""
+    javascript = os.getenv(f"{platform.upper()}_JAVASCRIPT")
+    return {
+        "platform": platform,
+        "block_types": BLOCKED_RESOURCE_TYPES,
+        "block_analytics": BLOCK_ANALYTICS,
+        "javascript": DEFAULT_JAVASCRIPT.get(platform, True) if javascript is None
+        else javascript.lower() in ("1", "true", "yes"),
+    }
+
+
+def context_options(profile):
+    """Extra browser.new_context() options required by a profile."""
+    return {"java_script_enabled": profile["javascript"]}
+
+
+def _category(request, profile):
+    if request.resource_type in profile["block_types"]:
+        return request.resource_type
+    if profile["block_analytics"]:
+        url = request.url
+        host = url.split("/")[2] if "://" in url else ""
+        if any(host == h or host.endswith("." + h) for h in ANALYTICS_HOSTS):
+            return "analytics"
+    return None
+
+
+class ProfileStats:
+    """Per-scrape record of what the profile blocked."""
+
+    def __init__(self, profile):
+        self.platform = profile["platform"]
+        self.blocked = {}
+        self.started = time.perf_counter()
+
+    def restart(self):
+        """Start counting the next scrape on a context that is being reused."""
+        self.blocked = {}
+        self.started = time.perf_counter()
+
+    @property
+    def bytes_saved(self):
+        return sum(ESTIMATED_BYTES.get(kind, 0) * count for kind, count in self.blocked.items())
+
+    def finish(self):
+        """Log the scrape's savings and add them to the process totals."""
+        load_ms = int((time.perf_counter() - self.started) * 1000)
+        blocked = sum(self.blocked.values())
+        with _totals_lock:
+            totals["scrapes"] += 1
+            totals["blocked"] += blocked
+            totals["bytes_saved"] += self.bytes_saved
+            totals["load_ms"] += load_ms
+        for kind, count in self.blocked.items():
+            metrics.blocked_requests.labels(self.platform, kind).inc(count)
+        logger.info("page profile platform=%s load_ms=%d blocked=%d by_kind=%s saved_kb=%d",
+                    self.platform, load_ms, blocked, self.blocked, self.bytes_saved // 1024)
+
+
+def apply_profile(context, profile):
+    """Install the profile's request interception on a context and return its stats."""
+    stats = ProfileStats(profile)
+    if not profile["block_types"] and not profile["block_analytics"]:
+        return stats
+
+    def handle(route):
+        kind = _category(route.request, profile)
+        if kind is None:
+            route.continue_()
+            return
+        stats.blocked[kind] = stats.blocked.get(kind, 0) + 1
+        route.abort()
+
+    context.route("**/*", handle)
+    return stats
+
+
+async def apply_profile_async(context, profile):
+    """apply_profile for playwright.async_api contexts."""
+    stats = ProfileStats(profile)
+    if not profile["block_types"] and not profile["block_analytics"]:
+        return stats
+
+    async def handle(route):
+        kind = _category(route.request, profile)
+        if kind is None:
+            await route.continue_()
+            return
+        stats.blocked[kind] = stats.blocked.get(kind, 0) + 1
+        await route.abort()
+
+    await context.route("**/*", handle)
+    return stats
@@ -0,0 +1,243 @@
+"""
+Resilience - per-platform token-bucket rate limiting, jittered retries and a
+circuit breaker in front of every scraper and Graph API call
+"""
+import os
+import re
+import time
+import random
+import logging
+import threading
+
+import requests
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Requests per second and burst size per platform
+# (override with <PLATFORM>_RATE_LIMIT and <PLATFORM>_RATE_BURST)
+DEFAULT_RATE_LIMITS = {
+    "twitter": 2.0,
+    "instagram": 2.0,
+    "tiktok": 2.0,
+    "facebook": 10.0,
+}
+DEFAULT_RATE_BURST = 5
+
+# Attempts per call, including the first, and the jittered backoff between them
+RETRY_ATTEMPTS = max(1, int(os.getenv("RETRY_ATTEMPTS", "2")))
+RETRY_BACKOFF_SECONDS = float(os.getenv("RETRY_BACKOFF_SECONDS", "1"))
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "10"))
+
+# Consecutive failed calls that open a platform's circuit, and how long it stays open
+CIRCUIT_FAILURE_THRESHOLD = max(1, int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")))
+CIRCUIT_COOLDOWN_SECONDS = float(os.getenv("CIRCUIT_COOLDOWN_SECONDS", "60"))
+
+# Playwright waits for content on a page that did load: the post is deleted,
+# private or changed, which says nothing about the platform's health
+_CONTENT_WAIT = re.compile(r"waiting for (?:locator|selector)")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class RetryableError(Exception):
+    """A failure worth retrying: throttling, server errors, dropped connections."""
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a platform whose circuit is open."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token and return the seconds spent waiting for it."""
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """
+    Opens after CIRCUIT_FAILURE_THRESHOLD consecutive failures and rejects
+    calls for the cooldown. After that a single trial call is let through:
+    success closes the circuit again, failure re-opens it. Only transient
+    failures (see is_transient) count.
+    """
+
+    def __init__(self, platform, threshold=CIRCUIT_FAILURE_THRESHOLD, cooldown=CIRCUIT_COOLDOWN_SECONDS):
+        self.platform = platform
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go ahead."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.time() - self.opened_at < self.cooldown:
+                    metrics.circuit_rejections.labels(self.platform).inc()
+                    raise CircuitOpenError(
+                        f"{self.platform} circuit open after {self.failures} failures, "
+                        f"retrying in {self.retry_in():.0f}s (last error: {self.last_error})"
+                    )
+                self._set_state(HALF_OPEN)
+
+            if self.state == HALF_OPEN:
+                if self._trial_running:
+                    metrics.circuit_rejections.labels(self.platform).inc()
+                    raise CircuitOpenError(f"{self.platform} circuit half-open, trial call in progress")
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+            if self.state != CLOSED:
+                logger.info("circuit closed platform=%s", self.platform)
+                self._set_state(CLOSED)
+
+    def record_ignored(self):
+        """A call that failed for a reason of its own: frees the trial slot and changes nothing else."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = metrics.redact(error)[:200]
+            self._trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                if self.state != OPEN:
+                    logger.warning("circuit opened platform=%s failures=%d error=%r",
+                                   self.platform, self.failures, self.last_error)
+                self.opened_at = time.time()
+                self._set_state(OPEN)
+
+    def retry_in(self):
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.cooldown - (time.time() - self.opened_at))
+
+    def _set_state(self, state):
+        self.state = state
+        metrics.circuit_state.labels(self.platform).set(_STATE_VALUES[state])
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "opened_at": self.opened_at if self.state != CLOSED else None,
+                "retry_in_seconds": round(self.retry_in(), 1),
+                "last_error": self.last_error,
+            }
+
+
+_limiters = {}
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def get_limiter(platform):
+    with _registry_lock:
+        if platform not in _limiters:
+            rate = float(os.getenv(f"{platform.upper()}_RATE_LIMIT", DEFAULT_RATE_LIMITS.get(platform, 0)))
+            burst = float(os.getenv(f"{platform.upper()}_RATE_BURST", DEFAULT_RATE_BURST))
+            _limiters[platform] = TokenBucket(rate, burst)
+        return _limiters[platform]
+
+
+def get_breaker(platform):
+    with _registry_lock:
+        if platform not in _breakers:
+            _breakers[platform] = CircuitBreaker(platform)
+        return _breakers[platform]
+
+
+def is_retryable(exc):
+    """Timeouts, dropped connections, network errors and explicit RetryableErrors."""
+    if isinstance(exc, (RetryableError, requests.ConnectionError)) or metrics.is_timeout(exc):
+        return True
+    # Playwright navigation failures (connection reset, DNS hiccups) surface as net::ERR_*
+    return "net::ERR_" in str(exc)
+
+
+def is_transient(exc):
+    """
+    Retryable failures that reflect the platform or the network rather than
+    one post: throttling, server and connection errors, navigation timeouts.
+    A selector wait that timed out on a loaded page is not one of them.
+    """
+    return is_retryable(exc) and not _CONTENT_WAIT.search(str(exc))
+
+
+def _backoff(attempt):
+    # Full jitter: anywhere between zero and the exponential ceiling
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_SECONDS * 2 ** attempt))
+
+
+def guarded(platform, fn, *args, **kwargs):
+    """
+    Call fn(*args, **kwargs) behind the platform's circuit breaker and rate
+    limiter, retrying transient errors (see is_transient) up to RETRY_ATTEMPTS times.
+    Raises CircuitOpenError without calling fn while the circuit is open;
+    otherwise returns fn's result or re-raises its last exception.
+    """
+    breaker = get_breaker(platform)
+    limiter = get_limiter(platform)
+    breaker.before_call()
+
+    for attempt in range(RETRY_ATTEMPTS):
+        waited = limiter.acquire()
+        if waited:
+            metrics.rate_limit_wait.labels(platform).observe(waited)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            # A post that never renders would only time out again: retry platform trouble only
+            if attempt + 1 < RETRY_ATTEMPTS and is_transient(e):
+                metrics.retries.labels(platform).inc()
+                time.sleep(_backoff(attempt))
+                continue
+            # Dead or private links fail on their own; only platform-wide trouble trips the breaker
+            if is_transient(e):
+                breaker.record_failure(e)
+            else:
+                breaker.record_ignored()
+            raise
+        breaker.record_success()
+        return result
+
+
+def circuit_states():
+    """Breaker state for every platform seen by this process, for operations pages."""
+    with _registry_lock:
+        breakers = dict(_breakers)
+    return {platform: breaker.snapshot() for platform, breaker in sorted(breakers.items())}
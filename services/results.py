@@ -0,0 +1,115 @@
+"""
+Results - paginated, sortable and filterable reads of a batch's stored
+result rows, so no request renders or serializes more than one page
+"""
+import os
+import json
+
+from services.export import METRIC_COLUMNS, parse_count
+from services.jobs import JOBS_DB, SCHEMA
+from services.storage import connect
+
+# Rows per results page, and the most a client may ask for with per_page
+RESULTS_PAGE_SIZE = max(1, int(os.getenv("RESULTS_PAGE_SIZE", "50")))
+RESULTS_MAX_PAGE_SIZE = max(RESULTS_PAGE_SIZE, int(os.getenv("RESULTS_MAX_PAGE_SIZE", "500")))
+
+# Numeric columns shown on each platform's results page (sorted and totalled as counts)
+RESULT_METRICS = METRIC_COLUMNS
+
+TEXT_COLUMNS = ("name", "link")
+
+STATUS_FILTERS = ("ok", "error")
+
+
+class ResultsQueryError(ValueError):
+    """A page request with an unknown sort column, order or status filter."""
+
+
+def _field(column):
+    # Column names only ever come from TEXT_COLUMNS / RESULT_METRICS, never from the request
+    return f"json_extract(result, '$.{column}')"
+
+
+def _error_condition(platform):
+    # Same rule as the export's status column: an unreadable metric (views aside) marks the row failed
+    failed = [f"{_field(metric)} = 'N/A'" for metric in METRIC_COLUMNS.get(platform, []) if metric != "views"]
+    return "(" + " OR ".join([f"{_field('error')} IS NOT NULL"] + failed) + ")"
+
+
+def _where(job_id, platform, q, status):
+    clauses, params = ["job_id = ?"], [job_id]
+    if q:
+        pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        clauses.append(f"({_field('name')} LIKE ? ESCAPE '\\' OR {_field('link')} LIKE ? ESCAPE '\\')")
+        params += [pattern, pattern]
+    if status == "error":
+        clauses.append(_error_condition(platform))
+    elif status == "ok":
+        clauses.append("NOT " + _error_condition(platform))
+    return " AND ".join(clauses), params
+
+
+def _order_by(sort, order):
+    if not sort:
+        return "idx"
+    if sort in TEXT_COLUMNS:
+        key = f"lower({_field(sort)})"
+    else:
+        key = f"count_of({_field(sort)})"
+    # Unreadable values ("N/A") sort last either way; upload order breaks ties
+    return f"{key} IS NULL, {key} {order.upper()}, idx"
+
+
+def results_page(job, page=1, per_page=RESULTS_PAGE_SIZE, sort=None, order="asc", q=None, status=None):
+    """
+    One page of a job's result rows plus totals over every row matching the filter.
+    `sort` is "name", "link" or one of the platform's RESULT_METRICS (upload order
+    when empty); metrics sort numerically, so "1.2K" ranks above 999. `q` matches
+    name or link, `status` keeps only "ok" or "error" rows.
+    Raises ResultsQueryError for an unknown sort, order or status.
+    """
+    platform = job["platform"]
+    metrics = RESULT_METRICS.get(platform, [])
+    if sort and sort not in TEXT_COLUMNS and sort not in metrics:
+        raise ResultsQueryError(f"Cannot sort {platform} results by {sort!r}")
+    if order not in ("asc", "desc"):
+        raise ResultsQueryError(f"Unknown order {order!r}, use asc or desc")
+    if status and status not in STATUS_FILTERS:
+        raise ResultsQueryError(f"Unknown status {status!r}, use ok or error")
+
+    per_page = min(max(1, per_page), RESULTS_MAX_PAGE_SIZE)
+    page = max(1, page)
+
+    conn = connect(JOBS_DB, SCHEMA)
+    conn.create_function("count_of", 1, parse_count, deterministic=True)
+    where, params = _where(job["id"], platform, q, status)
+
+    summary = conn.execute(
+        "SELECT COUNT(*) AS matched"
+        + "".join(f", SUM(count_of({_field(metric)})) AS {metric}" for metric in metrics)
+        + f" FROM job_rows WHERE {where}",
+        params
+    ).fetchone()
+    rows = conn.execute(
+        f"SELECT result FROM job_rows WHERE {where} ORDER BY {_order_by(sort, order)} LIMIT ? OFFSET ?",
+        params + [per_page, (page - 1) * per_page]
+    ).fetchall()
+
+    matched = summary["matched"]
+    return {
+        "job_id": job["id"],
+        "platform": platform,
+        "status": job["status"],
+        "page": page,
+        "per_page": per_page,
+        "pages": max(1, -(-matched // per_page)),
+        "matched": matched,
+        "total": job["total"],
+        "done": job["done"],
+        "sort": sort,
+        "order": order,
+        "q": q,
+        "filter": status,
+        "totals": {metric: summary[metric] or 0 for metric in metrics},
+        "rows": [json.loads(row["result"]) for row in rows],
+    }
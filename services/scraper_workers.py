@@ -0,0 +1,493 @@
+"""
+Scraper Workers - a supervised pool of processes that own the browsers, fed
+by a SQLite task queue, so Chromium never runs inside a web worker
+
+gunicorn.conf.py starts the supervisor when SCRAPER_WORKERS is set; it can
+also run on its own (e.g. as a separate container):
+    python -m services.scraper_workers
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import logging
+import functools
+import importlib
+import threading
+import multiprocessing
+
+from services import metrics
+from services.async_browser_pool import ASYNC_MAX_PAGES, ASYNC_MODE
+from services.browser_pool import BROWSER_POOL_SIZE, current_scope, run_in_scope
+from services.resilience import RetryableError, is_retryable
+from services.storage import connect
+
+logger = logging.getLogger(__name__)
+
+SCRAPER_DB = "scraper_tasks.sqlite3"
+
+# Worker processes: 0 scrapes inside the web workers (default), "auto" sizes
+# the pool to the cores and memory available, a number fixes it
+SCRAPER_WORKERS = os.getenv("SCRAPER_WORKERS", "0").strip().lower()
+
+# A worker whose process tree (its browsers included) grows past this many MB is recycled
+SCRAPER_WORKER_MEMORY_MB = float(os.getenv("SCRAPER_WORKER_MEMORY_MB", "700"))
+
+# A worker is also recycled after this many scrapes
+SCRAPER_WORKER_MAX_TASKS = int(os.getenv("SCRAPER_WORKER_MAX_TASKS", "500"))
+
+# Share of the machine's (or container's) memory "auto" may hand to scraper workers
+SCRAPER_MEMORY_FRACTION = float(os.getenv("SCRAPER_MEMORY_FRACTION", "0.6"))
+
+# Scrapes each worker runs at once (one per pooled browser, or per async page)
+SCRAPER_WORKER_THREADS = int(os.getenv("SCRAPER_WORKER_THREADS",
+                                       str(ASYNC_MAX_PAGES if ASYNC_MODE else BROWSER_POOL_SIZE)))
+
+# A scrape running longer than this is presumed hung: its worker is killed and the task retried once
+SCRAPER_TASK_TIMEOUT = float(os.getenv("SCRAPER_TASK_TIMEOUT", "120"))
+
+# How often waiting web workers and idle scraper workers check the queue: first
+# after SCRAPER_POLL_INTERVAL, then twice as long each time up to SCRAPER_POLL_MAX_INTERVAL
+SCRAPER_POLL_INTERVAL = float(os.getenv("SCRAPER_POLL_INTERVAL", "0.05"))
+SCRAPER_POLL_MAX_INTERVAL = max(SCRAPER_POLL_INTERVAL, float(os.getenv("SCRAPER_POLL_MAX_INTERVAL", "0.5")))
+
+# Runs per task: a task whose worker died mid-scrape is queued again until this many
+TASK_ATTEMPTS = 2
+
+# The supervisor counts as gone when its heartbeat is older than this
+SUPERVISOR_STALE_AFTER = 15
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    platform TEXT NOT NULL,
+    target TEXT NOT NULL,
+    args TEXT NOT NULL,
+    scope TEXT,
+    status TEXT NOT NULL,
+    worker INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    retryable INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, created_at);
+CREATE TABLE IF NOT EXISTS workers (
+    pid INTEGER PRIMARY KEY,
+    role TEXT NOT NULL,
+    state TEXT NOT NULL,
+    tasks INTEGER NOT NULL DEFAULT 0,
+    rss_mb REAL,
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL
+);
+"""
+
+# Set in scraper worker processes, where offloaded functions run locally
+_in_scraper_worker = False
+
+
+def _db():
+    return connect(SCRAPER_DB, SCHEMA)
+
+
+def _memory_limit_mb():
+    """The container's cgroup memory limit, or the machine's physical memory."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value.isdigit() and int(value) < 1 << 60:
+                return int(value) / 2 ** 20
+        except OSError:
+            continue
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2 ** 20
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def worker_count(setting=SCRAPER_WORKERS):
+    """Scraper worker processes to run: SCRAPER_WORKERS, with "auto" bounded by cores and memory."""
+    if setting != "auto":
+        return max(0, int(setting or 0))
+    cores = os.cpu_count() or 1
+    memory = _memory_limit_mb()
+    if memory is None:
+        return cores
+    return max(1, min(cores, int(memory * SCRAPER_MEMORY_FRACTION // SCRAPER_WORKER_MEMORY_MB)))
+
+
+ENABLED = worker_count() > 0
+
+
+# --- Web worker side -------------------------------------------------------
+
+def _supervisor_alive():
+    row = _db().execute("SELECT MAX(heartbeat_at) AS beat FROM workers WHERE role = 'supervisor'").fetchone()
+    return row["beat"] is not None and row["beat"] > time.time() - SUPERVISOR_STALE_AFTER
+
+
+def submit(platform, target, args, timeout=SCRAPER_TASK_TIMEOUT):
+    """
+    Queue target(*args) ("module:function") for a scraper worker and wait for
+    its result. A retryable failure in the worker is raised as RetryableError,
+    any other as RuntimeError; a task nobody finished in time raises TimeoutError.
+    """
+    if not _supervisor_alive():
+        raise RuntimeError("Scraper workers are not running (start them with: python -m services.scraper_workers)")
+
+    task_id = uuid.uuid4().hex
+    conn = _db()
+    conn.execute(
+        "INSERT INTO tasks (id, platform, target, args, scope, status, created_at) VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+        (task_id, platform, target, json.dumps(list(args)), current_scope(), time.time())
+    )
+
+    # Queued time plus one full run, and a retry if the first worker died
+    deadline = time.monotonic() + timeout * TASK_ATTEMPTS
+    delay = SCRAPER_POLL_INTERVAL
+    while True:
+        row = conn.execute("SELECT status, result, error, retryable, created_at, started_at FROM tasks WHERE id = ?",
+                           (task_id,)).fetchone()
+        if row["status"] in ("done", "failed"):
+            break
+        if time.monotonic() > deadline:
+            # A task still running is left to the supervisor, which kills its worker if it is hung
+            conn.execute("UPDATE tasks SET status = 'failed', error = 'timed out', finished_at = ?"
+                         " WHERE id = ? AND status = 'queued'", (time.time(), task_id))
+            metrics.scraper_tasks.labels(platform, "timeout").inc()
+            raise TimeoutError(f"Scraper worker did not finish {platform} task within {timeout * TASK_ATTEMPTS:.0f}s")
+        time.sleep(delay)
+        delay = min(delay * 2, SCRAPER_POLL_MAX_INTERVAL)
+
+    conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+    if row["started_at"]:
+        metrics.stage_seconds.labels(platform, "worker_queue").observe(row["started_at"] - row["created_at"])
+    metrics.scraper_tasks.labels(platform, row["status"]).inc()
+    if row["status"] == "failed":
+        raise (RetryableError if row["retryable"] else RuntimeError)(row["error"])
+    return json.loads(row["result"])
+
+
+def offloaded(platform):
+    """
+    Run the decorated function in a scraper worker process when SCRAPER_WORKERS
+    is set (and directly otherwise, or inside the worker). Arguments and the
+    return value must be JSON-serializable.
+    """
+    def decorate(fn):
+        target = f"{fn.__module__}:{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args):
+            if not ENABLED or _in_scraper_worker:
+                return fn(*args)
+            return submit(platform, target, args)
+
+        return wrapper
+
+    return decorate
+
+
+def worker_states():
+    """Supervisor and worker processes with their heartbeat, scrape count and memory, for operations pages."""
+    rows = _db().execute("SELECT pid, role, state, tasks, rss_mb, started_at, heartbeat_at FROM workers"
+                         " ORDER BY role DESC, started_at").fetchall()
+    queued = _db().execute("SELECT COUNT(*) AS n FROM tasks WHERE status = 'queued'").fetchone()["n"]
+    return {"enabled": ENABLED, "queued": queued, "processes": [dict(row) for row in rows]}
+
+
+# --- Scraper worker side ---------------------------------------------------
+
+def _has_queued():
+    """Plain read, so idle workers only take the write lock when there is something to claim."""
+    return _db().execute("SELECT 1 FROM tasks WHERE status = 'queued' LIMIT 1").fetchone() is not None
+
+
+def _claim(pid):
+    """Atomically take the oldest queued task for this worker process."""
+    conn = _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT id, platform, target, args, scope FROM tasks WHERE status = 'queued'"
+                           " ORDER BY created_at LIMIT 1").fetchone()
+        if row is not None:
+            conn.execute("UPDATE tasks SET status = 'running', worker = ?, started_at = ?, attempts = attempts + 1"
+                         " WHERE id = ?", (pid, time.time(), row["id"]))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return row
+
+
+def _resolve(target):
+    module, name = target.split(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def _run_task(task):
+    try:
+        # The worker's browsers reuse contexts only within the submitting batch
+        result = run_in_scope(task["scope"], _resolve(task["target"]), *json.loads(task["args"]))
+        update = ("done", json.dumps(result, default=str), None, None)
+    except Exception as e:
+        update = ("failed", None, str(e) or type(e).__name__, int(is_retryable(e)))
+    _db().execute(
+        "UPDATE tasks SET status = ?, result = ?, error = ?, retryable = ?, finished_at = ?"
+        " WHERE id = ? AND status = 'running'",
+        update + (time.time(), task["id"])
+    )
+
+
+class _Worker:
+    """One scraper worker process: SCRAPER_WORKER_THREADS claim loops sharing its browser pool."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.parent = os.getppid()
+        self.tasks = 0
+        self.draining = threading.Event()
+        self._lock = threading.Lock()
+
+    def _loop(self):
+        # Claiming stops once draining; a scrape already claimed still finishes
+        delay = SCRAPER_POLL_INTERVAL
+        while not self.draining.is_set():
+            task = _claim(self.pid) if _has_queued() else None
+            if task is None:
+                # Idle (or another thread won the claim): back off, but wake at once when drained
+                self.draining.wait(delay)
+                delay = min(delay * 2, SCRAPER_POLL_MAX_INTERVAL)
+                continue
+            delay = SCRAPER_POLL_INTERVAL
+            with self._lock:
+                self.tasks += 1
+                if self.tasks >= SCRAPER_WORKER_MAX_TASKS:
+                    self.draining.set()
+            _run_task(task)
+
+    def _heartbeat(self, state):
+        _db().execute(
+            "INSERT INTO workers (pid, role, state, tasks, started_at, heartbeat_at) VALUES (?, 'worker', ?, ?, ?, ?)"
+            " ON CONFLICT (pid) DO UPDATE SET state = excluded.state, tasks = excluded.tasks,"
+            " heartbeat_at = excluded.heartbeat_at",
+            (self.pid, state, self.tasks, time.time(), time.time())
+        )
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.draining.set())
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        _prewarm()
+
+        threads = [threading.Thread(target=self._loop, name=f"scraper-{i}", daemon=True)
+                   for i in range(max(1, SCRAPER_WORKER_THREADS))]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            if os.getppid() != self.parent:
+                # The supervisor is gone; a new one requeues whatever is left running
+                self.draining.set()
+            self._heartbeat("draining" if self.draining.is_set() else "running")
+            for thread in threads:
+                thread.join(timeout=1)
+        _db().execute("DELETE FROM workers WHERE pid = ?", (self.pid,))
+
+
+def _prewarm():
+    from services.browser_pool import BROWSER_PREWARM
+
+    if not BROWSER_PREWARM:
+        return
+    if ASYNC_MODE:
+        from services.async_browser_pool import get_async_browser_pool
+        get_async_browser_pool().prewarm()
+    else:
+        from services.browser_pool import get_browser_pool
+        get_browser_pool().prewarm()
+
+
+def _worker_main():
+    global _in_scraper_worker
+    _in_scraper_worker = True
+    metrics.configure_logging()
+    _Worker().run()
+
+
+# --- Supervisor ------------------------------------------------------------
+
+def _process_tree_rss_mb(pid):
+    """Resident memory of pid and all its descendants (its Chromium processes), from /proc; None elsewhere."""
+    try:
+        children = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The parent pid follows the parenthesized command name
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+
+        total_kb = 0
+        pending = [pid]
+        while pending:
+            current = pending.pop()
+            pending.extend(children.get(current, []))
+            try:
+                with open(f"/proc/{current}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            total_kb += int(line.split()[1])
+                            break
+            except OSError:
+                continue
+        return total_kb / 1024
+    except OSError:
+        return None
+
+
+class Supervisor:
+    """
+    Keeps worker_count() scraper worker processes running. A worker is
+    drained and replaced when its process tree passes SCRAPER_WORKER_MEMORY_MB
+    or it has run SCRAPER_WORKER_MAX_TASKS scrapes; one stuck on a scrape for
+    SCRAPER_TASK_TIMEOUT is killed. Tasks of a worker that died are queued again.
+    """
+
+    def __init__(self, count=None):
+        self.count = worker_count() if count is None else count
+        self.pid = os.getpid()
+        self.workers = {}
+        self.stopping = False
+        self._context = multiprocessing.get_context("spawn")
+
+    def _spawn(self):
+        process = self._context.Process(target=_worker_main, name="scraper-worker", daemon=False)
+        process.start()
+        self.workers[process.pid] = {"process": process, "draining_since": None, "reason": None}
+        logger.info("scraper worker started pid=%d", process.pid)
+
+    def _drain(self, pid, reason):
+        worker = self.workers[pid]
+        if worker["draining_since"] is None:
+            logger.info("scraper worker recycling pid=%d reason=%s", pid, reason)
+            worker["draining_since"] = time.monotonic()
+            worker["reason"] = reason
+            os.kill(pid, signal.SIGTERM)
+
+    def _reap(self, pid):
+        worker = self.workers.pop(pid)
+        worker["process"].join(timeout=0)
+        # A worker only exits cleanly on its own once it has spent SCRAPER_WORKER_MAX_TASKS
+        reason = worker["reason"] or ("tasks" if worker["process"].exitcode == 0 else "exited")
+        metrics.scraper_recycles.labels(reason).inc()
+
+        conn = _db()
+        now = time.time()
+        # Scrapes the worker never finished go back to the queue, or fail once retried
+        conn.execute("UPDATE tasks SET status = 'queued', worker = NULL WHERE worker = ? AND status = 'running'"
+                     " AND attempts < ?", (pid, TASK_ATTEMPTS))
+        conn.execute("UPDATE tasks SET status = 'failed', error = ?, retryable = 0, finished_at = ?"
+                     " WHERE worker = ? AND status = 'running'",
+                     (f"scraper worker {pid} stopped ({reason})", now, pid))
+        conn.execute("DELETE FROM workers WHERE pid = ?", (pid,))
+        if reason == "exited" and worker["process"].exitcode:
+            logger.warning("scraper worker died pid=%d exitcode=%s", pid, worker["process"].exitcode)
+        else:
+            logger.info("scraper worker stopped pid=%d reason=%s", pid, reason)
+
+    def _check(self, pid):
+        worker = self.workers[pid]
+        conn = _db()
+
+        oldest = conn.execute("SELECT MIN(started_at) AS started FROM tasks WHERE worker = ? AND status = 'running'",
+                              (pid,)).fetchone()["started"]
+        hung = oldest is not None and oldest < time.time() - SCRAPER_TASK_TIMEOUT
+        drained_too_long = (worker["draining_since"] is not None
+                            and time.monotonic() - worker["draining_since"] > SCRAPER_TASK_TIMEOUT)
+        if hung or drained_too_long:
+            logger.warning("scraper worker killed pid=%d reason=%s", pid, "hung" if hung else "drain timeout")
+            worker["reason"] = worker["reason"] if drained_too_long else "hung"
+            worker["process"].kill()
+            return
+
+        rss = _process_tree_rss_mb(pid)
+        if rss is not None:
+            conn.execute("UPDATE workers SET rss_mb = ? WHERE pid = ?", (round(rss, 1), pid))
+            if rss > SCRAPER_WORKER_MEMORY_MB:
+                self._drain(pid, "memory")
+
+    def _heartbeat(self):
+        now = time.time()
+        _db().execute(
+            "INSERT INTO workers (pid, role, state, tasks, started_at, heartbeat_at) VALUES (?, 'supervisor', 'running', 0, ?, ?)"
+            " ON CONFLICT (pid) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+            (self.pid, now, now)
+        )
+
+    def run(self):
+        """Supervise until SIGTERM/SIGINT, then drain every worker and exit."""
+        def stop(signum, frame):
+            self.stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        conn = _db()
+        # Leftovers of a previous supervisor: its workers are gone, their tasks go back to the queue
+        conn.execute("DELETE FROM workers")
+        conn.execute("UPDATE tasks SET status = 'queued', worker = NULL WHERE status = 'running'")
+        logger.info("scraper supervisor started workers=%d threads=%d memory_cap_mb=%.0f",
+                    self.count, SCRAPER_WORKER_THREADS, SCRAPER_WORKER_MEMORY_MB)
+
+        while not self.stopping:
+            self._heartbeat()
+            for pid in list(self.workers):
+                if not self.workers[pid]["process"].is_alive():
+                    self._reap(pid)
+                else:
+                    self._check(pid)
+
+            # Draining workers are replaced once they exit, so a recycle never adds a browser set
+            while len(self.workers) < self.count:
+                self._spawn()
+            metrics.scraper_workers.set(len(self.workers))
+
+            conn.execute("DELETE FROM tasks WHERE status IN ('done', 'failed') AND finished_at < ?",
+                         (time.time() - 60,))
+            time.sleep(1)
+
+        self.shutdown()
+
+    def shutdown(self):
+        for pid in list(self.workers):
+            self._drain(pid, "shutdown")
+        for pid, worker in list(self.workers.items()):
+            worker["process"].join(timeout=SCRAPER_TASK_TIMEOUT)
+            if worker["process"].is_alive():
+                worker["process"].kill()
+                worker["process"].join()
+            self._reap(pid)
+        _db().execute("DELETE FROM workers WHERE pid = ?", (self.pid,))
+
+
+def main():
+    metrics.configure_logging()
+    # Started by hand without SCRAPER_WORKERS: size the pool automatically
+    Supervisor(worker_count() or worker_count("auto")).run()
+    return 0
+
+
+if __name__ == "__main__":
+    # Run the importable module, so spawned workers and the blueprints share its globals
+    from services.scraper_workers import main as run_supervisor
+    sys.exit(run_supervisor())
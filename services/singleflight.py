@@ -0,0 +1,169 @@
+"""
+Single Flight - coalesces concurrent scrapes of the same post, within a worker
+(threads wait on one call) and across workers (a SQLite lease table)
+"""
+import os
+import json
+import time
+import uuid
+import threading
+
+from services import metrics
+from services.storage import connect
+
+SINGLEFLIGHT_DB = "singleflight.sqlite3"
+
+ENABLE_SINGLEFLIGHT = os.getenv("SINGLEFLIGHT", "true").lower() in ("1", "true", "yes")
+
+# A lease not finished within this many seconds is presumed dead and taken over
+LEASE_SECONDS = float(os.getenv("SINGLEFLIGHT_LEASE_SECONDS", "90"))
+
+# How often waiting workers check the lease table: first after POLL_INTERVAL,
+# then twice as long each time up to POLL_MAX_INTERVAL
+POLL_INTERVAL = float(os.getenv("SINGLEFLIGHT_POLL_INTERVAL", "0.2"))
+POLL_MAX_INTERVAL = max(POLL_INTERVAL, float(os.getenv("SINGLEFLIGHT_POLL_MAX_INTERVAL", "1")))
+
+# Finished leases are kept this long so every waiting worker can read the result
+RESULT_RETENTION_SECONDS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    result TEXT,
+    finished_at REAL
+);
+"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+
+def _db():
+    return connect(SINGLEFLIGHT_DB, SCHEMA)
+
+
+def _try_acquire(key, owner, seen_finished):
+    """
+    Take the lease for key if it is free, expired or finished before we
+    started waiting. Returns (acquired, finished_row_or_None).
+    """
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT owner, expires_at, result, finished_at FROM leases WHERE key = ?",
+                           (key,)).fetchone()
+        if row is not None and row["finished_at"] is not None and (row["owner"], row["finished_at"]) != seen_finished:
+            # Finished while we were waiting on it
+            conn.execute("COMMIT")
+            return False, row
+        if row is None or row["finished_at"] is not None or row["expires_at"] < now:
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (key, owner, expires_at, result, finished_at) VALUES (?, ?, ?, NULL, NULL)",
+                (key, owner, now + LEASE_SECONDS)
+            )
+            conn.execute("DELETE FROM leases WHERE finished_at IS NOT NULL AND finished_at < ?",
+                         (now - RESULT_RETENTION_SECONDS,))
+            conn.execute("COMMIT")
+            return True, None
+        conn.execute("COMMIT")
+        return False, None
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _lease_released(key):
+    """Plain read: True once the lease is free, expired or finished, i.e. worth a _try_acquire."""
+    row = _db().execute("SELECT expires_at, finished_at FROM leases WHERE key = ?", (key,)).fetchone()
+    return row is None or row["finished_at"] is not None or row["expires_at"] < time.time()
+
+
+def _finish(key, owner, payload):
+    _db().execute(
+        "UPDATE leases SET result = ?, finished_at = ? WHERE key = ? AND owner = ?",
+        (json.dumps(payload, default=str), time.time(), key, owner)
+    )
+
+
+def _unpack(payload):
+    if "raised" in payload:
+        raise RuntimeError(payload["raised"])
+    return payload["value"]
+
+
+def _run_leased(key, fn, platform):
+    """Run fn once across every worker sharing DATA_DIR, or wait for whoever is running it."""
+    owner = uuid.uuid4().hex
+    row = _db().execute("SELECT owner, finished_at FROM leases WHERE key = ?", (key,)).fetchone()
+    # A lease that had already finished when we arrived belongs to an earlier request
+    seen_finished = (row["owner"], row["finished_at"]) if row is not None and row["finished_at"] else None
+
+    delay = POLL_INTERVAL
+    while True:
+        acquired, finished = _try_acquire(key, owner, seen_finished)
+        if acquired:
+            break
+        if finished is not None:
+            metrics.singleflight_shared.labels(platform, "cross_worker").inc()
+            return _unpack(json.loads(finished["result"]))
+        # Wait with plain reads so waiters don't queue for the write lock every poll
+        while True:
+            time.sleep(delay)
+            delay = min(delay * 2, POLL_MAX_INTERVAL)
+            if _lease_released(key):
+                break
+
+    try:
+        value = fn()
+    except Exception as e:
+        _finish(key, owner, {"raised": str(e)})
+        raise
+    _finish(key, owner, {"value": value})
+    return value
+
+
+def do(key, fn, platform="unknown"):
+    """
+    Return fn(), making sure concurrent callers with the same key share one
+    call: threads in this process wait for the first caller, and other
+    worker processes wait on its lease. Every waiter gets the same result,
+    errors included (a raised exception is re-raised as RuntimeError in
+    other workers).
+    """
+    if not ENABLE_SINGLEFLIGHT:
+        return fn()
+
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        metrics.singleflight_shared.labels(platform, "local").inc()
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = _run_leased(key, fn, platform)
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            _calls.pop(key, None)
+        call.done.set()
+    return call.result
@@ -0,0 +1,43 @@
+"""
+Storage - local data directory and SQLite connections shared by the services
+"""
+import os
+import sqlite3
+import threading
+
+# Directory for job, cache and history databases (must be shared by all workers)
+DATA_DIR = os.getenv(
+    "APP_DATA_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+)
+
+_local = threading.local()
+
+
+def data_path(*parts):
+    """Absolute path inside DATA_DIR, creating the directory on first use."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, *parts)
+
+
+def connect(name, schema=None):
+    """
+    Return this thread's connection to the SQLite database `name` in DATA_DIR.
+    Connections run in autocommit mode with WAL so several gunicorn workers
+    can read while one writes. `schema` (SQL script) runs once per connection.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+
+    conn = connections.get(name)
+    if conn is None:
+        conn = sqlite3.connect(data_path(name), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if schema:
+            conn.executescript(schema)
+        connections[name] = conn
+    return conn
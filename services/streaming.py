@@ -0,0 +1,46 @@
+"""
+Streaming - chunked rendering of results pages while a batch is still running
+"""
+import time
+
+from flask import Response, stream_template
+
+from services.jobs import BATCH_DEADLINE_SECONDS, CheckpointedRun, create_stream, get_handler, resume_stream
+from services.results import RESULTS_PAGE_SIZE
+
+
+def stream_results(template, results, **context):
+    """
+    Render `template` with `results` as a lazy iterator, flushing each table
+    row to the browser as soon as it has been scraped. Templates render only
+    the first page_rows rows and report progress for the rest.
+    """
+    response = Response(stream_template(template, results=results, **context), mimetype="text/html")
+    # Ask reverse proxies (nginx, Azure front end) not to buffer the chunks
+    response.headers["X-Accel-Buffering"] = "no"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _stream_run(platform, job_id, rows):
+    run = CheckpointedRun(job_id, rows, get_handler(platform),
+                          deadline=time.monotonic() + BATCH_DEADLINE_SECONDS)
+    return stream_results(f"{platform}/results.html", run, run=run, page_rows=RESULTS_PAGE_SIZE)
+
+
+def stream_batch(platform, rows):
+    """
+    Stream a platform's results page for an upload within BATCH_DEADLINE_SECONDS.
+    Rows are checkpointed under a job whose ID is shown as the resume token;
+    when the budget runs out the page ends with a link to resume the rest.
+    """
+    return _stream_run(platform, create_stream(platform, rows), rows)
+
+
+def resume_batch(job_id):
+    """Continue a partial streamed upload, replaying its finished rows. None if not resumable."""
+    found = resume_stream(job_id)
+    if found is None:
+        return None
+    platform, rows = found
+    return _stream_run(platform, job_id, rows)
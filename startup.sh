@@ -6,4 +6,4 @@ python -m playwright install --with-deps chromium
 
 # Start Gunicorn
 echo "Starting Gunicorn..."
-gunicorn --bind=0.0.0.0 --timeout 600 --workers=2 app:app
\ No newline at end of file
+gunicorn --config gunicorn.conf.py app:app
\ No newline at end of file
@@ -0,0 +1,47 @@
+"""
+Retry and circuit breaker accounting in services.resilience.guarded
+"""
+import pytest
+
+from services import resilience
+
+
+class TimeoutError(Exception):
+    """Stands in for playwright's TimeoutError, which is matched by name."""
+
+
+CONTENT_WAIT = ('Page.wait_for_selector: Timeout 5000ms exceeded.\n'
+                'Call log:\n  - waiting for locator("article") to be attached')
+NAVIGATION = 'Page.goto: Timeout 15000ms exceeded.\nCall log:\n  - navigating to "https://x.com/a/status/1"'
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(resilience, "RETRY_ATTEMPTS", 3)
+    monkeypatch.setattr(resilience, "_backoff", lambda attempt: 0)
+    monkeypatch.setattr(resilience, "_limiters", {})
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setenv("TEST_RATE_LIMIT", "0")
+
+
+def failing(message, calls):
+    def fn():
+        calls.append(1)
+        raise TimeoutError(message)
+    return fn
+
+
+def test_content_wait_timeout_is_raised_after_one_attempt():
+    calls = []
+    with pytest.raises(TimeoutError):
+        resilience.guarded("test", failing(CONTENT_WAIT, calls))
+    assert len(calls) == 1
+    assert resilience.get_breaker("test").failures == 0
+
+
+def test_navigation_timeout_is_retried_and_counted():
+    calls = []
+    with pytest.raises(TimeoutError):
+        resilience.guarded("test", failing(NAVIGATION, calls))
+    assert len(calls) == 3
+    assert resilience.get_breaker("test").failures == 1